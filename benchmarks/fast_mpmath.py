@@ -0,0 +1,91 @@
+"""Compare the mpmath functions computed with arbitrary precision numbers (mpmath.mp) and with machine floats (mpmath.fp).
+
+For each function, print the time by point of both versions, the speedup, the largest error of the fast version (relative above 1, absolute below,
+as for the vectorized versions) and the number of points where only one of them is nan.
+The leading parameters are fixed, and the last one goes through the given range.
+
+    python -m benchmarks.fast_mpmath [--points 200] [--start -10] [--stop 10] [--all] [functions ...]
+"""
+
+import argparse
+import math
+import time
+from typing import Callable, Optional
+
+import mpmath
+import numpy as np
+
+from chplot.functions.names import FAST_MPMATH_FUNCTION_NAMES, MPMATH_FUNCTION_NAMES
+import chplot.functions.definitions.fast_mpmath_functions as fast_mpmath_functions
+import chplot.functions.definitions.mpmath_functions as mpmath_functions
+
+
+# Leading parameters of the functions of several variables
+PARAMETERS = (1.5, 0.5, 2.0, 2.5, 1.25)
+
+
+def _get_float(func: Callable[..., float], parameters: tuple[float, ...]) -> float:
+    """Same conversion as the computation of the expressions: nan on errors, complex and infinite results."""
+    try:
+        value = float(func(*parameters))
+    except Exception:
+        return math.nan
+    return value if not math.isinf(value) else math.nan
+
+
+def _time_function(func: Callable[..., float], points: list[tuple[float, ...]]) -> tuple[np.ndarray, float]:
+    start = time.perf_counter()
+    values = np.array([_get_float(func, parameters) for parameters in points])
+    return (values, (time.perf_counter() - start) / len(points))
+
+
+def _get_fast_function(function_name: str) -> Optional[Callable[..., float]]:
+    if hasattr(fast_mpmath_functions, function_name):
+        return getattr(fast_mpmath_functions, function_name)
+    return getattr(mpmath.fp, function_name, None)
+
+
+def benchmark(name: str, arg_count: int, function_name: str, xs: np.ndarray) -> Optional[str]:
+    fast_function = _get_fast_function(function_name)
+    if fast_function is None:
+        return None
+
+    points = [(*PARAMETERS[:arg_count - 1], float(x)) for x in xs]
+    exact_values, exact_time = _time_function(getattr(mpmath_functions, function_name), points)
+    fast_values, fast_time = _time_function(fast_function, points)
+
+    both = ~np.isnan(exact_values) & ~np.isnan(fast_values)
+    with np.errstate(all='ignore'):
+        errors = np.abs(fast_values[both] - exact_values[both]) / np.maximum(1, np.abs(exact_values[both]))
+    error = errors.max() if errors.size else math.nan
+    nan_mismatches = np.count_nonzero(np.isnan(exact_values) != np.isnan(fast_values))
+
+    return f'{name:12} {exact_time * 1e6:10.1f} {fast_time * 1e6:10.1f} {exact_time / fast_time:8.1f} {error:10.1e} {nan_mismatches:8}'
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('functions', nargs='*', help='Names of the functions to benchmark. Defaults to the ones computed with mpmath.fp by chplot.')
+    parser.add_argument('--points', type=int, default=200, help='Number of points by function')
+    parser.add_argument('--start', type=float, default=-10, help='Start of the range of the last parameter')
+    parser.add_argument('--stop', type=float, default=10, help='End of the range of the last parameter')
+    parser.add_argument('--all', action='store_true', help='Benchmark every mpmath function having a mpmath.fp version')
+    args = parser.parse_args()
+
+    all_names = MPMATH_FUNCTION_NAMES if args.all or args.functions else FAST_MPMATH_FUNCTION_NAMES
+    xs = np.linspace(args.start, args.stop, args.points)
+
+    print(f'{"function":12} {"mp (us)":>10} {"fp (us)":>10} {"speedup":>8} {"max error":>10} {"nan diff":>8}')
+    seen = set()
+    for name, arg_count, function_name in all_names:
+        function_name = function_name or name
+        if function_name in seen or (args.functions and name not in args.functions):
+            continue
+        seen.add(function_name)
+
+        line = benchmark(name, arg_count, function_name, xs)
+        print(line if line is not None else f'{name:12} no mpmath.fp version')
+
+
+if __name__ == '__main__':
+    main()
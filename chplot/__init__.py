@@ -10,6 +10,13 @@ parameters = chplot.PlotParameters()
 chplot.plot(parameters)
 ```
 
+Expressions can also be computed without plotting anything:
+
+```
+f = chplot.compile('sqrt(1-x^2)*sin(x)')
+f(0.5), f(numpy.linspace(-1, 1, 101))
+```
+
 Check all the documentation on the github repo (https://github.com/charon25/Chplot).
 
 """
@@ -20,7 +27,8 @@ import warnings
 
 import numpy as np
 
-from chplot.rpn import compute_rpn_list, compute_rpn_unsafe, get_rpn_errors
+from chplot.functions.environment import Environment
+from chplot.rpn import compile_expression as compile, CompiledExpression, compute_rpn_list, compute_rpn_unsafe, get_rpn_errors
 from chplot.plot import plot, plottable
 from chplot.plot.plot_parameters import PlotParameters, set_default_values
 
@@ -63,6 +63,17 @@ def read_parameters() -> argparse.Namespace:
     parser.add_argument('-d', '--save-data', dest='save_data_path', metavar='DATA_FILE', help='Saves the graph data (x and y values) at the specified path in CSV format.')
     parser.add_argument('-p', '--python-files', nargs='+', dest='python_files', metavar=('PYTHON_FILE', 'PYTHON_FILE'), help='Adds functions contained in Python files. See the Additional Python function format section of the documentation for more details.')
 
+    parser.add_argument('-j', '--jobs', type=positive_integer, dest='jobs', metavar='JOBS', help='Number of processes computing the expressions with functions not working on whole arrays (such as most mpmath functions and the functions of python files). Defaults to 1.')
+    parser.add_argument('--engine', choices=('auto', 'scalar', 'vectorized', 'parallel'), dest='engine', help='How the expressions are computed. By default (auto), the fastest way is chosen for each expression, depending on its functions and the number of points.')
+    parser.add_argument('--surrogate', type=positive_float, dest='surrogate_tolerance', metavar='TOL', help='Approximate the sub-expressions using mpmath functions by piecewise Chebyshev interpolants with this tolerance, much faster to compute on a lot of points. They are computed exactly where the tolerance cannot be reached. Defaults to computing them exactly.')
+    parser.add_argument('--exact', action='store_true', dest='exact_mpmath', help='Compute the mpmath functions with mpmath at full precision on every point, instead of their double precision versions working on whole arrays (such as sec, legendre or harmonic) or computed with machine floats (such as siegelz or primezeta) when there are some. Defaults to False.')
+    parser.add_argument('--block-size', type=positive_integer, dest='block_size', metavar='POINTS', help='Number of points computed at once. Bigger blocks are faster, but use more memory. Defaults to 8192.')
+
+    parser.add_argument('--no-cache', action='store_false', dest='use_cache', help='Disable the cache of the computed expressions. By default, the values of every expression are saved, and are not computed again if nothing changed.')
+    parser.add_argument('--clear-cache', action='store_true', dest='clear_cache', help='Remove every file of the cache before doing anything.')
+    parser.add_argument('--cache-dir', dest='cache_dir', metavar='CACHE_DIR', help='Directory where the computed values are saved. Defaults to ~/.cache/chplot.')
+    parser.add_argument('--cache-size', type=positive_float, dest='cache_max_size', metavar='SIZE', help='Maximum size of the cache directory in MiB. The least recently used values are removed first. Defaults to 256.')
+
     parser.add_argument('--version', action='store_true', dest='version', help='Only prints the version.')
 
     return parser.parse_args()
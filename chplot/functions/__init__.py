@@ -1,12 +1,19 @@
 from operator import add, mul, neg, pos, sub, truediv
+from typing import Callable
+
+import numpy as np
 
 from chplot.functions.constants import CONSTANTS_FUNCTIONS
+from chplot.functions.environment import Environment
+import chplot.functions.definitions.numpy_functions as numpy_functions
 from chplot.functions.names import MATH_FUNCTION_NAMES, MPMATH_FUNCTION_NAMES, OTHER_FUNCTION_NAMES, PROBABILITY_FUNCTION_NAMES, SCIPY_SPECIAL_FUNCTION_NAMES
-from chplot.functions.utils import FunctionDict, contains_function, _get_functions_from_module
+from chplot.functions.names import MEMOIZED_FUNCTION_NAMES, NUMPY_MATH_FUNCTION_NAMES, SCIPY_MATH_FUNCTION_NAMES, VECTORIZED_MPMATH_FUNCTION_NAMES
+from chplot.functions.names import FAST_MPMATH_FUNCTION_NAMES, VECTORIZED_OTHER_FUNCTION_NAMES, VECTORIZED_PROBABILITY_FUNCTION_NAMES
+from chplot.functions.utils import FunctionDict, contains_function, _get_functions_from_module, memoize
 
 
 
-# This global variable can and will be modified to add to functions
+# Only extended by load_necessary_functions, with the functions of the expressions to compute
 FUNCTIONS: FunctionDict = {
     # Base operations
     '+': (2, add),
@@ -25,6 +32,39 @@ FUNCTIONS: FunctionDict = {
 }
 
 
+# Functions of FUNCTIONS whose results are memoized, to report how many computations were saved
+MEMOIZED_FUNCTIONS: dict[str, Callable[..., float]] = {}
+
+
+# Versions of some mpmath functions of FUNCTIONS computed with machine floats, used instead of them unless the mpmath functions must be exact
+FAST_MPMATH_FUNCTIONS: FunctionDict = {}
+
+# Functions of FAST_MPMATH_FUNCTIONS whose results are memoized
+MEMOIZED_FAST_MPMATH_FUNCTIONS: dict[str, Callable[..., float]] = {}
+
+
+# Versions of the functions above working on whole numpy arrays
+# A function missing from this dict is applied point by point to arrays
+VECTORIZED_FUNCTIONS: FunctionDict = {
+    # Base operations
+    '+': (2, np.add),
+    '+u': (1, np.positive),
+    '-': (2, np.subtract),
+    '-u': (1, np.negative),
+    '*': (2, np.multiply),
+    '/': (2, np.true_divide),
+    '^': (2, np.power),
+    # Built-ins
+    'abs': (1, np.abs),
+    'min': (2, np.minimum), 'min3': (3, numpy_functions._min3), 'min4': (4, numpy_functions._min4),
+    'max': (2, np.maximum), 'max3': (3, numpy_functions._max3), 'max4': (4, numpy_functions._max4),
+}
+
+
+# The library functions only: the constants and python functions given by the user are added in other layers of it, never in the dicts above
+DEFAULT_ENVIRONMENT = Environment(FUNCTIONS, VECTORIZED_FUNCTIONS, MEMOIZED_FUNCTIONS, fast_functions=FAST_MPMATH_FUNCTIONS)
+
+
 def load_necessary_functions(rpns: list[str]) -> None:
     tokens = set()
     for rpn in rpns:
@@ -35,6 +75,11 @@ def load_necessary_functions(rpns: list[str]) -> None:
     if contains_function(MATH_FUNCTION_NAMES, tokens):
         import chplot.functions.definitions.math_functions as math_functions
         FUNCTIONS.update(_get_functions_from_module(math_functions, MATH_FUNCTION_NAMES))
+        VECTORIZED_FUNCTIONS.update(_get_functions_from_module(numpy_functions, NUMPY_MATH_FUNCTION_NAMES))
+
+    if contains_function(SCIPY_MATH_FUNCTION_NAMES, tokens):
+        import chplot.functions.definitions.scipy_special_functions as scipy_special_functions
+        VECTORIZED_FUNCTIONS.update(_get_functions_from_module(scipy_special_functions, SCIPY_MATH_FUNCTION_NAMES))
 
     if contains_function(SCIPY_SPECIAL_FUNCTION_NAMES, tokens):
         import chplot.functions.definitions.scipy_special_functions as scipy_special_functions
@@ -43,11 +88,39 @@ def load_necessary_functions(rpns: list[str]) -> None:
     if contains_function(MPMATH_FUNCTION_NAMES, tokens):
         import chplot.functions.definitions.mpmath_functions as mpmath_functions
         FUNCTIONS.update(_get_functions_from_module(mpmath_functions, MPMATH_FUNCTION_NAMES))
+        import chplot.functions.definitions.fast_mpmath_functions as fast_mpmath_functions
+        FAST_MPMATH_FUNCTIONS.update(_get_functions_from_module(fast_mpmath_functions, FAST_MPMATH_FUNCTION_NAMES))
+
+    if contains_function(VECTORIZED_MPMATH_FUNCTION_NAMES, tokens):
+        import chplot.functions.definitions.vectorized_mpmath_functions as vectorized_mpmath_functions
+        VECTORIZED_FUNCTIONS.update(_get_functions_from_module(vectorized_mpmath_functions, VECTORIZED_MPMATH_FUNCTION_NAMES))
 
     if contains_function(PROBABILITY_FUNCTION_NAMES, tokens):
         import chplot.functions.definitions.probability_functions as probability_functions
         FUNCTIONS.update(_get_functions_from_module(probability_functions, PROBABILITY_FUNCTION_NAMES))
+        import chplot.functions.definitions.vectorized_probability_functions as vectorized_probability_functions
+        VECTORIZED_FUNCTIONS.update(_get_functions_from_module(vectorized_probability_functions, VECTORIZED_PROBABILITY_FUNCTION_NAMES))
 
     if contains_function(OTHER_FUNCTION_NAMES, tokens):
         import chplot.functions.definitions.other_functions as other_functions
         FUNCTIONS.update(_get_functions_from_module(other_functions, OTHER_FUNCTION_NAMES))
+        import chplot.functions.definitions.vectorized_other_functions as vectorized_other_functions
+        VECTORIZED_FUNCTIONS.update(_get_functions_from_module(vectorized_other_functions, VECTORIZED_OTHER_FUNCTION_NAMES))
+
+    _memoize_expensive_functions(FUNCTIONS, MEMOIZED_FUNCTIONS)
+    _memoize_expensive_functions(FAST_MPMATH_FUNCTIONS, MEMOIZED_FAST_MPMATH_FUNCTIONS)
+
+
+def _memoize_expensive_functions(functions: FunctionDict, memoized_functions: dict[str, Callable[..., float]]) -> None:
+    for name in MEMOIZED_FUNCTION_NAMES:
+        if name not in functions:
+            continue
+
+        param_count, func = functions[name]
+        # The function may have been loaded again, so the existing memoized version is kept with its results
+        if name in memoized_functions and func in (memoized_functions[name], memoized_functions[name].__wrapped__):
+            functions[name] = (param_count, memoized_functions[name])
+            continue
+
+        memoized_functions[name] = memoize(func)
+        functions[name] = (param_count, memoized_functions[name])
@@ -0,0 +1,65 @@
+import cmath
+from functools import partial
+from typing import Callable
+
+from mpmath import fp, mp
+
+
+# Versions of some mpmath functions computed with machine floats by mpmath.fp, instead of arbitrary precision numbers
+# They are 4 to 100 times faster, and within a relative error of 1e-12 of mpmath (absolute near their zeros), as measured by benchmarks/fast_mpmath.py
+# Where the machine floats overflow or fail (e.g. superfac near the largest float, or Li(0)), the mpmath function is used instead
+# The other mpmath functions lose too much precision with floats (e.g. coulombf, lommels1 or hyp1f2 for large arguments, legenp for negative degrees),
+# overflow (e.g. lerchphi) or fail (e.g. ellipf outside of [-pi/2, pi/2])
+
+
+def _with_fallback(fast_func: Callable[..., complex], exact_func: Callable[..., complex]) -> Callable[..., complex]:
+    """Return the fast function, computed again with the exact one when its result is not finite or it raises an exception."""
+    def func(*parameters: float) -> complex:
+        try:
+            value = fast_func(*parameters)
+        except Exception:
+            return exact_func(*parameters)
+        return value if cmath.isfinite(value) else exact_func(*parameters)
+
+    return func
+
+
+def _fast(name: str) -> Callable[..., complex]:
+    return _with_fallback(getattr(fp, name), getattr(mp, name))
+
+
+sec = _fast('sec')
+csc = _fast('csc')
+cot = _fast('cot')
+asec = _fast('asec')
+acsc = _fast('acsc')
+acot = _fast('acot')
+cospi = _fast('cospi')
+sinc = _fast('sinc')
+sech = _fast('sech')
+csch = _fast('csch')
+coth = _fast('coth')
+asech = _fast('asech')
+acsch = _fast('acsch')
+acoth = _fast('acoth')
+
+fac2 = _fast('fac2')
+superfac = _fast('superfac')
+barnesg = _fast('barnesg')
+harmonic = _fast('harmonic')
+
+ei = _fast('ei')
+li = _fast('li')
+
+_Li = _with_fallback(partial(fp.li, offset=True), partial(mp.li, offset=True))
+
+coulombc = _fast('coulombc')
+
+altzeta = _fast('altzeta')
+siegelz = _fast('siegelz')
+siegeltheta = _fast('siegeltheta')
+polylog = _fast('polylog')
+clsin = _fast('clsin')
+clcos = _fast('clcos')
+primezeta = _fast('primezeta')
+riemannr = _fast('riemannr')
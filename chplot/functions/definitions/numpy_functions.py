@@ -0,0 +1,17 @@
+from numpy import *
+
+
+def _dist(x1: ndarray, y1: ndarray, x2: ndarray, y2: ndarray) -> ndarray:
+    return hypot(x2 - x1, y2 - y1)
+
+def _min3(a: ndarray, b: ndarray, c: ndarray) -> ndarray:
+    return minimum(minimum(a, b), c)
+
+def _min4(a: ndarray, b: ndarray, c: ndarray, d: ndarray) -> ndarray:
+    return minimum(minimum(a, b), minimum(c, d))
+
+def _max3(a: ndarray, b: ndarray, c: ndarray) -> ndarray:
+    return maximum(maximum(a, b), c)
+
+def _max4(a: ndarray, b: ndarray, c: ndarray, d: ndarray) -> ndarray:
+    return maximum(maximum(a, b), maximum(c, d))
@@ -0,0 +1,140 @@
+import math
+from typing import Callable, Union
+
+import mpmath
+import numpy as np
+from numpy import ndarray
+from scipy.special import eval_chebyt, eval_chebyu, eval_gegenbauer, eval_genlaguerre, eval_hermite, eval_jacobi, eval_legendre, expi, psi
+
+
+# Double precision versions of some mpmath functions, working on whole numpy arrays
+# They are within a relative error of 1e-12 of mpmath (absolute near their zeros), see the README for the exceptions
+
+Value = Union[float, ndarray]
+
+EULER_GAMMA = 0.57721566490153286061
+GOLDEN_RATIO = (1 + math.sqrt(5)) / 2
+# sqrt(5) = GOLDEN_RATIO^FIBONACCI_SHIFT, so the division is done in the exponent and F(1476) does not overflow
+FIBONACCI_SHIFT = math.log(math.sqrt(5)) / math.log(GOLDEN_RATIO)
+# Above this absolute value, the Fibonacci numbers overflow
+MAX_FIBONACCI_INDEX = 1476
+
+
+def _get_integer_degrees(n: Value) -> Union[int, ndarray, None]:
+    """Return the degrees as integers if they all are, so scipy uses the recurrences of the polynomials instead of hypergeometric functions, None otherwise."""
+    n = np.asarray(n)
+    if not np.all(np.isfinite(n)) or not np.all(n == np.round(n)):
+        return None
+    return n.astype(np.int64)
+
+
+def _get_mpmath_ufunc(func: Callable[..., float], param_count: int) -> Callable[..., ndarray]:
+    def safe_func(*parameters: float) -> float:
+        try:
+            return float(func(*parameters))
+        except Exception:
+            return math.nan
+
+    ufunc = np.frompyfunc(safe_func, param_count, 1)
+    return lambda *parameters: np.asarray(ufunc(*parameters), dtype=float)
+
+
+_mpmath_hermite = _get_mpmath_ufunc(mpmath.hermite, 2)
+
+
+def sec(x: ndarray) -> ndarray:
+    return 1 / np.cos(x)
+
+def csc(x: ndarray) -> ndarray:
+    return 1 / np.sin(x)
+
+def cot(x: ndarray) -> ndarray:
+    # Not 1 / tan(x), which is not 0 at pi/2
+    return np.cos(x) / np.sin(x)
+
+def asec(x: ndarray) -> ndarray:
+    return np.arccos(1 / x)
+
+def acsc(x: ndarray) -> ndarray:
+    return np.arcsin(1 / x)
+
+def acot(x: ndarray) -> ndarray:
+    return np.arctan(1 / x)
+
+
+def sech(x: ndarray) -> ndarray:
+    return 1 / np.cosh(x)
+
+def csch(x: ndarray) -> ndarray:
+    return 1 / np.sinh(x)
+
+def coth(x: ndarray) -> ndarray:
+    return 1 / np.tanh(x)
+
+def asech(x: ndarray) -> ndarray:
+    return np.arccosh(1 / x)
+
+def acsch(x: ndarray) -> ndarray:
+    return np.arcsinh(1 / x)
+
+def acoth(x: ndarray) -> ndarray:
+    return np.arctanh(1 / x)
+
+
+def sinc(x: ndarray) -> ndarray:
+    # Unnormalized, unlike numpy.sinc
+    x = np.asarray(x, dtype=float)
+    return np.where(x == 0, 1.0, np.sin(x) / np.where(x == 0, 1.0, x))
+
+
+def ei(x: ndarray) -> ndarray:
+    return expi(x)
+
+
+def harmonic(x: ndarray) -> ndarray:
+    return psi(np.asarray(x, dtype=float) + 1) + EULER_GAMMA
+
+
+def _cospi(x: ndarray) -> ndarray:
+    """cos(pi x), exactly 0 for the half-integers."""
+    remainder = np.fmod(np.abs(x), 2)
+    return np.where((remainder == 0.5) | (remainder == 1.5), 0.0, np.cos(np.pi * remainder))
+
+
+def fib(x: ndarray) -> ndarray:
+    """Binet's formula, extended to the real numbers as mpmath does. The results are rounded for the integers, where they are exact up to F(78).
+    For the negative non-integers, it oscillates with an amplitude growing like GOLDEN_RATIO^-x, and the error is relative to this amplitude."""
+    x = np.asarray(x, dtype=float)
+    values = GOLDEN_RATIO ** (x - FIBONACCI_SHIFT) - _cospi(x) * GOLDEN_RATIO ** (-x - FIBONACCI_SHIFT)
+    is_integer = (x == np.round(x)) & (np.abs(x) <= MAX_FIBONACCI_INDEX)
+    return np.where(is_integer, np.round(values), values)
+
+
+def legendre(n: Value, x: Value) -> ndarray:
+    degrees = _get_integer_degrees(n)
+    return eval_legendre(degrees if degrees is not None else n, x)
+
+def chebyt(n: Value, x: Value) -> ndarray:
+    degrees = _get_integer_degrees(n)
+    return eval_chebyt(degrees if degrees is not None else n, x)
+
+def chebyu(n: Value, x: Value) -> ndarray:
+    degrees = _get_integer_degrees(n)
+    return eval_chebyu(degrees if degrees is not None else n, x)
+
+def hermite(n: Value, x: Value) -> ndarray:
+    degrees = _get_integer_degrees(n)
+    # Scipy only has the positive integer degrees
+    return eval_hermite(degrees, x) if degrees is not None and np.all(degrees >= 0) else _mpmath_hermite(n, x)
+
+def laguerre(n: Value, a: Value, x: Value) -> ndarray:
+    degrees = _get_integer_degrees(n)
+    return eval_genlaguerre(degrees if degrees is not None else n, a, x)
+
+def jacobi(n: Value, a: Value, b: Value, x: Value) -> ndarray:
+    degrees = _get_integer_degrees(n)
+    return eval_jacobi(degrees if degrees is not None else n, a, b, x)
+
+def gegenbauer(n: Value, a: Value, x: Value) -> ndarray:
+    degrees = _get_integer_degrees(n)
+    return eval_gegenbauer(degrees if degrees is not None else n, a, x)
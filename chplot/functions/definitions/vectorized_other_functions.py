@@ -0,0 +1,49 @@
+import numpy as np
+from numpy import ndarray
+
+
+# Versions of the functions of other_functions working on whole numpy arrays, with the same values
+# The conditional functions (if, in, ...) are not there, as only their chosen branch is computed
+
+
+def relu(x: ndarray) -> ndarray:
+    return np.where(x > 0, x, 0.0)
+
+def leaky_relu(x: ndarray, a: ndarray) -> ndarray:
+    return np.where(x > 0, x, a * x)
+
+def sigmoid(x: ndarray) -> ndarray:
+    with np.errstate(over='ignore'):
+        exponential = np.exp(-x)
+    # Nan where exp(-x) overflows, as math.exp raises an OverflowError in the scalar version (but not for -inf)
+    return np.where(np.isinf(exponential) & np.isfinite(x), np.nan, 1 / (1 + exponential))
+
+def sign(x: ndarray) -> ndarray:
+    return np.sign(x)
+
+def lerp(x: ndarray, x_min: ndarray, x_max: ndarray, y_min: ndarray, y_max: ndarray) -> ndarray:
+    return y_min + ((x - x_min) / (x_max - x_min)) * (y_max - y_min)
+
+def lerpt(t: ndarray, _min: ndarray, _max: ndarray) -> ndarray:
+    return _max + t * (_max - _min)
+
+def heaviside(x: ndarray) -> ndarray:
+    return np.heaviside(x, 0.5)
+
+def rect(x: ndarray) -> ndarray:
+    return np.where((x < -0.5) | (x > 0.5), 0.0, 1.0)
+
+def triangle(x: ndarray) -> ndarray:
+    return np.where((x < -1) | (x > 1), 0.0, 1 - np.abs(x))
+
+def sawtooth(x: ndarray) -> ndarray:
+    # numpy.mod has the sign of the divisor, as the % operator
+    return 2 * np.mod(x - 1/2, 1) - 1
+
+def squarewave(x: ndarray) -> ndarray:
+    m = np.mod(x, 1)
+    return np.select([(m == 0) | (m == 0.5), m < 0.5], [0.5, 1.0], 0.0)
+
+def trianglewave(x: ndarray) -> ndarray:
+    m = np.mod(x, 1)
+    return np.select([m < 0.25, m < 0.75], [4 * m, 2 - 4 * m], 4 * m - 4)
@@ -0,0 +1,89 @@
+import numpy as np
+from numpy import ndarray
+import scipy.stats
+from scipy.special import erf
+
+
+# Versions of the functions of probability_functions working on whole numpy arrays, with the same values
+
+# sqrt(2*pi)
+SQRT_2_PI = 2.5066282746310002
+SQRT_2 = 1.4142135623730951
+
+
+def norm_pdf(x: ndarray, mu: ndarray, sigma: ndarray) -> ndarray:
+    return np.exp(-0.5 * ((x - mu) / sigma)**2) / (sigma * SQRT_2_PI)
+
+def unit_norm_pdf(x: ndarray) -> ndarray:
+    return np.exp(-0.5 * x * x) / SQRT_2_PI
+
+def norm_cdf(x: ndarray, mu: ndarray, sigma: ndarray) -> ndarray:
+    return 0.5 * (1 + erf((x - mu) / (sigma * SQRT_2)))
+
+def unit_norm_cdf(x: ndarray) -> ndarray:
+    return 0.5 * (1 + erf(x / SQRT_2))
+
+
+def triangle_pdf(x: ndarray, a: ndarray, b: ndarray, c: ndarray) -> ndarray:
+    return np.select(
+        [(x < a) | (x > b), x <= c],
+        [0.0, 2 * (x - a) / ((b - a) * (c - a))],
+        2 * (b - x) / ((b - a) * (b - c))
+    )
+
+def triangle_cdf(x: ndarray, a: ndarray, b: ndarray, c: ndarray) -> ndarray:
+    return np.select(
+        [x < a, x <= c, x <= b],
+        [0.0, ((x - a) ** 2) / ((b - a) * (c - a)), 1 - ((b - x) ** 2) / ((b - a) * (b - c))],
+        1.0
+    )
+
+
+def uniform_pdf(x: ndarray, a: ndarray, b: ndarray) -> ndarray:
+    return np.where((a <= x) & (x <= b), 1 / (b - a), 0.0)
+
+def uniform_cdf(x: ndarray, a: ndarray, b: ndarray) -> ndarray:
+    return np.select([(a <= x) & (x <= b), x < a], [(x - a) / (b - a), 0.0], 1.0)
+
+
+def expon_pdf(x: ndarray, _lambda: ndarray) -> ndarray:
+    return np.where(x >= 0, _lambda * np.exp(-_lambda * x), 0.0)
+
+def expon_cdf(x: ndarray, _lambda: ndarray) -> ndarray:
+    return np.where(x >= 0, 1 - np.exp(-_lambda * x), 0.0)
+
+
+def cauchy_pdf(x: ndarray, x0: ndarray, gamma: ndarray) -> ndarray:
+    return 1 / (np.pi * gamma * (1 + ((x - x0) / gamma) ** 2))
+
+def cauchy_cdf(x: ndarray, x0: ndarray, gamma: ndarray) -> ndarray:
+    return 0.5 + np.arctan((x - x0) / gamma) / np.pi
+
+
+# The distributions of scipy.stats already work on arrays, they are only called once for all the points
+def student_pdf(x: ndarray, nu: ndarray) -> ndarray:
+    return scipy.stats.t.pdf(x, nu)
+
+def student_cdf(x: ndarray, nu: ndarray) -> ndarray:
+    return scipy.stats.t.cdf(x, nu)
+
+
+def beta_pdf(x: ndarray, alpha: ndarray, beta: ndarray) -> ndarray:
+    return scipy.stats.beta.pdf(x, alpha, beta)
+
+def beta_cdf(x: ndarray, alpha: ndarray, beta: ndarray) -> ndarray:
+    return scipy.stats.beta.cdf(x, alpha, beta)
+
+
+def chi2_pdf(x: ndarray, k: ndarray) -> ndarray:
+    return scipy.stats.chi2.pdf(x, k)
+
+def chi2_cdf(x: ndarray, k: ndarray) -> ndarray:
+    return scipy.stats.chi2.cdf(x, k)
+
+
+def gamma_pdf(x: ndarray, alpha: ndarray, beta: ndarray) -> ndarray:
+    return scipy.stats.gamma.pdf(x, alpha, scale=1/beta)
+
+def gamma_cdf(x: ndarray, alpha: ndarray, beta: ndarray) -> ndarray:
+    return scipy.stats.gamma.cdf(x, alpha, scale=1/beta)
@@ -0,0 +1,117 @@
+from collections import ChainMap
+from enum import Enum
+from types import MappingProxyType
+from typing import Callable, Iterator, Mapping, Optional, Union
+
+from chplot.functions.names import MPMATH_FUNCTION_NAMES
+from chplot.functions.utils import FunctionDict
+
+
+class FunctionKind(Enum):
+    """How a function is computed on many points."""
+    # Works on whole numpy arrays
+    VECTORIZED = 'vectorized'
+    # Computed point by point in Python
+    PYTHON = 'python'
+    # Computed point by point with mpmath, usually much slower than the others
+    MPMATH = 'mpmath'
+    # Given by the user in a python file, computed point by point
+    USER = 'user'
+
+
+MPMATH_FUNCTIONS = frozenset(name for name, _, _ in MPMATH_FUNCTION_NAMES)
+
+
+class Environment:
+    """Immutable registry of the functions and constants usable in the expressions.
+    The library functions are the bottom layer, loaded when needed by load_necessary_functions. Each call to with_functions returns a new environment
+    with one more layer of user constants and functions, without modifying this one, so several environments can be used at the same time (e.g. in threads).
+    A user function hides the library function of the same name, including its vectorized and memoized versions.
+    The fast functions are versions of some library functions computed with machine floats (mpmath.fp), which hide them.
+    If exact_mpmath is True, the mpmath functions are always computed with mpmath at full precision, instead of their vectorized or machine floats versions."""
+
+    __slots__ = ('_library_functions', '_vectorized_functions', '_memoized_functions', '_user_functions', '_exact_mpmath', '_fast_functions')
+
+    def __init__(self, library_functions: FunctionDict, vectorized_functions: FunctionDict, memoized_functions: dict[str, Callable[..., float]],
+                 user_functions: Optional[ChainMap] = None, exact_mpmath: bool = False, fast_functions: Optional[FunctionDict] = None) -> None:
+        self._library_functions = library_functions
+        self._vectorized_functions = vectorized_functions
+        self._memoized_functions = memoized_functions
+        self._user_functions = user_functions if user_functions is not None else ChainMap()
+        self._exact_mpmath = exact_mpmath
+        self._fast_functions = fast_functions if fast_functions is not None else {}
+
+    def with_functions(self, functions: FunctionDict) -> 'Environment':
+        """Return a new environment with the given functions added, and replacing the ones with the same name. This environment is not modified."""
+        if not functions:
+            return self
+
+        return Environment(
+            self._library_functions, self._vectorized_functions, self._memoized_functions,
+            self._user_functions.new_child(MappingProxyType(dict(functions))),
+            exact_mpmath=self._exact_mpmath, fast_functions=self._fast_functions
+        )
+
+    def with_exact_mpmath(self, exact_mpmath: bool = True) -> 'Environment':
+        """Return a new environment computing (or not) the mpmath functions with mpmath on every point. This environment is not modified."""
+        return Environment(self._library_functions, self._vectorized_functions, self._memoized_functions, self._user_functions,
+                           exact_mpmath=exact_mpmath, fast_functions=self._fast_functions)
+
+    @property
+    def exact_mpmath(self) -> bool:
+        return self._exact_mpmath
+
+    def __getitem__(self, name: str) -> tuple[int, Union[Callable[..., float], float]]:
+        if name in self._user_functions:
+            return self._user_functions[name]
+        if not self._exact_mpmath and name in self._fast_functions:
+            return self._fast_functions[name]
+        return self._library_functions[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._user_functions or name in self._library_functions
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(set(self._library_functions).union(self._user_functions))
+
+    def get(self, name: str, default=None):
+        return self[name] if name in self else default
+
+    def is_user_function(self, name: str) -> bool:
+        return name in self._user_functions
+
+    def get_vectorized(self, name: str) -> Optional[Callable]:
+        """Return the version of the function working on whole numpy arrays, None if there is not any."""
+        if name in self._user_functions or (self._exact_mpmath and name in MPMATH_FUNCTIONS):
+            return None
+        return self._vectorized_functions.get(name, (None, None))[1]
+
+    def get_kind(self, name: str) -> FunctionKind:
+        if name in self._user_functions:
+            return FunctionKind.USER
+        if self.get_vectorized(name) is not None:
+            return FunctionKind.VECTORIZED
+        if name in MPMATH_FUNCTIONS:
+            return FunctionKind.MPMATH
+        return FunctionKind.PYTHON
+
+    @property
+    def user_functions(self) -> Mapping[str, tuple[int, Union[Callable[..., float], float]]]:
+        """The constants and functions given by the user, which are not known by other processes."""
+        return MappingProxyType(dict(self._user_functions))
+
+    @property
+    def memoized_functions(self) -> dict[str, Callable[..., float]]:
+        """The functions keeping their results, to report how many computations were saved.
+        The user functions are memoized if they have a cache_info method, as given by @plottable(cache=...)."""
+        memoized_functions = {name: func for name, func in self._memoized_functions.items() if name not in self._user_functions}
+        # The memoized fast functions replace the library ones
+        for name in memoized_functions:
+            func = self[name][1]
+            if hasattr(func, 'cache_info'):
+                memoized_functions[name] = func
+        for name, (arg_count, func) in self._user_functions.items():
+            if arg_count > 0 and hasattr(func, 'cache_info'):
+                memoized_functions[name] = func
+
+        return memoized_functions
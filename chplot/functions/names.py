@@ -162,3 +162,104 @@ OTHER_FUNCTION_NAMES: FunctionNames = [
     ('if', 3, '_if'), ('ifn', 3, None), ('ifz', 3, None),
     ('in', 5, '_in'), ('out', 5, None),
 ]
+
+
+# Functions very slow to compute, whose results are kept to avoid computing them again with the same parameters
+# (e.g. with integer inputs, or during the zeros bisections)
+MEMOIZED_FUNCTION_NAMES: list[str] = [
+    'primepi', 'riemannr', 'primezeta', 'secondzeta',
+    'stieltjes', 'nzetazeros', 'backlunds',
+    'superfac', 'hyperfac', 'barnesg',
+]
+
+
+# Mpmath functions also computed with machine floats instead of arbitrary precision numbers, which is much faster
+# Their names and parameter counts are the same as in MPMATH_FUNCTION_NAMES, and the third element is the name in the definition module
+FAST_MPMATH_FUNCTION_NAMES: FunctionNames = [
+    ('sec', 1, None), ('csc', 1, None), ('cot', 1, None),
+    ('asec', 1, None), ('acsc', 1, None), ('acot', 1, None),
+    ('cospi', 1, None),
+    ('sinc', 1, None),
+    ('sech', 1, None), ('csch', 1, None), ('coth', 1, None),
+    ('asech', 1, None), ('acsch', 1, None), ('acoth', 1, None),
+
+    ('fac2', 1, None),
+    ('superfac', 1, None), ('barnesg', 1, None),
+    ('harmonic', 1, None),
+
+    ('Ei', 1, 'ei'), ('Li', 1, '_Li'), ('li', 1, None),
+
+    ('coulombc', 2, None),
+
+    ('altzeta', 1, None), ('siegelz', 1, None), ('siegeltheta', 1, None),
+    ('polylog', 2, None), ('clsin', 2, None), ('clcos', 2, None),
+    ('primezeta', 1, None),
+
+    ('riemannr', 1, None),
+
+    ('eta', 1, 'altzeta'),
+]
+
+
+# Vectorized versions of some of the above functions, working on whole numpy arrays at once
+# The names are the same as the scalar ones, and the third element is the name in the definition module
+
+NUMPY_MATH_FUNCTION_NAMES: FunctionNames = [
+    ('cos', 1, None), ('sin', 1, None), ('tan', 1, None),
+    ('acos', 1, 'arccos'), ('asin', 1, 'arcsin'), ('atan', 1, 'arctan'), ('atan2', 2, 'arctan2'),
+
+    ('cosh', 1, None), ('sinh', 1, None), ('tanh', 1, None),
+    ('acosh', 1, 'arccosh'), ('asinh', 1, 'arcsinh'), ('atanh', 1, 'arctanh'),
+
+    ('sqrt', 1, None), ('cbrt', 1, None),
+
+    ('ceil', 1, None), ('floor', 1, None),
+
+    ('degrees', 1, None), ('radians', 1, None),
+
+    ('exp', 1, None), ('expm1', 1, None),
+    ('log', 1, None), ('ln', 1, 'log'), ('log10', 1, None), ('log1p', 1, None), ('log2', 1, None),
+
+    # 'remainder' is not there because numpy.remainder is the modulo operation and not the IEEE 754 remainder
+    ('fmod', 2, None),
+
+    ('hypot', 2, None), ('dist', 4, '_dist'),
+    ('copysign', 2, None),
+    ('trunc', 1, None)
+]
+
+
+SCIPY_MATH_FUNCTION_NAMES: FunctionNames = [
+    ('erf', 1, None), ('erfc', 1, None),
+
+    ('gamma', 1, None), ('lgamma', 1, 'gammaln'), ('lngamma', 1, 'gammaln'),
+]
+
+
+# Double precision versions of some mpmath functions, only used when the mpmath ones are not required by the user
+VECTORIZED_MPMATH_FUNCTION_NAMES: FunctionNames = [
+    ('sec', 1, None), ('csc', 1, None), ('cot', 1, None),
+    ('asec', 1, None), ('acsc', 1, None), ('acot', 1, None),
+    ('sinc', 1, None),
+    ('sech', 1, None), ('csch', 1, None), ('coth', 1, None),
+    ('asech', 1, None), ('acsch', 1, None), ('acoth', 1, None),
+
+    ('harmonic', 1, None),
+
+    ('Ei', 1, 'ei'),
+
+    ('legendre', 2, None),
+    ('chebyt', 2, None), ('chebyu', 2, None),
+    ('jacobi', 4, None), ('gegenbauer', 3, None), ('hermite', 2, None), ('laguerre', 3, None),
+
+    ('fib', 1, None), ('fibonacci', 1, 'fib'),
+]
+
+
+# Same names and definition names as PROBABILITY_FUNCTION_NAMES and OTHER_FUNCTION_NAMES, without the conditional functions
+VECTORIZED_PROBABILITY_FUNCTION_NAMES: FunctionNames = list(PROBABILITY_FUNCTION_NAMES)
+
+VECTORIZED_OTHER_FUNCTION_NAMES: FunctionNames = [
+    (name, param_count, function_name) for name, param_count, function_name in OTHER_FUNCTION_NAMES
+    if name not in ('if', 'ifn', 'ifz', 'in', 'out')
+]
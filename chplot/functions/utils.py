@@ -1,3 +1,4 @@
+import functools
 import logging
 from types import ModuleType
 from typing import Callable, Optional, Union
@@ -8,6 +9,16 @@ LOGGER = logging.getLogger('CHPLOT')
 FunctionDict = dict[str, tuple[int, Union[Callable[..., float], float]]]
 FunctionNames = list[tuple[str, int, Optional[str]]]
 
+# Maximum number of results kept for each memoized function
+DEFAULT_MEMOIZATION_SIZE = 4096
+
+
+def memoize(func: Callable[..., float], max_size: int = DEFAULT_MEMOIZATION_SIZE) -> Callable[..., float]:
+    """Return the function keeping its last max_size results, so it is not computed again with the same parameters.
+    The number of hits and misses are given by its cache_info method."""
+    return functools.lru_cache(maxsize=max_size)(func)
+
+
 def get_functions_from_module(module: ModuleType, function_names: tuple[int, str]):
     # Use a for loop so we can try-except on each function separately
     # The goal is to be as resilient as possible, and add every defined function
@@ -0,0 +1,129 @@
+import hashlib
+import inspect
+import os
+import pathlib
+import platform
+import tempfile
+from typing import Optional
+
+import numpy as np
+
+from chplot.functions.environment import Environment
+from chplot.plot.utils import LOGGER
+from chplot.rpn import PARSE_STORE_FILENAME, RpnProgram
+from chplot.rpn.parse_store import get_library_version
+
+
+DEFAULT_CACHE_DIR = str(pathlib.Path.home() / '.cache' / 'chplot')
+# In MiB
+DEFAULT_CACHE_MAX_SIZE = 256
+CACHE_FILE_EXTENSION = '.npy'
+# Libraries whose version may change the computed values
+VERSIONED_LIBRARIES = ('chplot', 'numpy', 'scipy', 'mpmath')
+
+
+def _get_library_versions() -> list[str]:
+    # The version of chplot also contains the hash of its sources, so the key changes with the code even if it is not installed
+    return [f'python={platform.python_version()}', *(f'{library}={get_library_version(library)}' for library in VERSIONED_LIBRARIES)]
+
+
+def _get_user_function_description(name: str, environment: Environment) -> str:
+    """Return a string which changes if the user constant or function changes: the value of a constant, or the hash of the file of a function."""
+    arg_count, function = environment[name]
+    if arg_count == 0:
+        return f'{name}={function!r}'
+
+    try:
+        file_hash = hashlib.sha256(pathlib.Path(inspect.getfile(function)).read_bytes()).hexdigest()
+    except (OSError, TypeError):
+        # Without its file, the function cannot be identified, so the cache will never be used for it
+        file_hash = f'unknown-{id(function)}'
+
+    return f'{name}({arg_count})={file_hash}'
+
+
+def get_cache_key(program: RpnProgram, inputs: np.ndarray) -> str:
+    """Return the key of the values of the program for the given inputs. It changes if anything which may change the values changes."""
+    inputs = np.ascontiguousarray(inputs, dtype=float)
+    user_functions = sorted(
+        _get_user_function_description(token, program.environment)
+        for token in set(program.rpn.split(' '))
+        if program.environment.is_user_function(token)
+    )
+
+    key = hashlib.sha256()
+    # The optimized RPN also tells if sub-expressions are approximated by surrogates, and with which tolerance
+    # The mpmath functions computed exactly are only added to the key when asked, so the other keys do not change
+    exact_mpmath = ['exact mpmath'] if program.environment.exact_mpmath else []
+    for part in (program.rpn, program.optimized_rpn, str(program.variable), *user_functions, *exact_mpmath, *_get_library_versions()):
+        key.update(part.encode('utf-8'))
+        key.update(b'\0')
+    key.update(inputs.tobytes())
+
+    return key.hexdigest()
+
+
+def load_cached_values(cache_dir: str, key: str, size: int) -> Optional[np.ndarray]:
+    """Return the values stored with the given key, or None if there are not any (or if they are not valid)."""
+    path = pathlib.Path(cache_dir) / f'{key}{CACHE_FILE_EXTENSION}'
+    if not path.is_file():
+        return None
+
+    try:
+        values = np.load(path, allow_pickle=False)
+    except Exception:
+        LOGGER.warning("cannot read cache file '%s', it will be ignored", path)
+        return None
+
+    if values.shape != (size,):
+        return None
+
+    # Update the modification time, as the least recently used files are removed first
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+    return values
+
+
+def store_values(cache_dir: str, key: str, values: np.ndarray) -> None:
+    """Store the values with the given key. The file is written entirely before being visible, so another run never reads it partially."""
+    directory = pathlib.Path(cache_dir)
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, suffix='.tmp', delete=False) as file:
+            np.save(file, np.asarray(values, dtype=float), allow_pickle=False)
+        os.replace(file.name, directory / f'{key}{CACHE_FILE_EXTENSION}')
+    except OSError:
+        LOGGER.warning("cannot write in cache directory '%s'", cache_dir)
+
+
+def evict_cache(cache_dir: str, max_size: float) -> None:
+    """Remove the least recently used files of the cache until its size is at most max_size MiB."""
+    try:
+        files = [(path, path.stat()) for path in pathlib.Path(cache_dir).glob(f'*{CACHE_FILE_EXTENSION}')]
+    except OSError:
+        return
+
+    total_size = sum(stat.st_size for _, stat in files)
+    max_bytes = max_size * 1024 * 1024
+
+    for path, stat in sorted(files, key=lambda file: file[1].st_mtime):
+        if total_size <= max_bytes:
+            break
+        try:
+            path.unlink()
+            total_size -= stat.st_size
+        except OSError:
+            LOGGER.warning("cannot remove cache file '%s'", path)
+
+
+def clear_cache(cache_dir: str) -> None:
+    """Remove every file of the cache, including the parsed expressions."""
+    evict_cache(cache_dir, 0)
+
+    try:
+        (pathlib.Path(cache_dir) / PARSE_STORE_FILENAME).unlink(missing_ok=True)
+    except OSError:
+        LOGGER.warning("cannot remove the parsed expressions of cache directory '%s'", cache_dir)
@@ -88,13 +88,13 @@ def _get_nth_derivative(f: np.ndarray, h: float, n: int) -> np.ndarray:
 def compute_derivatives(parameters: PlotParameters, graphs: list[Graph]) -> list[Graph]:
     derivatives: list[Graph] = []
     for graph in graphs:
-        values = np.nan_to_num(graph.values, copy=True, nan=0)
         for order in parameters.derivation_orders:
             try:
                 shrinkage = _get_size_reduction(order)
                 max_points = _get_max_number_of_points(order)
                 inputs = _resize_array(graph.inputs, max_points)
-                values = _resize_array(values, max_points)
+                # Only the used values are copied, with nan replaced by zeros
+                values = np.nan_to_num(_resize_array(graph.values, max_points), copy=True, nan=0)
                 h = inputs[1] - inputs[0]
 
                 derivative_expression = f'd{order}/dx{order} * ({graph.expression})' if order != 1 else f'd/dx * ({graph.expression})'
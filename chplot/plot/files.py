@@ -149,7 +149,7 @@ def _read_one_file(filepath: str) -> list[Graph]:
         return []
 
     return [
-        Graph(np.array(inputs_list[index]), GraphType.FILE, column_names[index], None, values)
+        Graph(np.array(inputs_list[index], dtype=float), GraphType.FILE, column_names[index], None, np.array(values, dtype=float))
         for index, values in enumerate(values_list)
     ]
 
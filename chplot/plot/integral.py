@@ -6,15 +6,16 @@ from chplot.plot.plot_parameters import PlotParameters
 from chplot.plot.utils import _round as round
 from chplot.plot.utils import Graph, GraphType
 from chplot.plot.utils import LOGGER
+from chplot.rpn import uses_surrogates
 
 
 # See https://en.wikipedia.org/wiki/Trapezoidal_rule for the computation of the integral
 def _compute_integral(parameters: PlotParameters, graph: Graph) -> float:
     delta = graph.inputs[1] - graph.inputs[0]
-    # use numpy as it's faster even with the conversion
-    values = np.nan_to_num(graph.values, copy=True, nan=0)
+    values = graph.values
 
-    integral = sum(values[1:-1]) + (values[0] + values[-1]) / 2
+    # nan values count as zero
+    integral = np.nansum(values[1:-1]) + np.nansum(values[[0, -1]]) / 2
     integral *= delta
 
     return float(integral)
@@ -43,6 +44,8 @@ def compute_and_print_integrals(parameters: PlotParameters, graphs: list[Graph])
 
         file.write('\n')
         file.write(f'- ∫f(x)dx = {integral}\n    where f(x) = {graph.expression} on [{round(graph.inputs[0], 3)} ; {round(graph.inputs[-1], 3)}]\n')
+        if uses_surrogates(graph.rpn):
+            file.write(f'    computed with surrogates of tolerance {parameters.surrogate_tolerance}\n')
         file.write('\n')
 
     file.write('\n')
@@ -1,12 +1,16 @@
 import csv
 import math
-from typing import Any
+import os
+import pathlib
+import sqlite3
+from typing import Any, Optional
 
 import numpy as np
 import matplotlib.pyplot as plt
-from shunting_yard import MismatchedBracketsError, shunting_yard
+from shunting_yard import MismatchedBracketsError
 
-from chplot.functions import FUNCTIONS, load_necessary_functions
+from chplot.functions import load_necessary_functions
+from chplot.plot.cache import clear_cache, evict_cache, get_cache_key, load_cached_values, store_values
 from chplot.plot.derivative import compute_derivatives
 from chplot.plot.files import read_files
 from chplot.plot.integral import compute_and_print_integrals
@@ -16,43 +20,72 @@ from chplot.plot.utils import _round as round
 from chplot.plot.utils import Graph, NORMAL_UNRECOGNIZED_CHARACTERS, GraphType
 from chplot.plot.utils import LOGGER
 from chplot.plot.zeros import compute_and_print_zeros
-from chplot.rpn import compute_rpn_list, get_rpn_errors
+from chplot.rpn import ChebyshevSurrogate, compute_rpn_array_scalar, compute_rpn_arrays, compute_rpn_arrays_parallel, Engine, parse_expression, parse_program, ParseStore, PARSE_STORE_FILENAME, plan_engine, RpnProgram, set_parse_store, use_integer_sequences, use_surrogates
 
 
 
+def _open_parse_store(parameters: PlotParameters) -> Optional[ParseStore]:
+    """Open the store of the expressions parsed in previous runs, if the cache is used."""
+    if not parameters.use_cache:
+        return None
+
+    try:
+        pathlib.Path(parameters.cache_dir).mkdir(parents=True, exist_ok=True)
+        store = ParseStore(str(pathlib.Path(parameters.cache_dir) / PARSE_STORE_FILENAME))
+    except (OSError, sqlite3.Error):
+        LOGGER.warning("cannot open the parsed expressions of cache directory '%s'", parameters.cache_dir)
+        return None
+
+    set_parse_store(store)
+    return store
+
+
+def _close_parse_store(store: Optional[ParseStore]) -> None:
+    """Save the expressions parsed in this run, and close the store."""
+    if store is None:
+        return
+
+    set_parse_store(None)
+    try:
+        store.save()
+    except sqlite3.Error:
+        LOGGER.warning("cannot save the parsed expressions in '%s'", store.path)
+    finally:
+        store.close()
+
+
 def _load_functions(parameters: PlotParameters) -> None:
-    """Compute the RPN of every expression, and load all functions necessary to compute them."""
-    all_expressions: list[str] = [
-        *parameters.expressions,
-        *parameters.x_lim,
-        *parameters.y_lim,
-        parameters.regression_expression,
+    """Compute the RPN of every expression, and load all functions necessary to compute them.
+    The RPNs are kept by parse_expression, so the expressions are not parsed again later."""
+    # Same variable as where each expression is used later
+    all_expressions: list[tuple[str, Optional[str]]] = [
+        *((expression, parameters.variable) for expression in parameters.expressions),
+        *((str(limit), None) for limit in (*parameters.x_lim, *parameters.y_lim) if limit is not None),
     ]
+    if parameters.regression_expression is not None:
+        all_expressions.append((parameters.regression_expression, parameters.variable))
 
     # Separate constants to check for error in the parsing
     # But do not act on the error here
     for constant in parameters.constants:
         try:
-            all_expressions.append(constant.split('=')[1])
+            all_expressions.append((constant.split('=')[1], None))
         except Exception:
             pass
 
     all_rpns: list[str] = []
 
-    for expression in all_expressions:
+    for expression, variable in all_expressions:
         try:
-            all_rpns.append(shunting_yard(
-                expression,
-                case_sensitive=True,
-                variable=parameters.variable,
-                convert_scientific_notation=not parameters.disable_scientific_notation,
-            ))
-        # The exception will be logged later when the RPN is re-computed in the relevant place
+            all_rpns.append(parse_expression(expression, variable=variable, convert_scientific_notation=not parameters.disable_scientific_notation))
+        # The exception will be logged later when the RPN is needed in the relevant place
         # Here, just ignore it
         except Exception:
             pass
-    
+
     load_necessary_functions(all_rpns)
+    if parameters.exact_mpmath:
+        parameters.environment = parameters.environment.with_exact_mpmath()
 
 
 def _get_x_lim(parameters: PlotParameters) -> tuple[float, float]:
@@ -122,31 +155,189 @@ def _get_x_lim_graph(parameters: PlotParameters, graphs: list[Graph]) -> tuple[f
 def _generate_inputs(parameters: PlotParameters) -> np.ndarray:
     inputs = np.linspace(*_get_x_lim(parameters), parameters.n_points, endpoint=True)
 
-    if not parameters.is_integer:
-        return inputs
+    if parameters.is_integer:
+        # Some points may repeat, so we keep only the unique to avoid doing useless work
+        inputs = np.unique(np.round(inputs))
 
-    # Some points may repeat, so we keep only the unique to avoid doing useless work
-    return np.unique(np.round(inputs))
+    # The inputs are shared by all the base graphs
+    inputs.flags.writeable = False
+    return inputs
 
 
 def _get_unrecognized_characters(expression: str, rpn: str) -> set[str]:
     return set(expression).difference(rpn).difference(NORMAL_UNRECOGNIZED_CHARACTERS)
 
 
+def _get_forced_engine(parameters: PlotParameters) -> Optional[Engine]:
+    if parameters.engine == 'auto':
+        return None
+
+    try:
+        return Engine(parameters.engine)
+    except ValueError:
+        LOGGER.error("unknown engine '%s', it will be chosen for each expression", parameters.engine)
+        return None
+
+
+def _compute_programs(parameters: PlotParameters, expressions: list[str], programs: list[RpnProgram], inputs: np.ndarray) -> list[np.ndarray]:
+    """Compute the values of all programs, each with the engine chosen for it (see plan_engine)."""
+    forced_engine = _get_forced_engine(parameters)
+    # Without a number of processes, a forced parallel computation uses all the processors
+    jobs = parameters.jobs if parameters.jobs > 1 or forced_engine != Engine.PARALLEL else (os.cpu_count() or 1)
+
+    indices: dict[Engine, list[int]] = {engine: [] for engine in Engine}
+    for index, (expression, program) in enumerate(zip(expressions, programs)):
+        engine, reason = plan_engine(program, inputs.size, jobs=jobs, engine=forced_engine)
+        # The usual choice is not worth a message
+        log = LOGGER.debug if engine == Engine.VECTORIZED else LOGGER.info
+        log("expression '%s' computed with the %s engine: %s", expression, engine.value, reason)
+        indices[engine].append(index)
+
+    all_values: list[np.ndarray] = [None] * len(programs)
+
+    if indices[Engine.PARALLEL]:
+        try:
+            parallel_values = compute_rpn_arrays_parallel(
+                [programs[index] for index in indices[Engine.PARALLEL]],
+                inputs,
+                jobs,
+                progress_bar=True,
+                block_size=parameters.block_size
+            )
+            for index, values in zip(indices[Engine.PARALLEL], parallel_values):
+                all_values[index] = values
+        except Exception:
+            LOGGER.error('error while computing expressions with %s processes, they will be computed by a single process', jobs)
+            indices[Engine.VECTORIZED].extend(indices[Engine.PARALLEL])
+
+    for index in indices[Engine.SCALAR]:
+        all_values[index] = compute_rpn_array_scalar(programs[index], inputs, progress_bar=True)
+
+    # All the other expressions are computed together, so that their common parts are computed only once
+    vectorized_values, saved_evaluations = compute_rpn_arrays(
+        [programs[index] for index in indices[Engine.VECTORIZED]],
+        inputs,
+        progress_bar=True,
+        block_size=parameters.block_size
+    )
+    for index, values in zip(indices[Engine.VECTORIZED], vectorized_values):
+        all_values[index] = values
+
+    if saved_evaluations > 0:
+        LOGGER.info(
+            '%s function evaluation%s saved by computing only once the parts common to several expressions',
+            saved_evaluations,
+            's' if saved_evaluations > 1 else ''
+        )
+
+    return all_values
+
+
+def _get_values(parameters: PlotParameters, expressions: list[str], programs: list[RpnProgram], inputs: np.ndarray) -> list[np.ndarray]:
+    """Return the values of all programs, from the cache if they were already computed with the same inputs."""
+    if not parameters.use_cache:
+        return _compute_programs(parameters, expressions, programs, inputs)
+
+    keys = [get_cache_key(program, inputs) for program in programs]
+    all_values = [load_cached_values(parameters.cache_dir, key, inputs.size) for key in keys]
+
+    missing_indices = [index for index, values in enumerate(all_values) if values is None]
+    if len(missing_indices) < len(programs):
+        LOGGER.info('%s expression%s loaded from the cache', len(programs) - len(missing_indices), 's' if len(programs) - len(missing_indices) > 1 else '')
+
+    if not missing_indices:
+        return all_values
+
+    computed_values = _compute_programs(
+        parameters,
+        [expressions[index] for index in missing_indices],
+        [programs[index] for index in missing_indices],
+        inputs
+    )
+    for index, values in zip(missing_indices, computed_values):
+        all_values[index] = values
+        store_values(parameters.cache_dir, keys[index], values)
+
+    evict_cache(parameters.cache_dir, parameters.cache_max_size)
+
+    return all_values
+
+
+def _uses_vectorized_versions(parameters: PlotParameters, program: RpnProgram, points: int) -> bool:
+    """Whether the engine chosen for the program uses the vectorized versions of its functions, through which the tables of the integer sequences
+    and the surrogates are used. The scalar engine only uses the compiled function of the program."""
+    forced_engine = Engine.SCALAR if parameters.engine == Engine.SCALAR.value else None
+    return plan_engine(program, points, engine=forced_engine)[0] != Engine.SCALAR
+
+
+def _use_integer_sequences(parameters: PlotParameters, expressions: list[str], programs: list[RpnProgram], inputs: np.ndarray) -> list[RpnProgram]:
+    """Return the programs where the functions of integers are computed from tables of their values, if the inputs are integers."""
+    if not parameters.is_integer:
+        return programs
+
+    sequence_programs: list[RpnProgram] = []
+    for expression, program in zip(expressions, programs):
+        if not _uses_vectorized_versions(parameters, program, inputs.size):
+            sequence_programs.append(program)
+            continue
+
+        sequence_program, tokens = use_integer_sequences(program)
+        if tokens:
+            LOGGER.debug("expression '%s': %s computed from tables of their values on integers", expression, ', '.join(f"'{token}'" for token in tokens))
+        sequence_programs.append(sequence_program)
+
+    return sequence_programs
+
+
+def _use_surrogates(parameters: PlotParameters, expressions: list[str], programs: list[RpnProgram], inputs: np.ndarray) -> list[RpnProgram]:
+    """Return the programs where the expensive sub-expressions are approximated by surrogates, if they are enabled."""
+    if parameters.surrogate_tolerance is None:
+        return programs
+
+    surrogate_programs: list[RpnProgram] = []
+    for expression, program in zip(expressions, programs):
+        if not _uses_vectorized_versions(parameters, program, inputs.size):
+            LOGGER.debug("expression '%s': no surrogates with the %s engine", expression, Engine.SCALAR.value)
+            surrogate_programs.append(program)
+            continue
+
+        surrogate_program, surrogates = use_surrogates(program, inputs, parameters.surrogate_tolerance)
+        if surrogates:
+            LOGGER.info(
+                "expression '%s': %s approximated by Chebyshev surrogates with a tolerance of %s",
+                expression,
+                ', '.join(f"'{surrogate.program.rpn}'" for surrogate in surrogates),
+                parameters.surrogate_tolerance
+            )
+        surrogate_programs.append(surrogate_program)
+
+    return surrogate_programs
+
+
+def _log_surrogates_statistics(expressions: list[str], programs: list[RpnProgram]) -> None:
+    """Log where the surrogates could not reach the tolerance, and were replaced by the exact computation."""
+    for expression, program in zip(expressions, programs):
+        for instruction in program.instructions:
+            surrogate = instruction.vectorized
+            if isinstance(surrogate, ChebyshevSurrogate) and surrogate.is_built and surrogate.exact_fraction > 0:
+                LOGGER.info(
+                    "expression '%s': sub-expression '%s' computed exactly on %s%% of the interval, where its surrogate does not reach the tolerance",
+                    expression,
+                    surrogate.program.rpn,
+                    round(100 * surrogate.exact_fraction, 1)
+                )
+
+
 def _generate_graphs(parameters: PlotParameters, inputs: np.ndarray) -> list[Graph]:
-    graphs: list[Graph] = []
+    expressions: list[str] = []
+    programs: list[RpnProgram] = []
 
-    if parameters.variable in FUNCTIONS:
+    if parameters.variable in parameters.environment:
         LOGGER.warning("variable '%s' is overriding function or constant '%s'", parameters.variable, parameters.variable)
 
     for expression in parameters.expressions:
         try:
-            rpn = shunting_yard(
-                expression=expression,
-                case_sensitive=True,
-                variable=parameters.variable,
-                convert_scientific_notation=not parameters.disable_scientific_notation
-            )
+            rpn = parse_expression(expression, variable=parameters.variable, convert_scientific_notation=not parameters.disable_scientific_notation)
         except MismatchedBracketsError:
             LOGGER.error("mismatched brackets in the plotted expression '%s'", expression)
             continue
@@ -154,17 +345,27 @@ def _generate_graphs(parameters: PlotParameters, inputs: np.ndarray) -> list[Gra
             LOGGER.error("unknown error in the plotted expression '%s'", expression)
             continue
 
-        if (error := get_rpn_errors(rpn, variable=parameters.variable)) is not None:
+        program, error = parse_program(rpn, variable=parameters.variable, environment=parameters.environment)
+        if error is not None:
             LOGGER.error("error for expression '%s' : %s", expression, error)
             continue
+        LOGGER.debug("optimized RPN of expression '%s': %s", expression, program.optimized_rpn)
 
         if (unknown_characters := _get_unrecognized_characters(expression, rpn)):
             LOGGER.warning("unknown characters in expression '%s': %s", expression, ''.join(unknown_characters))
 
-        values = compute_rpn_list(rpn, inputs, variable=parameters.variable)
-        graphs.append(Graph(inputs, GraphType.BASE, expression, rpn, values))
+        expressions.append(expression)
+        programs.append(program)
+
+    programs = _use_integer_sequences(parameters, expressions, programs, inputs)
+    programs = _use_surrogates(parameters, expressions, programs, inputs)
+    all_values = _get_values(parameters, expressions, programs, inputs)
+    _log_surrogates_statistics(expressions, programs)
 
-    return graphs
+    return [
+        Graph(inputs, GraphType.BASE, expression, program, values)
+        for expression, program, values in zip(expressions, programs, all_values)
+    ]
 
 
 def _get_y_lim_graph(parameters: PlotParameters) -> tuple[float, float]:
@@ -281,12 +482,12 @@ def _manage_integrals(parameters: PlotParameters, graphs: list[Graph]):
 
 def _save_data(parameters: PlotParameters, graphs: list[Graph]):
     column_names: list[str] = []
-    data: list[list[float]] = []
+    data: list[np.ndarray] = []
     # All base graphs have the same x
     base_graphs = [graph for graph in graphs if graph.type == GraphType.BASE]
     if base_graphs:
         column_names.append(parameters.x_label or 'x')
-        data.append(base_graphs[0].inputs.tolist())
+        data.append(base_graphs[0].inputs)
         for graph in base_graphs:
             column_names.append(graph.expression)
             data.append(graph.values)
@@ -299,14 +500,11 @@ def _save_data(parameters: PlotParameters, graphs: list[Graph]):
         column_names.append(f'x {{{graph.expression}}}')
         column_names.append(graph.expression)
 
-        data.append(graph.inputs.tolist())
-        # Force convert back to python list because values can be np array of python list
-        data.append(list(graph.values))
+        data.append(graph.inputs)
+        data.append(graph.values)
 
-    # Equalize the length of each column
+    # Shorter columns are completed with empty cells
     max_column_height = max(map(len, data))
-    for index in range(len(data)):
-        data[index].extend(['' for _ in range(max_column_height - len(data[index]))])
 
 
     try:
@@ -314,11 +512,37 @@ def _save_data(parameters: PlotParameters, graphs: list[Graph]):
             csvwriter = csv.writer(file, lineterminator='\n')
             csvwriter.writerow(column_names)
             for index in range(max_column_height):
-                csvwriter.writerow(column[index] for column in data)
+                csvwriter.writerow(float(column[index]) if index < len(column) else '' for column in data)
     except OSError:
         LOGGER.error("error while saving data to file '%s'.", parameters.save_data_path)
 
 
+def _get_memoization_statistics(parameters: PlotParameters) -> dict[str, Any]:
+    """Return the statistics of the memoized functions, which keep their results between runs, so that only the ones of this run are logged."""
+    return {name: func.cache_info() for name, func in parameters.environment.memoized_functions.items()}
+
+
+def _log_memoization_statistics(parameters: PlotParameters, graphs: list[Graph], initial_statistics: dict[str, Any]):
+    used_names = {token for graph in graphs if graph.rpn is not None for token in graph.rpn.rpn.split(' ')}
+
+    for name, func in parameters.environment.memoized_functions.items():
+        if name not in used_names:
+            continue
+
+        statistics = func.cache_info()
+        misses, hits = statistics.misses, statistics.hits
+        if name in initial_statistics:
+            misses -= initial_statistics[name].misses
+            hits -= initial_statistics[name].hits
+        if hits + misses == 0:
+            continue
+
+        LOGGER.info(
+            "function '%s' was computed %s times, and %s results were reused (%s kept out of %s at most)",
+            name, misses, hits, statistics.currsize, statistics.maxsize
+        )
+
+
 def _save_figure(parameters: PlotParameters):
     try:
         plt.savefig(parameters.save_figure_path, bbox_inches='tight')
@@ -338,11 +562,20 @@ def plot(parameters: PlotParameters) -> None:
 
     set_default_values(parameters)
 
+    if parameters.clear_cache:
+        clear_cache(parameters.cache_dir)
+        LOGGER.info("cleared cache directory '%s'", parameters.cache_dir)
+
+    # Done first, so that the expressions are parsed only once
+    replace_implicit_variable_multiplication(parameters)
+
+    parse_store = _open_parse_store(parameters)
+
     _load_functions(parameters)
 
     retrieve_python_functions(parameters)
+    memoization_statistics = _get_memoization_statistics(parameters)
     convert_parameters_expression(parameters)
-    replace_implicit_variable_multiplication(parameters)
 
     inputs = _generate_inputs(parameters)
     graphs = _generate_graphs(parameters, inputs)
@@ -353,6 +586,9 @@ def plot(parameters: PlotParameters) -> None:
     if parameters.regression_expression is not None:
         graphs.extend(compute_regressions(parameters, graphs))
 
+    # Every expression has been parsed
+    _close_parse_store(parse_store)
+
     if not graphs:
         LOGGER.critical('no expression without errors, cannot plot anything.')
         return
@@ -369,6 +605,8 @@ def plot(parameters: PlotParameters) -> None:
     if parameters.save_data_path is not None:
         _save_data(parameters, graphs)
 
+    _log_memoization_statistics(parameters, graphs, memoization_statistics)
+
     _plot_graphs(parameters, graphs)
 
     if parameters.save_figure_path is not None:
@@ -7,13 +7,15 @@ import re
 from types import BuiltinFunctionType, ModuleType
 from typing import Any, Callable, Literal, Optional, Union
 
-from shunting_yard import MismatchedBracketsError, shunting_yard
+from shunting_yard import MismatchedBracketsError
 
-from chplot.functions import FUNCTIONS
+from chplot.functions import DEFAULT_ENVIRONMENT
+from chplot.functions.environment import Environment
 from chplot.functions.utils import FunctionDict
+from chplot.plot.cache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_SIZE
 from chplot.plot.utils import DECORATOR_GETTER_REGEX, FUNCTION_NAME_REGEX, plottable
 from chplot.plot.utils import LOGGER
-from chplot.rpn import compute_rpn_unsafe, get_rpn_errors
+from chplot.rpn import DEFAULT_BLOCK_SIZE, parse_expression, parse_program
 
 
 @dataclass
@@ -52,6 +54,20 @@ class PlotParameters:
     save_data_path: Optional[str] = None
     python_files: Optional[str] = None
 
+    block_size: Optional[int] = DEFAULT_BLOCK_SIZE
+    jobs: Optional[int] = 1
+    engine: Optional[Literal['auto', 'scalar', 'vectorized', 'parallel']] = 'auto'
+    surrogate_tolerance: Optional[float] = None
+    exact_mpmath: Optional[bool] = False
+
+    use_cache: Optional[bool] = False
+    clear_cache: Optional[bool] = False
+    cache_dir: Optional[str] = DEFAULT_CACHE_DIR
+    cache_max_size: Optional[float] = DEFAULT_CACHE_MAX_SIZE
+
+    # Functions and constants usable in the expressions, the user ones are added to it in new layers
+    environment: Optional[Environment] = DEFAULT_ENVIRONMENT
+
 
 DEFAULT_PARAMETERS = PlotParameters()
 
@@ -65,7 +81,8 @@ def set_default_values(parameters: PlotParameters) -> None:
             setattr(parameters, field_name, default_attr)
 
 
-def _convert_single_expression(expression: Optional[str], default_value_nan: Any = None, disable_scientific_notation: bool = False) -> float:
+def _convert_single_expression(expression: Optional[str], default_value_nan: Any = None, disable_scientific_notation: bool = False,
+                                environment: Environment = DEFAULT_ENVIRONMENT) -> float:
     if expression is None:
         return None
 
@@ -73,12 +90,7 @@ def _convert_single_expression(expression: Optional[str], default_value_nan: Any
         default_value_nan = None
 
     try:
-        rpn = shunting_yard(
-            expression=str(expression),
-            case_sensitive=True,
-            variable=None,
-            convert_scientific_notation=not disable_scientific_notation
-        )
+        rpn = parse_expression(str(expression), variable=None, convert_scientific_notation=not disable_scientific_notation)
     except MismatchedBracketsError:
         LOGGER.error("mismatched brackets in the expression '%s'", expression)
         return None
@@ -86,11 +98,12 @@ def _convert_single_expression(expression: Optional[str], default_value_nan: Any
         LOGGER.error("unknown error in the expression '%s'", expression)
         return None
 
-    if (error := get_rpn_errors(rpn, variable=None)) is not None:
+    program, error = parse_program(rpn, variable=None, environment=environment)
+    if error is not None:
         LOGGER.warning("error while computing expression '%s': %s", expression, error)
         return None
 
-    value = compute_rpn_unsafe(rpn.split(' '), 0, variable=None)
+    value = program.function(0)
     return value if not math.isnan(value) else default_value_nan
 
 
@@ -107,28 +120,35 @@ def convert_parameters_expression(parameters: PlotParameters) -> None:
             LOGGER.error("cannot parse constant assignement '%s', it will be ignored", constant)
             continue
 
-        constant_value = _convert_single_expression(constant_expression, default_value_nan=math.nan, disable_scientific_notation=parameters.disable_scientific_notation)
+        # The previous constants can be used in the expression
+        constant_value = _convert_single_expression(
+            constant_expression,
+            default_value_nan=math.nan,
+            disable_scientific_notation=parameters.disable_scientific_notation,
+            environment=parameters.environment.with_functions(constants_function_dict)
+        )
         if constant_value is None:
             LOGGER.error("error while computing constant expression '%s' (of constant '%s'), it will be ignored", constant_expression, constant_name)
             continue
 
         # 0 indicates it's a constant and do not require parameters
-        if constant_name in FUNCTIONS:
+        if constant_name in parameters.environment or constant_name in constants_function_dict:
             LOGGER.warning("constant '%s' will replace an already defined constant or function", constant_name)
-        FUNCTIONS[constant_name] = (0, constant_value)
+        constants_function_dict[constant_name] = (0, constant_value)
 
     parameters.constants = constants_function_dict
+    parameters.environment = parameters.environment.with_functions(constants_function_dict)
 
 
     x_min, x_max = parameters.x_lim
 
     if x_min is not None:
-        x_min = _convert_single_expression(x_min, disable_scientific_notation=parameters.disable_scientific_notation)
+        x_min = _convert_single_expression(x_min, disable_scientific_notation=parameters.disable_scientific_notation, environment=parameters.environment)
         if x_min is None:
             LOGGER.warning("cannot compute lower bound of x-axis")
 
     if x_max is not None:
-        x_max = _convert_single_expression(x_max, disable_scientific_notation=parameters.disable_scientific_notation)
+        x_max = _convert_single_expression(x_max, disable_scientific_notation=parameters.disable_scientific_notation, environment=parameters.environment)
         if x_max is None:
             LOGGER.warning("cannot compute upper bound of x-axis")
 
@@ -138,12 +158,12 @@ def convert_parameters_expression(parameters: PlotParameters) -> None:
     y_min, y_max = parameters.y_lim
 
     if y_min is not None:
-        y_min = _convert_single_expression(y_min, disable_scientific_notation=parameters.disable_scientific_notation)
+        y_min = _convert_single_expression(y_min, disable_scientific_notation=parameters.disable_scientific_notation, environment=parameters.environment)
         if y_min is None:
             LOGGER.warning("cannot compute lower bound of y-axis")
 
     if y_max is not None:
-        y_max = _convert_single_expression(y_max, disable_scientific_notation=parameters.disable_scientific_notation)
+        y_max = _convert_single_expression(y_max, disable_scientific_notation=parameters.disable_scientific_notation, environment=parameters.environment)
         if y_max is None:
             LOGGER.warning("cannot compute upper bound of y-axis")
 
@@ -189,6 +209,7 @@ def retrieve_python_functions(parameters: PlotParameters):
     if parameters.python_files is None:
         return
 
+    python_functions: FunctionDict = {}
     for python_file in parameters.python_files:
         try:
             # The file must be in the current directory
@@ -201,13 +222,13 @@ def retrieve_python_functions(parameters: PlotParameters):
             python = importlib.import_module(python_file)
             for arg_count, func_name, func in _get_decorated_functions(python):
                 try:
-                    if func_name in FUNCTIONS:
+                    if func_name in parameters.environment or func_name in python_functions:
                         LOGGER.warning("function or constant '%s' will replace an already defined constant or function", func_name)
                     # If the function is a constant (= does not have any argument), call it directly to optimize future computations
                     if arg_count == 0:
-                        FUNCTIONS[func_name] = (0, func())
+                        python_functions[func_name] = (0, func())
                     else:
-                        FUNCTIONS[func_name] = (arg_count, func)
+                        python_functions[func_name] = (arg_count, func)
                 except TypeError:
                     LOGGER.error("constant function '%s' of python file '%s' expected some arguments.", func_name, python_file)
 
@@ -216,6 +237,8 @@ def retrieve_python_functions(parameters: PlotParameters):
         except Exception:
             LOGGER.error("unknown error while importing python file '%s'.", python_file)
 
+    parameters.environment = parameters.environment.with_functions(python_functions)
+
 
 def replace_implicit_variable_multiplication(parameters: PlotParameters):
     """Replace in-place any implicit multiplication between the variable and brackets in all expressions including the variable."""
@@ -3,15 +3,14 @@ import sys
 from typing import Optional, Union
 
 import numpy as np
-from shunting_yard import MismatchedBracketsError, shunting_yard
+from shunting_yard import MismatchedBracketsError
 from tqdm import tqdm
 
-from chplot.functions import FUNCTIONS
 from chplot.plot.plot_parameters import PlotParameters
 from chplot.plot.utils import _round as round
 from chplot.plot.utils import Graph, GraphType
 from chplot.plot.utils import LOGGER
-from chplot.rpn import compute_rpn_list, get_rpn_errors
+from chplot.rpn import build_program, compute_rpn_array, parse_expression, parse_program, RpnProgram
 
 
 # match anything like _rX either at the beginning/end of a string or surrounded by spaces, where X is a letter or underscore possibly followed by more letters/underscores or digits
@@ -35,13 +34,12 @@ def _get_unique_regression_parameters(rpn: str) -> list[str]:
 
 
 
-def _check_regression_expression(parameters: PlotParameters) -> Optional[str]:
-    """Check if the regression expression is valid. Return its RPN if yes, None if no."""
+def _check_regression_expression(parameters: PlotParameters) -> Optional[RpnProgram]:
+    """Check if the regression expression is valid. Return its program, whose parameters are the regression parameters, if yes, None if no."""
 
     try:
-        rpn = shunting_yard(
-            expression=parameters.regression_expression,
-            case_sensitive=True,
+        rpn = parse_expression(
+            parameters.regression_expression,
             variable=parameters.variable,
             convert_scientific_notation=not parameters.disable_scientific_notation
         )
@@ -57,17 +55,19 @@ def _check_regression_expression(parameters: PlotParameters) -> Optional[str]:
         LOGGER.error("error: no regression parameters (string starting with '_r' in the regression expression)")
         return None
 
-    # Replace every regression parameters with 0 to check if the rest of the RPN is valid
-    # If parameters are overlapping (ie: the rpn contains something like "_ra _rb"), we need to do the replacement multiple times
-    rpn_check = rpn
-    while re.search(REGRESSION_PARAMETERS_REGEX, rpn_check):
-        rpn_check = re.sub(REGRESSION_PARAMETERS_REGEX, r'\g<1>0\g<3>', rpn_check)
-
-    if (error := get_rpn_errors(rpn_check, variable=parameters.variable)) is not None:
+    # The regression parameters are given at each computation, so they are checked like the variable
+    program, error = parse_program(
+        rpn,
+        variable=parameters.variable,
+        parameters=tuple(_get_unique_regression_parameters(rpn)),
+        environment=parameters.environment
+    )
+    if error is not None:
         LOGGER.error("error in the regression expression '%s' : %s", parameters.regression_expression, error)
         return None
+    LOGGER.debug("optimized RPN of the regression expression '%s': %s", parameters.regression_expression, program.optimized_rpn)
 
-    return rpn
+    return program
 
 
 def _get_fit_rpn(rpn: str, parameters_names: list[str], parameters_values: list[float]) -> str:
@@ -98,8 +98,8 @@ def _get_fit_expression(expression: str, parameters_names: list[str], parameters
 def _remove_nan(arr1: Union[list[float], np.ndarray], arr2: Union[list[float], np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
     """Remove the values of both arrays where at least one of them is nan."""
 
-    arr1 = np.array(arr1)
-    arr2 = np.array(arr2)
+    arr1 = np.asarray(arr1)
+    arr2 = np.asarray(arr2)
     not_nan_indices = ~(np.isnan(arr1) | np.isnan(arr2))
     return (arr1[not_nan_indices], arr2[not_nan_indices])
 
@@ -128,22 +128,19 @@ def compute_regressions(parameters: PlotParameters, graphs: list[Graph]) -> list
     if len(graphs) == 0:
         return []
 
-    if (rpn := _check_regression_expression(parameters)) is None:
+    if (program := _check_regression_expression(parameters)) is None:
         return []
 
     file = sys.stdout
 
-    parameters_names = _get_unique_regression_parameters(rpn)
+    rpn = program.rpn
+    parameters_names = list(program.parameters)
     parameters_names_without_prefix = [param_name[2:] for param_name in parameters_names]
 
-
     def _regression_function(xdata: np.ndarray, *regression_parameters: list[float]):
-        for (param_name, param_value) in zip(parameters_names, regression_parameters):
-            FUNCTIONS[param_name] = (0, param_value)
-
         pbar.update(1)
 
-        return compute_rpn_list(rpn, xdata, parameters.variable, progress_bar=False)
+        return compute_rpn_array(program, xdata, parameters=regression_parameters, block_size=parameters.block_size)
 
     regression_graphs: list[Graph] = []
 
@@ -191,7 +188,7 @@ def compute_regressions(parameters: PlotParameters, graphs: list[Graph]) -> list
             inputs=custom_inputs,
             type=GraphType.REGRESSION,
             expression=f'Regression [{graph.expression}]',
-            rpn=_get_fit_rpn(rpn, parameters_names, parameters_values),
+            rpn=build_program(_get_fit_rpn(rpn, parameters_names, parameters_values), variable=parameters.variable, environment=parameters.environment),
             values=_regression_function(custom_inputs, *parameters_values)
         ))
 
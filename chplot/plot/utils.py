@@ -6,6 +6,9 @@ from typing import Callable, Optional, Union
 
 import numpy as np
 
+from chplot.functions.utils import memoize
+from chplot.rpn import RpnProgram
+
 LOGGER = logging.getLogger('CHPLOT')
 
 
@@ -18,11 +21,16 @@ class GraphType(Enum):
 
 @dataclass
 class Graph:
+    # Slots instead of a __dict__, as there can be a lot of graphs (e.g. derivatives)
+    # The base graphs all share the same inputs array, which must therefore not be modified
+    __slots__ = ('inputs', 'type', 'expression', 'rpn', 'values')
+
     inputs: np.ndarray
     type: GraphType
     expression: str
-    rpn: Optional[str]
-    values: Union[list[float], np.ndarray]
+    rpn: Optional[RpnProgram]
+    # Always a contiguous float64 array, of the same size as the inputs
+    values: np.ndarray
 
 
 ZerosList = list[tuple[float, float]]
@@ -30,12 +38,14 @@ ZerosList = list[tuple[float, float]]
 NORMAL_UNRECOGNIZED_CHARACTERS = '( ),;e'
 
 
-def plottable(arg_count: int = 1) -> Callable:
+def plottable(arg_count: int = 1, cache: Union[bool, int] = False) -> Callable:
     """ Decorator allowing the function to be used with the command line interface of the chplot module.
     The function should accept a predetermined number of float and return one float (which can be nan or inf).
 
     Args:
         arg_count (int, optional): Number of (float) arguments expected by the function. Can be zero for constants. Defaults to 1.
+        cache (bool | int, optional): If True, the last results of the function are kept, so it is not computed again with the same arguments.
+        If an integer, the maximum number of results kept. Only useful for slow functions. Defaults to False.
     """
 
 
@@ -43,11 +53,17 @@ def plottable(arg_count: int = 1) -> Callable:
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             return func(*args, **kwargs)
-        return wrapper
+
+        if cache is False:
+            return wrapper
+        if cache is True:
+            return memoize(wrapper)
+        return memoize(wrapper, max_size=cache)
 
     return decorator_plottable
 
-DECORATOR_GETTER_REGEX = r'@plottable(?:\((?:arg_count=)?(\d+)\))?'
+# The number of arguments must be the first argument of the decorator
+DECORATOR_GETTER_REGEX = r'@plottable(?:\((?:arg_count=)?(\d+)?[^)]*\))?'
 FUNCTION_NAME_REGEX = r'def (.*?)\('
 
 
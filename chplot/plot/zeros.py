@@ -1,28 +1,28 @@
-import math
 import sys
+from typing import Callable
 
 import numpy as np
 
 from chplot.plot.plot_parameters import PlotParameters
 from chplot.plot.utils import _round as round
 from chplot.plot.utils import Graph, GraphType, ZerosList
-from chplot.rpn import compute_rpn_unsafe
+from chplot.rpn import uses_surrogates
 
 
 TARGET_ERROR = 1e-308
 MAX_ITERATIONS = 1000
 
 
-def _compute_simple_zero(parameters: PlotParameters, inputs: np.ndarray, rpn_tokens: list[str], zero_index: int) -> float:
+def _compute_simple_zero(inputs: np.ndarray, function: Callable[[float], float], zero_index: int) -> float:
     """Given one index where the sign changes, get the closest float value to the real zero of the function.
     Can only be accurate if the function is continuous."""
     xa, xb = map(float, inputs[zero_index:zero_index + 2]) # convert to real float for the rpn compute algorithm
-    fa = compute_rpn_unsafe(rpn_tokens, xa, variable=parameters.variable)
+    fa = function(xa)
 
     iterations = 0
     while iterations < MAX_ITERATIONS and xb - xa > TARGET_ERROR:
         xm = (xa + xb) / 2
-        fm = compute_rpn_unsafe(rpn_tokens, xm, variable=parameters.variable)
+        fm = function(xm)
         if fa * fm > 0:
             xa = xm
             fa = fm
@@ -42,7 +42,7 @@ def _compute_simple_zero_with_interpolation(graph: Graph, zero_index: int) -> fl
     return x2 - y2 / slope
 
 
-def _compute_zero_zone(parameters: PlotParameters, inputs: np.ndarray, rpn_tokens: list[str], zone_start: int, zone_end: int) -> tuple[float, float]:
+def _compute_zero_zone(inputs: np.ndarray, function: Callable[[float], float], zone_start: int, zone_end: int) -> tuple[float, float]:
     """Given an interval where the function is always zero, get the closest float value to the real start and end of this interval.
     Can only be accurate if the function is continuous."""
     # if the zone is at the start of the input, do not compute its start further as we do not go outside the x range
@@ -69,14 +69,14 @@ def _compute_zero_zone(parameters: PlotParameters, inputs: np.ndarray, rpn_token
     while (it < MAX_ITERATIONS) and ((start_xb - start_xa > TARGET_ERROR) or (end_xb - end_xa > TARGET_ERROR)):
         if compute_start:
             start_xm = (start_xa + start_xb) / 2
-            if compute_rpn_unsafe(rpn_tokens, start_xm, variable=parameters.variable) == 0:
+            if function(start_xm) == 0:
                 start_xb = start_xm
             else:
                 start_xa = start_xm
 
         if compute_end:
             end_xm = (end_xa + end_xb) / 2
-            if compute_rpn_unsafe(rpn_tokens, end_xm, variable=parameters.variable) == 0:
+            if function(end_xm) == 0:
                 end_xa = end_xm
             else:
                 end_xb = end_xm
@@ -92,13 +92,14 @@ def _compute_zeros(parameters: PlotParameters, graph: Graph) -> ZerosList:
     simple_zeros_indexes: list[int] = []    # Indexes where to compute simple zeros
     zero_zones_indexes: list[int] = []      # Indexes of zero "zones", always by two (start and end)
 
-    for index, (y1, y2) in enumerate(zip(graph.values, graph.values[1:])):
-        # No point to do anything is one is nan
-        if math.isnan(y1) or math.isnan(y2):
-            continue
-        # Same sign, no zero here
-        if y1 * y2 > 0:
-            continue
+    values = graph.values
+    # Only the indexes where the sign may change are checked: no point to do anything if one is nan, and no zero if same sign
+    with np.errstate(all='ignore'):
+        products = values[:-1] * values[1:]
+    candidate_indexes = np.flatnonzero(~(products > 0) & ~np.isnan(products))
+
+    for index in candidate_indexes.tolist():
+        y1, y2 = float(values[index]), float(values[index + 1])
         # Opposite sign, there is a simple zero
         if y1 * y2 < 0:
             simple_zeros_indexes.append(index)
@@ -131,13 +132,14 @@ def _compute_zeros(parameters: PlotParameters, graph: Graph) -> ZerosList:
         zero_zones_indexes.append(len(inputs) - 1)
 
     if graph.type in (GraphType.BASE, GraphType.REGRESSION):
-        rpn_tokens = graph.rpn.split(' ')
-        simple_zeros.extend(_compute_simple_zero(parameters, inputs, rpn_tokens, zero_index) for zero_index in simple_zeros_indexes)
+        # The program is compiled only once, as the bisections compute it a lot of times
+        function = graph.rpn.function
+        simple_zeros.extend(_compute_simple_zero(inputs, function, zero_index) for zero_index in simple_zeros_indexes)
 
         all_zeros: ZerosList = [(zero_x, None) for zero_x in simple_zeros]
         all_zeros.extend(
             _compute_zero_zone(
-                parameters, inputs, rpn_tokens,
+                inputs, function,
                 zero_zones_indexes[index], zero_zones_indexes[index + 1]
             ) for index in range(0, len(zero_zones_indexes), 2)
         )
@@ -170,10 +172,15 @@ def compute_and_print_zeros(parameters: PlotParameters, graphs: list[Graph]):
     for graph in graphs:
         zeros = _compute_zeros(parameters, graph)
         if len(zeros) == 0:
-            file.write(f'- On the interval [{round(graph.inputs.min(), 3)} ; {round(graph.inputs.max(), 3)}], the function f(x) = {graph.expression} never equals zero.\n\n')
+            file.write(f'- On the interval [{round(graph.inputs.min(), 3)} ; {round(graph.inputs.max(), 3)}], the function f(x) = {graph.expression} never equals zero.\n')
+            if uses_surrogates(graph.rpn):
+                file.write(f'    (searched with surrogates of tolerance {parameters.surrogate_tolerance})\n')
+            file.write('\n')
             continue
 
         file.write(f'- On the interval [{round(graph.inputs.min(), 3)} ; {round(graph.inputs.max(), 3)}], the function f(x) = {graph.expression} equals zero...\n')
+        if uses_surrogates(graph.rpn):
+            file.write(f'    (found with surrogates of tolerance {parameters.surrogate_tolerance}, then refined with the exact function)\n')
         for zero_start, zero_end in zeros:
             # Simple zero
             if zero_end is None:
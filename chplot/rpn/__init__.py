@@ -0,0 +1,33 @@
+from typing import Union
+
+import numpy as np
+
+from chplot.functions import DEFAULT_ENVIRONMENT
+from chplot.functions.environment import Environment
+
+from chplot.rpn.compiler import compile_rpn, compute_rpn_array_scalar
+from chplot.rpn.expression import compile_expression, CompiledExpression
+from chplot.rpn.parallel import compute_rpn_arrays_parallel
+from chplot.rpn.planner import Engine, plan_engine
+from chplot.rpn.parse_store import ParseStore, PARSE_STORE_FILENAME
+from chplot.rpn.parsing import clear_parse_cache, parse_expression, set_parse_store
+from chplot.rpn.program import build_program, get_rpn_errors, Instruction, OpCode, parse_program, RpnProgram
+from chplot.rpn.surrogate import ChebyshevSurrogate, use_surrogates, uses_surrogates
+from chplot.rpn.scalar import NUMBER_CHARS, compute_rpn_unsafe, pre_compute_rpn
+from chplot.rpn.sequences import IntegerSequence, use_integer_sequences
+from chplot.rpn.vectorized import BufferPool, compute_rpn_array, compute_rpn_arrays, DEFAULT_BLOCK_SIZE
+
+
+def compute_rpn_list(rpn: Union[str, RpnProgram], inputs: np.ndarray, variable: str = 'x', progress_bar: bool = True, vectorized: bool = True,
+                     block_size: int = DEFAULT_BLOCK_SIZE, jobs: int = 1, environment: Environment = DEFAULT_ENVIRONMENT) -> list[float]:
+    """Compute the value of the RPN for every input, by blocks of block_size inputs. If vectorized is False, the inputs are computed one by one with the compiled RPN.
+    If jobs is more than 1 and some functions do not have a vectorized version, the inputs are split between this number of processes."""
+    program = build_program(rpn, variable=variable, environment=environment) if isinstance(rpn, str) else rpn
+
+    if jobs > 1 and not program.is_vectorizable:
+        return compute_rpn_arrays_parallel([program], inputs, jobs, progress_bar=progress_bar, block_size=block_size)[0].tolist()
+
+    if vectorized:
+        return compute_rpn_array(program, inputs, progress_bar=progress_bar, block_size=block_size).tolist()
+
+    return compute_rpn_array_scalar(program, inputs, progress_bar=progress_bar).tolist()
@@ -0,0 +1,194 @@
+import ast
+import math
+from typing import Any, Callable, Hashable, Sequence, Union
+
+import numpy as np
+from tqdm import tqdm
+
+from chplot.rpn.program import allow_recursion_depth, build_program, CONDITIONAL_FUNCTIONS, get_instruction_key, Instruction, OpCode, RpnProgram
+
+
+BINARY_OPERATORS: dict[str, type[ast.operator]] = {
+    '+': ast.Add,
+    '-': ast.Sub,
+    '*': ast.Mult,
+    '/': ast.Div,
+    '^': ast.Pow,
+}
+UNARY_OPERATORS: dict[str, type[ast.unaryop]] = {
+    '+u': ast.UAdd,
+    '-u': ast.USub,
+}
+
+VARIABLE_ARGUMENT = '_x'
+
+# The body of the try block is replaced by the generated statements, and the arguments of the outer function by the bound objects
+# The generated function has the same behaviour as compute_rpn_unsafe
+COMPILED_FUNCTION_TEMPLATE = f'''
+def make_compiled_rpn():
+    def compiled_rpn({VARIABLE_ARGUMENT}):
+        try:
+            pass
+        except Exception:
+            return _nan
+        return _result if not _isinf(_result) else _nan
+    return compiled_rpn
+'''
+
+
+def _load(name: str) -> ast.Name:
+    return ast.Name(id=name, ctx=ast.Load())
+
+
+# An instruction with the sub-trees of its parameters, and the key of its sub-tree
+Node = tuple[Instruction, tuple['Node', ...], Hashable]
+
+
+def _build_tree(program: RpnProgram) -> Node:
+    stack: list[Node] = []
+    # The keys are numbered, so they do not contain the keys of the whole sub-tree, which would take long to hash in deep trees
+    key_numbers: dict[Hashable, int] = {}
+    for instruction in program.instructions:
+        children: tuple[Node, ...] = ()
+        if instruction.opcode == OpCode.CALL:
+            children = tuple(stack[-instruction.arity:])
+            del stack[-instruction.arity:]
+        key = key_numbers.setdefault(get_instruction_key(instruction, [child[2] for child in children]), len(key_numbers))
+        stack.append((instruction, children, key))
+
+    return stack[0]
+
+
+def _assign(name: str, value: ast.expr) -> ast.Assign:
+    return ast.Assign(targets=[ast.Name(id=name, ctx=ast.Store())], value=value)
+
+
+class _StatementsGenerator:
+    """Generate the statements computing a tree. Every function is called through a name bound in the closure.
+    A sub-tree appearing several times is computed only once, as with the vectorized computation, except in different branches of a conditional function."""
+
+    def __init__(self, bindings: dict[str, Any]) -> None:
+        self.bindings = bindings
+        self.bound_names: dict[int, str] = {}
+        self.temporary_count = 0
+
+    def bind(self, obj: Any) -> ast.Name:
+        if id(obj) not in self.bound_names:
+            self.bound_names[id(obj)] = f'_f{len(self.bound_names)}'
+            self.bindings[self.bound_names[id(obj)]] = obj
+        return _load(self.bound_names[id(obj)])
+
+    def _get_temporary_name(self) -> str:
+        self.temporary_count += 1
+        return f'_t{self.temporary_count}'
+
+    def generate(self, node: Node, statements: list[ast.stmt], computed_names: dict[Hashable, str]) -> ast.expr:
+        """Add to the statements the ones computing the node, and return an expression of its value, which contains only a literal or a name.
+        The computed names are the sub-trees already computed by the previous statements."""
+        instruction, children, key = node
+
+        if instruction.opcode == OpCode.LITERAL:
+            return ast.Constant(instruction.value)
+        if instruction.opcode == OpCode.VARIABLE:
+            return _load(VARIABLE_ARGUMENT)
+        if instruction.opcode == OpCode.PARAMETER:
+            return _load(f'_p{instruction.value}')
+        if key in computed_names:
+            return _load(computed_names[key])
+
+        if instruction.conditional:
+            statement, temporary_name = self._generate_conditional(instruction, children, statements, computed_names)
+        else:
+            parameters = [self.generate(child, statements, computed_names) for child in children]
+            temporary_name = self._get_temporary_name()
+            statement = _assign(temporary_name, self._generate_call(instruction, parameters))
+
+        statements.append(statement)
+        computed_names[key] = temporary_name
+        return _load(temporary_name)
+
+    def _generate_call(self, instruction: Instruction, parameters: list[ast.expr]) -> ast.expr:
+        token = instruction.token
+        if token in BINARY_OPERATORS:
+            value = ast.BinOp(left=parameters[0], op=BINARY_OPERATORS[token](), right=parameters[1])
+            # A power can be complex, and must be converted like any function result
+            if token == '^':
+                value = ast.Call(func=_load('_float'), args=[value], keywords=[])
+            return value
+        if token in UNARY_OPERATORS:
+            return ast.UnaryOp(op=UNARY_OPERATORS[token](), operand=parameters[0])
+
+        return ast.Call(func=_load('_float'), args=[ast.Call(func=self.bind(instruction.function), args=parameters, keywords=[])], keywords=[])
+
+    def _generate_conditional(self, instruction: Instruction, children: tuple[Node, ...], statements: list[ast.stmt],
+                              computed_names: dict[Hashable, str]) -> tuple[ast.If, str]:
+        """Return the if statement computing only the chosen branch, and the name of its result. It is nan if a parameter choosing the branch is nan."""
+        selectors = [self.generate(child, statements, computed_names) for child in children[:-2]]
+        temporary_name = self._get_temporary_name()
+
+        branches_statements: list[list[ast.stmt]] = []
+        for branch in children[-2:]:
+            # The sub-trees computed in a branch are not computed in the other one
+            branch_statements: list[ast.stmt] = []
+            value = self.generate(branch, branch_statements, dict(computed_names))
+            branch_statements.append(_assign(temporary_name, value))
+            branches_statements.append(branch_statements)
+
+        nan_tests = [ast.Call(func=_load('_isnan'), args=[selector], keywords=[]) for selector in selectors]
+        nan_test = nan_tests[0] if len(nan_tests) == 1 else ast.BoolOp(op=ast.Or(), values=nan_tests)
+        choice = ast.Call(func=self.bind(CONDITIONAL_FUNCTIONS[instruction.token]), args=selectors, keywords=[])
+
+        statement = ast.If(
+            test=nan_test,
+            body=[_assign(temporary_name, _load('_nan'))],
+            orelse=[ast.If(test=choice, body=branches_statements[0], orelse=branches_statements[1])]
+        )
+        return (statement, temporary_name)
+
+
+def _generate_statements(program: RpnProgram, bindings: dict[str, Any]) -> list[ast.stmt]:
+    """Return the statements computing the program in the variable '_result'."""
+    statements: list[ast.stmt] = []
+    with allow_recursion_depth(len(program.instructions)):
+        value = _StatementsGenerator(bindings).generate(_build_tree(program), statements, {})
+    statements.append(_assign('_result', value))
+    return statements
+
+
+def compile_program(program: RpnProgram) -> Callable[..., float]:
+    """Compile the program into a Python function taking the variable then the parameters, which is equivalent to compute_rpn_unsafe but much faster.
+    Literals are inlined, and functions are bound as closure variables, so the RPN is not read again at each call.
+    Prefer using program.function, which compiles the program only once."""
+    bindings: dict[str, Any] = {'_float': float, '_isinf': math.isinf, '_isnan': math.isnan, '_nan': math.nan}
+    statements = _generate_statements(program, bindings)
+
+    module = ast.parse(COMPILED_FUNCTION_TEMPLATE)
+    outer_function: ast.FunctionDef = module.body[0]
+    outer_function.args.args = [ast.arg(arg=name) for name in bindings]
+    compiled_function: ast.FunctionDef = outer_function.body[0]
+    compiled_function.args.args.extend(ast.arg(arg=f'_p{index}') for index in range(len(program.parameters)))
+    try_block: ast.Try = compiled_function.body[0]
+    try_block.body = statements
+    ast.fix_missing_locations(module)
+
+    namespace: dict[str, Any] = {}
+    exec(compile(module, filename='<rpn>', mode='exec'), namespace)
+    return namespace['make_compiled_rpn'](*bindings.values())
+
+
+def compile_rpn(rpn: Union[str, RpnProgram], variable: str = 'x') -> Callable[..., float]:
+    """Compile the RPN into a Python function of one float, which is equivalent to compute_rpn_unsafe but much faster.
+    This function can crash as it will not check for problems. Use get_rpn_errors first to know if the RPN is valid."""
+    if isinstance(rpn, str):
+        rpn = build_program(rpn, variable=variable)
+
+    return rpn.function
+
+
+def compute_rpn_array_scalar(program: RpnProgram, inputs: np.ndarray, parameters: Sequence[float] = (), progress_bar: bool = False) -> np.ndarray:
+    """Compute the value of the program for every input one by one with its compiled function. It is faster than working on arrays for a few points only."""
+    function = program.function
+    inputs = np.asarray(inputs, dtype=float)
+    inputs_iter = tqdm(inputs, total=inputs.size, leave=False) if progress_bar else inputs
+
+    return np.fromiter((function(float(x), *parameters) for x in inputs_iter), dtype=float, count=inputs.size)
@@ -0,0 +1,108 @@
+from functools import cached_property
+from typing import Mapping, Optional, Union
+
+import numpy as np
+
+from chplot.functions import DEFAULT_ENVIRONMENT, load_necessary_functions
+from chplot.functions.environment import Environment
+from chplot.functions.utils import FunctionDict
+from chplot.rpn.compiler import compute_rpn_array_scalar
+from chplot.rpn.parallel import compute_rpn_arrays_parallel
+from chplot.rpn.parsing import parse_expression
+from chplot.rpn.planner import Engine, plan_engine
+from chplot.rpn.program import build_program, OpCode, RpnProgram
+from chplot.rpn.vectorized import compute_rpn_array
+
+
+class CompiledExpression:
+    """Expression ready to be computed on a float or a numpy array, with the fastest engine for the number of points.
+    It can be pickled (e.g. to be sent to other processes) if its plugins can: only the RPN and the user functions it uses are kept, and the program is built again."""
+
+    def __init__(self, expression: str, variable: Optional[str], rpn: str, user_functions: FunctionDict, jobs: int = 1, exact_mpmath: bool = False) -> None:
+        self.expression = expression
+        self.variable = variable
+        self.rpn = rpn
+        # Only the constants and plugins used by the expression
+        self.user_functions = user_functions
+        self.jobs = jobs
+        self.exact_mpmath = exact_mpmath
+
+    @cached_property
+    def program(self) -> RpnProgram:
+        load_necessary_functions([self.rpn])
+        environment = DEFAULT_ENVIRONMENT.with_functions(self.user_functions).with_exact_mpmath(self.exact_mpmath)
+        return build_program(self.rpn, variable=self.variable, environment=environment)
+
+    @property
+    def functions(self) -> tuple[str, ...]:
+        """The names of the functions used by the expression, in order of appearance (the constants are already replaced by their values)."""
+        return tuple(dict.fromkeys(instruction.token for instruction in self.program.instructions if instruction.opcode == OpCode.CALL))
+
+    @property
+    def is_vectorizable(self) -> bool:
+        """True if every function of the expression works on whole arrays, so it is fast on many points."""
+        return self.program.is_vectorizable
+
+    def __call__(self, x: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """Return the value of the expression for a float, or an array of the same shape for an array. As in the plots, it is nan where the expression is not defined."""
+        if np.ndim(x) == 0:
+            return self.program.function(float(x))
+
+        inputs = np.asarray(x, dtype=float)
+        engine, _ = plan_engine(self.program, inputs.size, jobs=self.jobs)
+        if engine == Engine.SCALAR:
+            values = compute_rpn_array_scalar(self.program, inputs.ravel())
+        elif engine == Engine.PARALLEL:
+            values = compute_rpn_arrays_parallel([self.program], inputs.ravel(), self.jobs)[0]
+        else:
+            values = compute_rpn_array(self.program, inputs.ravel())
+
+        return values.reshape(inputs.shape)
+
+    def __getstate__(self) -> dict:
+        # The program contains the compiled function, which cannot be pickled
+        state = self.__dict__.copy()
+        state.pop('program', None)
+        return state
+
+    def __repr__(self) -> str:
+        return f'CompiledExpression({self.expression!r}, variable={self.variable!r})'
+
+
+def _get_constants(constants: Mapping[str, Union[float, str]], environment: Environment) -> FunctionDict:
+    """Return the constants given either as values or expressions, which can use the previous constants."""
+    constants_function_dict: FunctionDict = {}
+    for name, value in constants.items():
+        if isinstance(value, str):
+            value = compile_expression(value, variable=None, plugins=dict(constants_function_dict), environment=environment)(0.0)
+        constants_function_dict[name] = (0, float(value))
+
+    return constants_function_dict
+
+
+def compile_expression(expression: str, variable: Optional[str] = 'x', constants: Optional[Mapping[str, Union[float, str]]] = None,
+                       plugins: Optional[FunctionDict] = None, jobs: int = 1, exact_mpmath: bool = False,
+                       environment: Environment = DEFAULT_ENVIRONMENT) -> CompiledExpression:
+    """Compile the expression into a callable computing it on a float or a numpy array, without plotting anything.
+    The constants are values or expressions (which can use the previous constants), and the plugins are other functions with their number of parameters,
+    as {'name': (arg_count, func)}. On many points, the functions without vectorized version are computed with up to jobs processes.
+    If exact_mpmath is True, the mpmath functions are computed with mpmath at full precision even on arrays, instead of their double precision or machine floats versions.
+    Raise a ValueError if the expression is not valid."""
+    try:
+        rpn = parse_expression(expression, variable=variable)
+    except Exception as exception:
+        raise ValueError(f"cannot parse expression '{expression}'") from exception
+
+    user_functions = {**environment.user_functions, **(plugins or {})}
+    user_functions.update(_get_constants(constants or {}, environment.with_functions(user_functions)))
+
+    tokens = rpn.split(' ')
+    compiled_expression = CompiledExpression(
+        expression, variable, rpn,
+        {name: function for name, function in user_functions.items() if name in tokens},
+        jobs=jobs,
+        exact_mpmath=exact_mpmath or environment.exact_mpmath
+    )
+    # Build the program now, so the errors are raised by this function
+    compiled_expression.program
+    return compiled_expression
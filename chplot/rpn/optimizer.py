@@ -0,0 +1,298 @@
+import math
+from typing import Optional, Union
+
+import numpy as np
+
+from chplot.functions.environment import Environment
+from chplot.rpn.program import Instruction, OpCode
+
+
+# An instruction with the sub-trees of its parameters
+Node = tuple[Instruction, tuple['Node', ...]]
+# Coefficient of each degree of a polynomial in the variable, None meaning 1
+Polynomial = dict[int, Optional[Node]]
+
+# Integer powers replaced by multiplications, above this absolute value the power is faster
+MAX_EXPANDED_POWER = 4
+# A polynomial is computed in Horner form only if it does not need more than this number of multiplications by term
+# Otherwise, such as for x^100 + 1, computing the powers is faster
+MAX_HORNER_MULTIPLICATIONS_PER_TERM = 4
+
+
+def _build_tree(instructions: list[Instruction]) -> Node:
+    stack: list[Node] = []
+    for instruction in instructions:
+        if instruction.opcode == OpCode.CALL:
+            children = tuple(stack[-instruction.arity:])
+            del stack[-instruction.arity:]
+            stack.append((instruction, children))
+        else:
+            stack.append((instruction, ()))
+
+    return stack[0]
+
+
+def _flatten_tree(node: Node, instructions: list[Instruction]) -> None:
+    instruction, children = node
+    for child in children:
+        _flatten_tree(child, instructions)
+    instructions.append(instruction)
+
+
+def _literal(value: float) -> Node:
+    return (Instruction(OpCode.LITERAL, str(value), value=value), ())
+
+
+def _call(token: str, *children: Node, environment: Environment) -> Node:
+    if token == 'sqrt' and token not in environment:
+        # Not always loaded, as only the power is in the expression
+        function, vectorized = math.sqrt, np.sqrt
+    else:
+        function, vectorized = environment[token][1], environment.get_vectorized(token)
+
+    return (Instruction(OpCode.CALL, token, arity=len(children), function=function, vectorized=vectorized), children)
+
+
+def _is_literal(node: Node, value: Optional[float] = None) -> bool:
+    instruction = node[0]
+    return instruction.opcode == OpCode.LITERAL and (value is None or instruction.value == value)
+
+
+def _split_term(node: Node, token: str) -> Optional[tuple[Node, float]]:
+    """Return the sub-tree and the constant of a node 'e c +' or 'c e +' (or '-' and '*' similarly), None if it is not one."""
+    instruction, children = node
+    if instruction.opcode != OpCode.CALL or instruction.token not in (('+', '-') if token == '+' else (token,)):
+        return None
+
+    left, right = children
+    if _is_literal(right):
+        return (left, -right[0].value if instruction.token == '-' else right[0].value)
+    if _is_literal(left) and instruction.token != '-':
+        return (right, left[0].value)
+    return None
+
+
+def _reassociate(node: Node, token: str, environment: Environment) -> Optional[Node]:
+    """Merge the constants of two nested additions (or multiplications): 'e c1 + c2 +' becomes 'e c +' with c = c1 + c2."""
+    if (outer := _split_term(node, token)) is None or (inner := _split_term(outer[0], token)) is None:
+        return None
+
+    base, inner_constant = inner
+    constant = inner_constant + outer[1] if token == '+' else inner_constant * outer[1]
+    # The constants are not merged if it changes an overflow into a valid value or the opposite
+    if not math.isfinite(constant):
+        return None
+    if constant == (0 if token == '+' else 1):
+        return base
+
+    return _call(token, base, _literal(float(constant)), environment=environment)
+
+
+def _expand_power(base: Node, exponent: int, environment: Environment) -> Node:
+    """Return the multiplications computing the base to the given positive integer power, by squaring.
+    The base appears several times, but it is only computed once as common sub-trees are computed once."""
+    if exponent == 1:
+        return base
+
+    half = _expand_power(base, exponent // 2, environment)
+    square = _call('*', half, half, environment=environment)
+    return square if exponent % 2 == 0 else _call('*', square, base, environment=environment)
+
+
+def _multiply_coefficients(first: Optional[Node], second: Optional[Node], environment: Environment) -> Optional[Node]:
+    if first is None:
+        return second
+    if second is None:
+        return first
+    return _call('*', first, second, environment=environment)
+
+
+def _negate_polynomial(polynomial: Polynomial, environment: Environment) -> Polynomial:
+    return {degree: _literal(-1.0) if coefficient is None else _call('-u', coefficient, environment=environment) for degree, coefficient in polynomial.items()}
+
+
+def _add_polynomials(first: Polynomial, second: Polynomial, environment: Environment) -> Polynomial:
+    result = dict(first)
+    for degree, coefficient in second.items():
+        if degree in result:
+            result[degree] = _call('+', result[degree] or _literal(1.0), coefficient or _literal(1.0), environment=environment)
+        else:
+            result[degree] = coefficient
+    return result
+
+
+def _get_horner_form(polynomial: Polynomial, variable: Node, environment: Environment) -> Node:
+    """Return the polynomial as a_n x^n + ... + a_0 = (...(a_n x + a_n-1) x + ...) x + a_0, computed with one multiplication by degree."""
+    degree = max(polynomial)
+    result = polynomial[degree]
+    for power in range(degree - 1, -1, -1):
+        result = variable if result is None else _call('*', result, variable, environment=environment)
+        if power in polynomial:
+            result = _call('+', result, polynomial[power] or _literal(1.0), environment=environment)
+
+    return result
+
+
+class _HornerRewriter:
+    """Rewrite the polynomials in the variable in Horner form. The results of the searches are kept for each node,
+    as the sub-trees of a sum which is not a polynomial are searched again (e.g. long sums of many terms would take quadratic time)."""
+
+    def __init__(self, environment: Environment) -> None:
+        self.environment = environment
+        # The nodes are kept with the results, so their ids cannot be reused
+        self._variables: dict[int, tuple[Node, Optional[Node]]] = {}
+        self._polynomials: dict[int, tuple[Node, Optional[Polynomial]]] = {}
+
+    def find_variable(self, node: Node) -> Optional[Node]:
+        if id(node) not in self._variables:
+            instruction, children = node
+            variable = node if instruction.opcode == OpCode.VARIABLE else None
+            for child in children:
+                if variable is None:
+                    variable = self.find_variable(child)
+            self._variables[id(node)] = (node, variable)
+        return self._variables[id(node)][1]
+
+    def get_polynomial(self, node: Node) -> Optional[Polynomial]:
+        if id(node) not in self._polynomials:
+            self._polynomials[id(node)] = (node, self._get_polynomial(node))
+        return self._polynomials[id(node)][1]
+
+    def _get_polynomial(self, node: Node) -> Optional[Polynomial]:
+        """Return the coefficients of the node if it is a polynomial in the variable, None if it is not.
+        The coefficients are any sub-trees without the variable (e.g. regression parameters). Products are only expanded if one side has a single term."""
+        instruction, children = node
+        if self.find_variable(node) is None:
+            return {0: node}
+        if instruction.opcode == OpCode.VARIABLE:
+            return {1: None}
+        if self.environment.is_user_function(instruction.token):
+            return None
+
+        token = instruction.token
+        if token in ('+u', '-u'):
+            if (polynomial := self.get_polynomial(children[0])) is None:
+                return None
+            return polynomial if token == '+u' else _negate_polynomial(polynomial, self.environment)
+
+        if token in ('+', '-', '*'):
+            if (left := self.get_polynomial(children[0])) is None or (right := self.get_polynomial(children[1])) is None:
+                return None
+            if token != '*':
+                return _add_polynomials(left, right if token == '+' else _negate_polynomial(right, self.environment), self.environment)
+            if len(left) > 1 and len(right) > 1:
+                return None
+            # The single term is on the left
+            if len(left) > 1:
+                left, right = right, left
+            (left_degree, left_coefficient), = left.items()
+            return {left_degree + degree: _multiply_coefficients(left_coefficient, coefficient, self.environment) for degree, coefficient in right.items()}
+
+        if token == '^':
+            base, exponent = children
+            if not _is_literal(exponent) or not float(exponent[0].value).is_integer() or exponent[0].value < 1:
+                return None
+            # Only a power of the variable alone, so that the coefficients are not raised to the power
+            if (polynomial := self.get_polynomial(base)) is None or list(polynomial.items()) != [(1, None)]:
+                return None
+            return {int(exponent[0].value): None}
+
+        return None
+
+    def use_horner_form(self, node: Node) -> Node:
+        """Rewrite the largest polynomial sub-trees in Horner form."""
+        instruction, children = node
+        if instruction.opcode != OpCode.CALL:
+            return node
+
+        # A polynomial of several terms is a sum at its root
+        if instruction.token in ('+', '-') and not self.environment.is_user_function(instruction.token) and (polynomial := self.get_polynomial(node)) is not None:
+            degree = max(polynomial)
+            if len(polynomial) > 1 and 2 <= degree <= MAX_HORNER_MULTIPLICATIONS_PER_TERM * len(polynomial):
+                return _get_horner_form(polynomial, self.find_variable(node), self.environment)
+
+        return (instruction, tuple(self.use_horner_form(child) for child in children))
+
+
+def _simplify_call(instruction: Instruction, children: tuple[Node, ...], environment: Environment) -> Node:
+    token = instruction.token
+    node = (instruction, children)
+
+    if token == '+u':
+        return children[0]
+
+    if token == '-u':
+        child_instruction, child_children = children[0]
+        if child_instruction.opcode == OpCode.CALL and child_instruction.token == '-u':
+            return child_children[0]
+        return node
+
+    if token not in ('+', '-', '*', '/', '^'):
+        return node
+
+    left, right = children
+
+    if token in ('+', '-'):
+        if _is_literal(right, 0):
+            return left
+        if _is_literal(left, 0):
+            return right if token == '+' else _simplify_call(*_call('-u', right, environment=environment), environment)
+        # 'a b -u +' is 'a b -', and 'a b -u -' is 'a b +'
+        if right[0].opcode == OpCode.CALL and right[0].token == '-u':
+            return _simplify_call(*_call('-' if token == '+' else '+', left, right[1][0], environment=environment), environment)
+        return _reassociate(node, '+', environment) or node
+
+    if token == '*':
+        for factor, other in ((right, left), (left, right)):
+            if _is_literal(factor, 1):
+                return other
+            if _is_literal(factor, -1):
+                return _simplify_call(*_call('-u', other, environment=environment), environment)
+        return _reassociate(node, '*', environment) or node
+
+    if token == '/':
+        if _is_literal(right, 1):
+            return left
+        if _is_literal(right, -1):
+            return _simplify_call(*_call('-u', left, environment=environment), environment)
+        return node
+
+    # Power
+    if not _is_literal(right):
+        return node
+
+    exponent: Union[int, float] = right[0].value
+    if exponent == 1:
+        return left
+    if exponent == 0.5 and not environment.is_user_function('sqrt'):
+        return _call('sqrt', left, environment=environment)
+    if float(exponent).is_integer() and 2 <= abs(exponent) <= MAX_EXPANDED_POWER:
+        power = _expand_power(left, int(abs(exponent)), environment)
+        return power if exponent > 0 else _call('/', _literal(1.0), power, environment=environment)
+
+    return node
+
+
+def _simplify_tree(node: Node, environment: Environment) -> Node:
+    instruction, children = node
+    if instruction.opcode != OpCode.CALL:
+        return node
+
+    children = tuple(_simplify_tree(child, environment) for child in children)
+    # The user functions may be anything, even with the name of an operator
+    if environment.is_user_function(instruction.token):
+        return (instruction, children)
+
+    return _simplify_call(instruction, children, environment)
+
+
+def simplify_instructions(instructions: list[Instruction], environment: Environment) -> list[Instruction]:
+    """Return the instructions with polynomials in the variable computed in Horner form, algebraic identities removed ('x 1 *', 'x 0 +', 'x -u -u', ...),
+    the constants of nested additions and multiplications merged, small integer powers replaced by multiplications, and square roots computed with 'sqrt' instead of a power.
+    A rewriting is never done if it can change where the result is nan: for instance 'x 0 *' is kept, as it is nan where x is."""
+    if not instructions:
+        return instructions
+
+    simplified: list[Instruction] = []
+    _flatten_tree(_simplify_tree(_HornerRewriter(environment).use_horner_form(_build_tree(instructions)), environment), simplified)
+    return simplified
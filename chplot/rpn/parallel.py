@@ -0,0 +1,99 @@
+from concurrent.futures import as_completed, ProcessPoolExecutor
+from typing import Optional, Sequence
+
+import numpy as np
+from tqdm import tqdm
+
+from chplot.functions import DEFAULT_ENVIRONMENT, load_necessary_functions
+from chplot.functions.utils import FunctionDict
+from chplot.rpn.program import build_program, RpnProgram
+from chplot.rpn.sequences import IntegerSequence, use_integer_sequences
+from chplot.rpn.surrogate import describe_surrogates, SurrogatesDescription, use_described_surrogates
+from chplot.rpn.vectorized import compute_rpn_array, DEFAULT_BLOCK_SIZE, SCALAR_BATCH_SIZE
+
+
+# Each process computes several shards, so that the work stays balanced and the progress bar is updated regularly
+SHARDS_PER_JOB = 8
+
+# Programs of the current worker process, in the same order as given to the pool
+_WORKER_PROGRAMS: list[RpnProgram] = []
+
+# RPN, variable, exact mpmath functions, integer sequences computed from tables and surrogates of a program
+ProgramDescription = tuple[str, Optional[str], bool, bool, Optional[SurrogatesDescription]]
+
+
+def _describe_program(program: RpnProgram) -> ProgramDescription:
+    """Return what is needed to build the same program in a worker process, as the programs themselves cannot be pickled."""
+    integer_sequences = any(isinstance(instruction.vectorized, IntegerSequence) for instruction in program.instructions)
+    return (program.rpn, program.variable, program.environment.exact_mpmath, integer_sequences, describe_surrogates(program))
+
+
+def _initialize_worker(descriptions: list[ProgramDescription], user_functions: FunctionDict) -> None:
+    """Load in the worker process only the functions needed by the RPNs, then build their programs as they were in the main process."""
+    load_necessary_functions([description[0] for description in descriptions])
+    environment = DEFAULT_ENVIRONMENT.with_functions(user_functions)
+
+    for rpn, variable, exact_mpmath, integer_sequences, surrogates in descriptions:
+        program = build_program(rpn, variable=variable, environment=environment.with_exact_mpmath(exact_mpmath))
+        if integer_sequences:
+            program, _ = use_integer_sequences(program)
+        if surrogates is not None:
+            program = use_described_surrogates(program, surrogates)
+        _WORKER_PROGRAMS.append(program)
+
+
+def _compute_shard(program_index: int, shard: np.ndarray, block_size: int) -> np.ndarray:
+    return compute_rpn_array(_WORKER_PROGRAMS[program_index], shard, block_size=block_size)
+
+
+def _get_user_functions(programs: Sequence[RpnProgram]) -> FunctionDict:
+    """Return the user functions used by the programs, as they are not known by the worker processes."""
+    user_functions: FunctionDict = {}
+    for program in programs:
+        user_functions.update(
+            (name, function) for name, function in program.environment.user_functions.items()
+            if name in program.rpn.split(' ')
+        )
+
+    return user_functions
+
+
+def compute_rpn_arrays_parallel(programs: Sequence[RpnProgram], inputs: np.ndarray, jobs: int, progress_bar: bool = False,
+                                block_size: int = DEFAULT_BLOCK_SIZE) -> list[np.ndarray]:
+    """Compute the values of every program for all the inputs, with a pool of the given number of processes.
+    The inputs are split into shards computed independently, then put back together in order.
+    It is only worth it for programs using functions without vectorized version, as the processes take some time to start."""
+    inputs = np.asarray(inputs, dtype=float)
+    if not programs:
+        return []
+
+    shard_count = max(1, min(jobs * SHARDS_PER_JOB, inputs.size // SCALAR_BATCH_SIZE))
+    shards = np.array_split(inputs, shard_count)
+
+    pbar: Optional[tqdm] = None
+    if progress_bar:
+        pbar = tqdm(total=inputs.size * len(programs), leave=False)
+
+    results: list[list[Optional[np.ndarray]]] = [[None] * shard_count for _ in programs]
+
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_initialize_worker,
+        initargs=([_describe_program(program) for program in programs], _get_user_functions(programs))
+    ) as executor:
+        futures = {
+            executor.submit(_compute_shard, program_index, shard, block_size): (program_index, shard_index)
+            for program_index in range(len(programs))
+            for shard_index, shard in enumerate(shards)
+        }
+
+        for future in as_completed(futures):
+            program_index, shard_index = futures[future]
+            results[program_index][shard_index] = future.result()
+            if pbar is not None:
+                pbar.update(shards[shard_index].size)
+
+    if pbar is not None:
+        pbar.close()
+
+    return [np.concatenate(shard_results) for shard_results in results]
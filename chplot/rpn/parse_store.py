@@ -0,0 +1,125 @@
+import functools
+import hashlib
+import importlib.metadata
+import pathlib
+import sqlite3
+import time
+from typing import Optional, Union
+
+from shunting_yard import MismatchedBracketsError
+
+
+PARSE_STORE_FILENAME = 'expressions.sqlite'
+# Entries not used for this number of days are removed
+DEFAULT_MAX_AGE = 30
+DEFAULT_MAX_ENTRIES = 100_000
+
+# Kinds of the stored results, so that the same exception can be raised again
+RPN_RESULT = 0
+MISMATCHED_BRACKETS_RESULT = 1
+ERROR_RESULT = 2
+
+ParseKey = tuple[str, Optional[str], bool]
+
+
+@functools.lru_cache(maxsize=None)
+def _get_sources_hash() -> str:
+    """Return a hash of the source files of chplot, which changes with the code even if the version does not (e.g. in a checkout not installed)."""
+    package_dir = pathlib.Path(__file__).resolve().parents[1]
+    sources_hash = hashlib.sha256()
+    for path in sorted(package_dir.rglob('*.py')):
+        sources_hash.update(path.relative_to(package_dir).as_posix().encode('utf-8'))
+        sources_hash.update(path.read_bytes())
+
+    return sources_hash.hexdigest()[:16]
+
+
+def get_library_version(library: str) -> str:
+    """Return the installed version of the library, or 'unknown'. The version of chplot also contains the hash of its sources."""
+    try:
+        version = importlib.metadata.version(library)
+    except importlib.metadata.PackageNotFoundError:
+        version = 'unknown'
+
+    if library == 'chplot':
+        version = f'{version}+{_get_sources_hash()}'
+    return version
+
+
+def _get_row_key(key: ParseKey, version: str) -> tuple[str, str, int, str]:
+    expression, variable, convert_scientific_notation = key
+    # NULL values are all different in a primary key, so no variable is stored as an empty string
+    return (expression, variable if variable is not None else '', int(convert_scientific_notation), version)
+
+
+class ParseStore:
+    """On-disk store of the RPN of the expressions, so that they are not parsed again in later runs.
+    The entries also depend on the chplot (and its sources) and shunting_yard versions, as they may change the parsing.
+    New and used entries are only written when calling save, in a single transaction."""
+
+    def __init__(self, path: str, max_age: float = DEFAULT_MAX_AGE, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.path = path
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.version = f"{get_library_version('chplot')}/{get_library_version('shunting_yard')}"
+
+        self._new_entries: dict[ParseKey, tuple[int, str]] = {}
+        self._used_keys: set[ParseKey] = set()
+
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS expressions ('
+            'expression TEXT NOT NULL, variable TEXT NOT NULL, convert_scientific_notation INTEGER NOT NULL, version TEXT NOT NULL, '
+            'kind INTEGER NOT NULL, result TEXT NOT NULL, last_used REAL NOT NULL, '
+            'PRIMARY KEY (expression, variable, convert_scientific_notation, version))'
+        )
+
+    def get(self, key: ParseKey) -> Optional[Union[str, Exception]]:
+        """Return the stored RPN or exception of the key, or None if it is not stored."""
+        row = self._connection.execute(
+            'SELECT kind, result FROM expressions WHERE expression = ? AND variable = ? AND convert_scientific_notation = ? AND version = ?',
+            _get_row_key(key, self.version)
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        self._used_keys.add(key)
+        kind, result = row
+        if kind == MISMATCHED_BRACKETS_RESULT:
+            return MismatchedBracketsError(result)
+        if kind == ERROR_RESULT:
+            return ValueError(result)
+        return result
+
+    def add(self, key: ParseKey, result: Union[str, Exception]) -> None:
+        if isinstance(result, MismatchedBracketsError):
+            self._new_entries[key] = (MISMATCHED_BRACKETS_RESULT, str(result))
+        elif isinstance(result, Exception):
+            self._new_entries[key] = (ERROR_RESULT, str(result))
+        else:
+            self._new_entries[key] = (RPN_RESULT, result)
+
+    def save(self) -> None:
+        """Write the new entries and the last use of the used ones, then remove the entries too old or the least recently used ones if there are too many."""
+        now = time.time()
+        with self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO expressions VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(*_get_row_key(key, self.version), kind, result, now) for key, (kind, result) in self._new_entries.items()]
+            )
+            self._connection.executemany(
+                'UPDATE expressions SET last_used = ? WHERE expression = ? AND variable = ? AND convert_scientific_notation = ? AND version = ?',
+                [(now, *_get_row_key(key, self.version)) for key in self._used_keys]
+            )
+            self._connection.execute('DELETE FROM expressions WHERE last_used < ?', (now - self.max_age * 86400,))
+            self._connection.execute(
+                'DELETE FROM expressions WHERE rowid NOT IN (SELECT rowid FROM expressions ORDER BY last_used DESC LIMIT ?)',
+                (self.max_entries,)
+            )
+
+        self._new_entries.clear()
+        self._used_keys.clear()
+
+    def close(self) -> None:
+        self._connection.close()
@@ -0,0 +1,75 @@
+from collections import OrderedDict
+from typing import Optional, Union
+
+from shunting_yard import shunting_yard
+
+from chplot.rpn.parse_store import ParseStore
+
+
+# Maximum number of expressions kept in the cache below, the least recently used ones are removed first
+MAX_PARSE_CACHE_SIZE = 4096
+
+# An exception raised by the parsing, kept as its type and arguments so that a new one is raised each time
+ParseError = tuple[type[Exception], tuple]
+
+# Result of the parsing of the last (expression, variable, scientific notation conversion) used, which is either the RPN or the raised exception
+_PARSE_CACHE: OrderedDict[tuple[str, Optional[str], bool], Union[str, ParseError]] = OrderedDict()
+# Optional on-disk store, used when an expression is not in the cache above
+_PARSE_STORE: Optional[ParseStore] = None
+
+
+def set_parse_store(store: Optional[ParseStore]) -> None:
+    """Set the on-disk store used by parse_expression, or remove it if None."""
+    global _PARSE_STORE
+    _PARSE_STORE = store
+
+
+def parse_expression(expression: str, variable: Optional[str] = 'x', convert_scientific_notation: bool = True) -> str:
+    """Return the RPN of the expression, and raise the same exceptions as shunting_yard.
+    Each expression is only parsed once with the same variable and scientific notation conversion, even if it is used in several places.
+    If a store is set with set_parse_store, the expressions parsed in previous runs are not parsed again."""
+    key = (expression, variable, convert_scientific_notation)
+
+    if key in _PARSE_CACHE:
+        _PARSE_CACHE.move_to_end(key)
+    else:
+        _PARSE_CACHE[key] = _get_cached_result(_parse_expression(key))
+        if len(_PARSE_CACHE) > MAX_PARSE_CACHE_SIZE:
+            _PARSE_CACHE.popitem(last=False)
+
+    result = _PARSE_CACHE[key]
+    if isinstance(result, tuple):
+        exception_type, arguments = result
+        raise exception_type(*arguments)
+
+    return result
+
+
+def _parse_expression(key: tuple[str, Optional[str], bool]) -> Union[str, Exception]:
+    """Return the RPN or the exception raised by the parsing, from the store if it has it."""
+    if _PARSE_STORE is not None and (stored_result := _PARSE_STORE.get(key)) is not None:
+        return stored_result
+
+    expression, variable, convert_scientific_notation = key
+    try:
+        result = shunting_yard(
+            expression=expression,
+            case_sensitive=True,
+            variable=variable,
+            convert_scientific_notation=convert_scientific_notation
+        )
+    except Exception as exception:
+        result = exception
+
+    if _PARSE_STORE is not None:
+        _PARSE_STORE.add(key, result)
+    return result
+
+
+def _get_cached_result(result: Union[str, Exception]) -> Union[str, ParseError]:
+    # The exception itself is not kept, as raising it again would add to its traceback
+    return result if isinstance(result, str) else (type(result), result.args)
+
+
+def clear_parse_cache() -> None:
+    _PARSE_CACHE.clear()
@@ -0,0 +1,58 @@
+from enum import Enum
+from typing import Optional
+
+from chplot.functions.environment import FunctionKind
+from chplot.rpn.program import OpCode, RpnProgram
+from chplot.rpn.vectorized import SCALAR_BATCH_SIZE
+
+
+class Engine(Enum):
+    # Every point computed one by one with the compiled function
+    SCALAR = 'scalar'
+    # Blocks of points computed at once, the functions without vectorized version being applied point by point
+    VECTORIZED = 'vectorized'
+    # Points split between several processes, each of them using the vectorized engine
+    PARALLEL = 'parallel'
+
+
+# Up to this number of points, numpy calls cost more than computing every point with the compiled function
+MAX_SCALAR_POINTS = 64
+# Below this number of points, starting the processes costs more than what they save
+MIN_PARALLEL_POINTS = 2 * SCALAR_BATCH_SIZE
+
+
+def _add_scalar_function_kinds(program: RpnProgram, kinds: dict[str, FunctionKind]) -> None:
+    for instruction in program.instructions:
+        if instruction.opcode == OpCode.CALL and instruction.vectorized is None and not instruction.conditional:
+            kinds[instruction.token] = program.environment.get_kind(instruction.token)
+        # The terms of a reduction are computed on whole arrays only if its body is vectorizable
+        if instruction.body is not None:
+            _add_scalar_function_kinds(instruction.body, kinds)
+
+
+def _describe_scalar_functions(program: RpnProgram) -> str:
+    """Return the functions of the program computed point by point with their kind, e.g. "'zeta' (mpmath), 'f' (user)"."""
+    kinds: dict[str, FunctionKind] = {}
+    _add_scalar_function_kinds(program, kinds)
+    return ', '.join(f"'{token}' ({kind.value})" for token, kind in kinds.items())
+
+
+def plan_engine(program: RpnProgram, points: int, jobs: int = 1, engine: Optional[Engine] = None) -> tuple[Engine, str]:
+    """Return the fastest engine to compute the program on the given number of points with at most this number of processes, and the reason of the choice.
+    If an engine is given, it is always chosen."""
+    if engine is not None:
+        return (engine, 'chosen by the user')
+
+    if points <= MAX_SCALAR_POINTS:
+        return (Engine.SCALAR, f'only {points} points')
+
+    if program.is_vectorizable:
+        return (Engine.VECTORIZED, 'every function works on whole arrays')
+
+    scalar_functions = _describe_scalar_functions(program)
+    if jobs <= 1:
+        return (Engine.VECTORIZED, f'functions computed point by point ({scalar_functions}), but only one process is allowed')
+    if points < MIN_PARALLEL_POINTS:
+        return (Engine.VECTORIZED, f'functions computed point by point ({scalar_functions}), but too few points ({points}) to start several processes')
+
+    return (Engine.PARALLEL, f'functions computed point by point ({scalar_functions}) on {points} points, split between {jobs} processes')
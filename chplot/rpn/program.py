@@ -0,0 +1,323 @@
+import dataclasses
+import sys
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from enum import Enum
+from functools import cached_property
+from typing import Callable, Hashable, Iterator, Optional, Union
+
+from chplot.functions import DEFAULT_ENVIRONMENT
+from chplot.functions.environment import Environment
+from chplot.rpn.scalar import _parse_literal, NUMBER_CHARS
+
+
+def _select_if(x: float) -> bool:
+    return x >= 0
+
+def _select_ifn(x: float) -> bool:
+    return x <= 0
+
+def _select_ifz(x: float) -> bool:
+    return x == 0
+
+def _select_in(x: float, lower: float, upper: float) -> bool:
+    return (lower <= x) & (x <= upper)
+
+def _select_out(x: float, lower: float, upper: float) -> bool:
+    return (x < lower) | (upper < x)
+
+
+# Functions returning one of their two last parameters (the true then the false branch), chosen with the other ones
+# They are given the function choosing the true branch, which works with floats and numpy arrays
+CONDITIONAL_FUNCTIONS: dict[str, Callable[..., bool]] = {
+    'if': _select_if,
+    'ifn': _select_ifn,
+    'ifz': _select_ifz,
+    'in': _select_in,
+    'out': _select_out,
+}
+
+
+class OpCode(Enum):
+    LITERAL = 0
+    VARIABLE = 1
+    PARAMETER = 2
+    CALL = 3
+
+
+@dataclass(frozen=True)
+class Instruction:
+    opcode: OpCode
+    token: str
+    # Value of a literal, or index of a parameter
+    value: Optional[Union[int, float]] = None
+    arity: int = 0
+    function: Optional[Callable[..., float]] = None
+    # Version of the function working on whole numpy arrays, if there is one
+    vectorized: Optional[Callable] = None
+    # True for the conditional functions, whose branches are only computed where they are chosen
+    conditional: bool = False
+    # Expression computed for every value of the index of a reduction (e.g. 'sum'), the index being its last parameter
+    body: Optional['RpnProgram'] = None
+
+
+@dataclass(frozen=True)
+class RpnProgram:
+    """RPN parsed once: literals are converted, constant parts are computed, and every function is resolved with its arity.
+    The parameters are names whose value is given at each evaluation (e.g. the regression parameters).
+    The environment is the one the functions were resolved in."""
+    rpn: str
+    variable: Optional[str]
+    parameters: tuple[str, ...]
+    instructions: tuple[Instruction, ...]
+    max_stack_depth: int
+    environment: Environment = field(default=DEFAULT_ENVIRONMENT, compare=False, repr=False)
+
+    def __str__(self) -> str:
+        return self.rpn
+
+    @property
+    def optimized_rpn(self) -> str:
+        """The RPN actually computed, after the constant parts are computed and the expression is simplified."""
+        return ' '.join(
+            instruction.token if instruction.body is None else f'{instruction.token}[{instruction.body.parameters[-1]}: {instruction.body.optimized_rpn}]'
+            for instruction in self.instructions
+        )
+
+    @property
+    def is_vectorizable(self) -> bool:
+        """True if every function has a vectorized version (the conditional functions are always computed on whole arrays), including in the reductions."""
+        return all(
+            (instruction.vectorized is not None or instruction.conditional) and (instruction.body is None or instruction.body.is_vectorizable)
+            for instruction in self.instructions if instruction.opcode == OpCode.CALL
+        )
+
+    @cached_property
+    def function(self) -> Callable[..., float]:
+        """The program compiled into a Python function, taking the variable then the parameters."""
+        # Imported here because the compiler depends on this module
+        from chplot.rpn.compiler import compile_program
+        return compile_program(self)
+
+
+def get_instruction_key(instruction: Instruction, children: list[Hashable]) -> Hashable:
+    """Return a key identifying the sub-tree of the instruction: two sub-trees with the same key always have the same values."""
+    if instruction.opcode == OpCode.LITERAL:
+        return (OpCode.LITERAL, instruction.value)
+    if instruction.opcode == OpCode.VARIABLE:
+        return (OpCode.VARIABLE,)
+    if instruction.opcode == OpCode.PARAMETER:
+        return (OpCode.PARAMETER, instruction.value)
+
+    # Two reductions with the same bounds are only the same if they have the same body
+    if instruction.body is not None:
+        return (OpCode.CALL, instruction.token, instruction.body, *children)
+
+    return (OpCode.CALL, instruction.token, *children)
+
+
+def _get_max_stack_depth(instructions: list[Instruction]) -> int:
+    depth = max_depth = 0
+    for instruction in instructions:
+        depth += 1 - instruction.arity
+        max_depth = max(max_depth, depth)
+
+    return max_depth
+
+
+def _is_reduction(token: str, environment: Environment) -> bool:
+    # Imported here because the reductions depend on this module
+    from chplot.rpn.reduction import REDUCTION_FUNCTIONS
+    return token in REDUCTION_FUNCTIONS and not environment.is_user_function(token)
+
+
+def _find_reductions(tokens: list[str], variable: Optional[str], parameters: tuple[str, ...], environment: Environment) -> dict[int, list[int]]:
+    """Return the position of every reduction (e.g. 'k 1 10 x k ^ sum') which is not inside another one, with the positions where its 4 parameters start
+    (the index, the bounds and the body). The unknown tokens are counted as values, the errors are found later."""
+    reductions: dict[int, list[int]] = {}
+    # Position where each value of the stack starts
+    stack: list[int] = []
+    for position, token in enumerate(tokens):
+        if (token and token[0] in NUMBER_CHARS) or token == variable or token in parameters or token not in environment:
+            param_count = 0 if not _is_reduction(token, environment) else 4
+        else:
+            param_count = environment[token][0]
+
+        if param_count > len(stack):
+            break
+
+        starts = stack[len(stack) - param_count:]
+        del stack[len(stack) - param_count:]
+        if param_count == 4 and _is_reduction(token, environment):
+            reductions[position] = starts
+        stack.append(starts[0] if starts else position)
+
+    # Only the outermost reductions, the others are found when parsing their bodies
+    outermost_reductions: dict[int, list[int]] = {}
+    for position in sorted(reductions, reverse=True):
+        if not any(starts[0] < position < outer_position for outer_position, starts in outermost_reductions.items()):
+            outermost_reductions[position] = reductions[position]
+
+    return outermost_reductions
+
+
+# Python frames used by the recursive passes on trees (optimizer, compiler) for each level of the tree
+RECURSION_FRAMES_PER_LEVEL = 4
+
+
+@contextmanager
+def allow_recursion_depth(tree_depth: int) -> Iterator[None]:
+    """Raise the recursion limit while going through a tree of the given depth recursively, as long expressions written by hand
+    (e.g. the hundreds of terms of a series) give trees deeper than the default limit."""
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, limit + RECURSION_FRAMES_PER_LEVEL * tree_depth))
+    try:
+        yield
+    finally:
+        sys.setrecursionlimit(limit)
+
+
+def parse_program(rpn: str, variable: Optional[str] = 'x', parameters: tuple[str, ...] = (), optimize: bool = True,
+                  environment: Environment = DEFAULT_ENVIRONMENT) -> tuple[Optional[RpnProgram], Optional[str]]:
+    """Check if the given RPN is valid in the environment, and build its program if it is, in one pass.
+    The check only uses the number of parameters of the functions, which are never called for it.
+    Constant parts are computed, the same way as pre_compute_rpn, except for the user functions which are only called when the program is computed.
+    The body of a reduction (e.g. 'sum(k, 1, 10, x^k)') is another program, where the index is one more parameter.
+    If optimize is True, the program is then simplified (see simplify_instructions).
+    Return either the program and None if the RPN is valid, or None and the error message as a string if it is not."""
+    instructions: list[Instruction] = []
+    # Number of values on the stack when computing the program
+    depth = max_depth = 0
+
+    tokens = rpn.split(' ')
+    reductions = _find_reductions(tokens, variable, parameters, environment)
+    # Positions of the indices and bodies of the reductions, which are not in the instructions
+    skipped_positions = {position for reduction_position, starts in reductions.items() for position in (starts[0], *range(starts[3], reduction_position))}
+
+    for position, token in enumerate(tokens):
+        if position in skipped_positions:
+            continue
+
+        if position in reductions:
+            instruction, error = _get_reduction_instruction(token, tokens, position, reductions[position], variable, parameters, optimize, instructions, environment)
+            if error is not None:
+                return (None, error)
+            # The variable and the parameters are added on the stack before the reduction
+            max_depth = max(max_depth, depth + instruction.arity - 2)
+            depth -= 2
+            instructions.append(instruction)
+        elif token and token[0] in NUMBER_CHARS:
+            try:
+                value = _parse_literal(token)
+            except ValueError:
+                return (None, f"invalid number: '{token}'")
+            instructions.append(Instruction(OpCode.LITERAL, token, value=value))
+        elif token == variable:
+            instructions.append(Instruction(OpCode.VARIABLE, token))
+        elif token in parameters:
+            instructions.append(Instruction(OpCode.PARAMETER, token, value=parameters.index(token)))
+        elif not token in environment:
+            return (None, f"unknown function: '{token}'")
+        else:
+            param_count, func = environment[token]
+
+            if param_count == 0:
+                instructions.append(Instruction(OpCode.LITERAL, token, value=float(func)))
+            else:
+                if depth < param_count:
+                    return (None, f"not enough parameters for function '{token}': {depth} found, {param_count} expected.")
+
+                depth -= param_count
+                instructions.append(_get_call_instruction(token, param_count, func, instructions, environment))
+
+        depth += 1
+        max_depth = max(max_depth, depth)
+
+    if depth > 1:
+        return (None, "expression does not give only one result.")
+
+    if optimize:
+        # Imported here because the optimizer depends on this module
+        from chplot.rpn.optimizer import simplify_instructions
+        with allow_recursion_depth(len(instructions)):
+            instructions = simplify_instructions(instructions, environment)
+        max_depth = _get_max_stack_depth(instructions)
+
+    program = RpnProgram(
+        rpn=rpn,
+        variable=variable,
+        parameters=tuple(parameters),
+        instructions=tuple(instructions),
+        max_stack_depth=max_depth,
+        environment=environment,
+    )
+    return (program, None)
+
+
+def _get_reduction_instruction(token: str, tokens: list[str], position: int, starts: list[int], variable: Optional[str], parameters: tuple[str, ...],
+                               optimize: bool, instructions: list[Instruction], environment: Environment) -> tuple[Optional[Instruction], Optional[str]]:
+    """Return the instruction computing the reduction, after its bounds in the instructions, or None and the error message.
+    The reduction takes the bounds, then the variable and the parameters, which are added to the instructions as its body may use them."""
+    # Imported here because the reductions depend on this module
+    from chplot.rpn.reduction import get_reduction_functions
+
+    index_start, lower_start, _, body_start = starts
+    index = tokens[index_start]
+    if lower_start - index_start != 1 or index[0] in NUMBER_CHARS or index == variable or index in parameters:
+        return (None, f"the first parameter of '{token}' must be the name of its index.")
+
+    body_tokens = tokens[body_start:position]
+    # Without the variable, the reduction is computed only once if its bounds are constants
+    body_variable = variable if variable in body_tokens else None
+    body, error = parse_program(' '.join(body_tokens), variable=body_variable, parameters=(*parameters, index), optimize=optimize, environment=environment)
+    if error is not None:
+        return (None, f"in the {token} over '{index}': {error}")
+
+    if body_variable is not None:
+        instructions.append(Instruction(OpCode.VARIABLE, body_variable))
+    instructions.extend(Instruction(OpCode.PARAMETER, parameter, value=parameter_index) for parameter_index, parameter in enumerate(parameters))
+
+    function, vectorized = get_reduction_functions(token, body)
+    param_count = 2 + (body_variable is not None) + len(parameters)
+    instruction = _get_call_instruction(token, param_count, function, instructions, environment)
+    if instruction.opcode == OpCode.CALL:
+        instruction = dataclasses.replace(instruction, vectorized=vectorized, body=body)
+
+    return (instruction, None)
+
+
+def _get_call_instruction(token: str, param_count: int, func: Callable[..., float], instructions: list[Instruction], environment: Environment) -> Instruction:
+    """Return the instruction calling the function. If its parameters are all literals, it is computed now and the literals are removed from the instructions.
+    The user functions are never computed here, as they may be slow or have side effects."""
+    parameters_instructions = instructions[-param_count:]
+    if not environment.is_user_function(token) and all(instruction.opcode == OpCode.LITERAL for instruction in parameters_instructions):
+        try:
+            value = float(func(*(instruction.value for instruction in parameters_instructions)))
+            del instructions[-param_count:]
+            return Instruction(OpCode.LITERAL, str(value), value=value)
+        except Exception:
+            pass
+
+    return Instruction(
+        OpCode.CALL, token,
+        arity=param_count,
+        function=func,
+        vectorized=environment.get_vectorized(token),
+        conditional=token in CONDITIONAL_FUNCTIONS and not environment.is_user_function(token)
+    )
+
+
+def build_program(rpn: str, variable: Optional[str] = 'x', parameters: tuple[str, ...] = (), optimize: bool = True,
+                  environment: Environment = DEFAULT_ENVIRONMENT) -> RpnProgram:
+    """Build the program of the given RPN. Raise a ValueError if the RPN is not valid, use parse_program to get the error message instead."""
+    program, error = parse_program(rpn, variable=variable, parameters=parameters, optimize=optimize, environment=environment)
+    if error is not None:
+        raise ValueError(error)
+
+    return program
+
+
+def get_rpn_errors(rpn: str, variable: str = 'x', environment: Environment = DEFAULT_ENVIRONMENT) -> Optional[str]:
+    """Check if the given RPN is a valid one, without computing any function.
+    Return either None if the RPN is valid, or the error message as a string if it is not."""
+    return parse_program(rpn, variable=variable, environment=environment)[1]
@@ -0,0 +1,101 @@
+import math
+from operator import add, mul
+from typing import Callable
+
+import numpy as np
+
+from chplot.rpn.program import RpnProgram
+from chplot.rpn.vectorized import compute_rpn_array, Value
+
+
+# Functions of the form 'sum(k, a, b, expression)', combining the values of the expression for every integer k between a and b (inclusive)
+# For each one: the result without any term, the operation on floats, and the same operation on numpy arrays
+REDUCTION_FUNCTIONS: dict[str, tuple[float, Callable[[float, float], float], np.ufunc]] = {
+    'sum': (0.0, add, np.add),
+    'prod': (1.0, mul, np.multiply),
+}
+# Above this number of terms, the result is nan instead of taking forever
+MAX_REDUCTION_TERMS = 10 ** 6
+# Number of terms computed at once by the vectorized version: 2^20 float64 take 8 MiB
+REDUCTION_CHUNK_POINTS = 2 ** 20
+
+
+def _get_bounds(lower: float, upper: float) -> tuple[int, int]:
+    """Return the first and last values of the index, and raise a ValueError if there are too many terms."""
+    first, last = math.ceil(lower), math.floor(upper)
+    if last - first >= MAX_REDUCTION_TERMS:
+        raise ValueError(f'more than {MAX_REDUCTION_TERMS} terms')
+
+    return (first, last)
+
+
+def _get_scalar_reduction(token: str, body: RpnProgram) -> Callable[..., float]:
+    identity, operation, _ = REDUCTION_FUNCTIONS[token]
+
+    def reduction(lower: float, upper: float, *captured: float) -> float:
+        """The captured values are the variable (if there is one) then the parameters of the expression, the index is the last parameter of the body."""
+        first, last = _get_bounds(lower, upper)
+        function = body.function
+        # The compiled function always takes the variable first
+        arguments = captured if body.variable is not None else (0.0, *captured)
+
+        result = identity
+        for index in range(first, last + 1):
+            result = operation(result, function(*arguments, float(index)))
+
+        return result
+
+    return reduction
+
+
+def _compute_terms(body: RpnProgram, indices: np.ndarray, captured: tuple[Value, ...], size: int) -> np.ndarray:
+    """Return the values of the body for every index (rows) and every point (columns), computed at once on the flattened grid."""
+    index_values = np.repeat(indices, size)
+    grid_values = [np.tile(value, indices.size) if isinstance(value, np.ndarray) else value for value in captured]
+
+    if body.variable is not None:
+        inputs, parameters = np.broadcast_to(grid_values[0], index_values.shape), grid_values[1:]
+    else:
+        # Only used for the number of points
+        inputs, parameters = index_values, grid_values
+
+    return compute_rpn_array(body, inputs, parameters=(*parameters, index_values)).reshape(indices.size, size)
+
+
+def _get_vectorized_reduction(token: str, body: RpnProgram) -> Callable[..., np.ndarray]:
+    identity, _, ufunc = REDUCTION_FUNCTIONS[token]
+
+    def vectorized_reduction(lower: Value, upper: Value, *captured: Value) -> np.ndarray:
+        """Compute the terms of all the points for a chunk of indices at once, so the reduction is a few numpy calls instead of one sub-tree per term.
+        The bounds can be different at each point: the terms outside of them are ignored."""
+        size = max(np.size(value) for value in (lower, upper, *captured))
+        first_indices = np.broadcast_to(np.ceil(lower), (size,))
+        last_indices = np.broadcast_to(np.floor(upper), (size,))
+        valid = np.isfinite(first_indices) & np.isfinite(last_indices) & (last_indices - first_indices < MAX_REDUCTION_TERMS)
+
+        result = np.full(size, identity)
+        if np.any(valid):
+            first, last = int(first_indices[valid].min()), int(last_indices[valid].max())
+            chunk_size = max(1, REDUCTION_CHUNK_POINTS // size)
+
+            for start in range(first, last + 1, chunk_size):
+                end = min(start + chunk_size, last + 1) - 1
+                # No point needs these indices, when the bounds are very different between points
+                if not np.any(valid & (first_indices <= end) & (start <= last_indices)):
+                    continue
+
+                indices = np.arange(start, end + 1, dtype=float)
+                terms = _compute_terms(body, indices, captured, size)
+                terms[(indices[:, np.newaxis] < first_indices) | (last_indices < indices[:, np.newaxis])] = identity
+                ufunc(result, ufunc.reduce(terms, axis=0), out=result)
+
+        result[~valid] = math.nan
+        return result
+
+    return vectorized_reduction
+
+
+def get_reduction_functions(token: str, body: RpnProgram) -> tuple[Callable[..., float], Callable[..., np.ndarray]]:
+    """Return the function computing the reduction of the body on floats, and its vectorized version.
+    Both take the bounds of the index, then the variable (if there is one) and the parameters of the expression containing the reduction."""
+    return (_get_scalar_reduction(token, body), _get_vectorized_reduction(token, body))
@@ -0,0 +1,136 @@
+import dataclasses
+import math
+from typing import Callable, Optional
+
+import numpy as np
+
+from chplot.rpn.program import Instruction, OpCode, RpnProgram
+from chplot.rpn.vectorized import _apply_scalar_function
+
+
+# Largest table of values built for a sequence: the sieve of primepi takes 1 byte and the prefix sum 8 bytes by entry
+MAX_TABLE_SIZE = 10 ** 7
+
+
+def _get_primepi_table(size: int) -> np.ndarray:
+    """Number of primes up to each n, with a sieve of Eratosthenes and its prefix sum."""
+    is_prime = np.ones(size, dtype=bool)
+    is_prime[:2] = False
+    for n in range(2, math.isqrt(size - 1) + 1):
+        if is_prime[n]:
+            is_prime[n * n::n] = False
+
+    return np.cumsum(is_prime, dtype=float)
+
+
+def _get_factorial_table(size: int) -> np.ndarray:
+    """n! for each n, as a cumulative product. It is inf from 171! on."""
+    with np.errstate(over='ignore'):
+        return np.concatenate(([1.0], np.cumprod(np.arange(1, size, dtype=float))))[:size]
+
+
+def _get_double_factorial_table(size: int) -> np.ndarray:
+    """n!! for each n, as the cumulative products of the even and the odd numbers."""
+    table = np.ones(size)
+    with np.errstate(over='ignore'):
+        table[2::2] = np.cumprod(np.arange(2, size, 2, dtype=float))
+        table[3::2] = np.cumprod(np.arange(3, size, 2, dtype=float))
+
+    return table
+
+
+def _get_harmonic_table(size: int) -> np.ndarray:
+    """1 + 1/2 + ... + 1/n for each n, as a cumulative sum. It is computed with extended precision where the platform has it, as the rounding errors add up."""
+    inverses = 1 / np.arange(1, size, dtype=np.longdouble)
+    return np.concatenate(([0.0], np.cumsum(inverses).astype(float)))[:size]
+
+
+def _get_fibonacci_table(size: int) -> np.ndarray:
+    """F(n) for each n, computed exactly with integers by the recurrence. Only about 1500 values are finite, so it is never long."""
+    table = np.full(size, math.inf)
+    previous, current = 0, 1
+    for n in range(size):
+        try:
+            table[n] = float(previous)
+        except OverflowError:
+            break
+        previous, current = current, previous + current
+
+    return table
+
+
+class IntegerSequence:
+    """Vectorized version of a function of integers, looked up in a table of its values from 0 to the largest argument.
+    The table is built once in bulk (e.g. a sieve for primepi) and only grows when a larger argument is met, so the blocks of points share it.
+    The other arguments (negative, not integers, or beyond MAX_TABLE_SIZE) are computed with the vectorized approximation of the function if there is one,
+    else one by one with the scalar function."""
+
+    def __init__(self, token: str, function: Callable[..., float], get_table: Callable[[int], np.ndarray], floor_arguments: bool = False,
+                 vectorized: Optional[Callable[[np.ndarray], np.ndarray]] = None) -> None:
+        self.token = token
+        self.function = function
+        self.vectorized = vectorized
+        self.get_table = get_table
+        # The function only depends on the integer part of its argument (e.g. primepi)
+        self.floor_arguments = floor_arguments
+        self._table: Optional[np.ndarray] = None
+
+    def _get_table(self, size: int) -> np.ndarray:
+        if self._table is None or self._table.size < size:
+            # At least doubled, as the blocks of increasing inputs would otherwise build it again each time
+            self._table = self.get_table(min(max(size, 2 * (self._table.size if self._table is not None else 0)), MAX_TABLE_SIZE))
+        return self._table
+
+    def __call__(self, arguments: np.ndarray) -> np.ndarray:
+        arguments = np.asarray(arguments, dtype=float)
+        integers = np.floor(arguments) if self.floor_arguments else arguments
+        # Nan arguments are never in the table
+        in_table = (integers == np.round(integers)) & (0 <= integers) & (integers < MAX_TABLE_SIZE)
+        if self.floor_arguments:
+            # Same value as 0 for all the negative arguments
+            in_table |= integers < 0
+            integers = np.maximum(integers, 0)
+
+        values = np.empty(arguments.size)
+        if np.any(in_table):
+            indices = integers[in_table].astype(np.int64)
+            values[in_table] = self._get_table(int(indices.max()) + 1)[indices]
+        if not np.all(in_table) and self.vectorized is not None:
+            values[~in_table] = self.vectorized(arguments[~in_table])
+        elif not np.all(in_table):
+            values[~in_table] = _apply_scalar_function(self.function, [arguments[~in_table]], np.empty(np.count_nonzero(~in_table)), None)
+
+        return values
+
+
+# Functions computed from a table on integers, with the function building the table and if the function only depends on the integer part of its argument
+INTEGER_SEQUENCES: dict[str, tuple[Callable[[int], np.ndarray], bool]] = {
+    'primepi': (_get_primepi_table, True),
+    'factorial': (_get_factorial_table, False),
+    'fac': (_get_factorial_table, False),
+    'fac2': (_get_double_factorial_table, False),
+    'harmonic': (_get_harmonic_table, False),
+    'fib': (_get_fibonacci_table, False),
+    'fibonacci': (_get_fibonacci_table, False),
+}
+
+
+def use_integer_sequences(program: RpnProgram) -> tuple[RpnProgram, list[str]]:
+    """Return the program where the functions of integers (primepi, factorial, fib, ...) are computed from tables of their values, which is much faster
+    than computing them point by point and more accurate than their vectorized approximations when the inputs are integers, and the names of these functions.
+    The user functions are kept, even with the same names."""
+    sequences: dict[str, IntegerSequence] = {}
+    instructions: list[Instruction] = []
+    for instruction in program.instructions:
+        token = instruction.token
+        if instruction.opcode == OpCode.CALL and token in INTEGER_SEQUENCES and not program.environment.is_user_function(token):
+            if token not in sequences:
+                get_table, floor_arguments = INTEGER_SEQUENCES[token]
+                sequences[token] = IntegerSequence(token, instruction.function, get_table, floor_arguments=floor_arguments, vectorized=instruction.vectorized)
+            instruction = dataclasses.replace(instruction, vectorized=sequences[token])
+        instructions.append(instruction)
+
+    if not sequences:
+        return (program, [])
+
+    return (dataclasses.replace(program, instructions=tuple(instructions)), list(sequences))
@@ -0,0 +1,245 @@
+import dataclasses
+from typing import Optional
+
+import numpy as np
+from numpy.polynomial import chebyshev
+
+from chplot.functions.environment import FunctionKind
+from chplot.rpn.optimizer import _build_tree, _flatten_tree, Node
+from chplot.rpn.program import Instruction, OpCode, RpnProgram
+from chplot.rpn.vectorized import compute_rpn_array
+
+
+# Degree of the interpolant of each piece, which is computed exactly on one more point
+SURROGATE_DEGREE = 32
+# Number of last coefficients of an interpolant giving its error estimate: they are almost zero when the function is smooth on the piece
+TAIL_COEFFICIENTS = 4
+# The interpolant is also compared to the exact values between some of its nodes, as the coefficients can look small around a singularity
+CHECK_POINTS = 8
+# The sub-expressions are computed exactly on at most this fraction of the inputs to build their surrogates, else they would not be faster
+MAX_SAMPLES_FRACTION = 0.25
+# Below this number of inputs, surrogates cannot save much time
+MIN_SURROGATE_POINTS = 4096
+
+SURROGATE_TOKEN_PREFIX = 'surrogate'
+
+# Start, end and Chebyshev coefficients (None where computed exactly) of the pieces of a surrogate
+Pieces = tuple[np.ndarray, np.ndarray, list[Optional[np.ndarray]]]
+# What is needed to replace the same sub-expressions of a program by the same surrogates in another process:
+# their interval, tolerance and sample budget, and the pieces of each of them by token, so they are not fitted again
+SurrogatesDescription = tuple[float, float, float, int, dict[str, Pieces]]
+
+
+class ChebyshevSurrogate:
+    """Piecewise Chebyshev interpolant of a sub-expression of the variable on an interval, computed on whole arrays with numpy.
+    The interval is split in two until the error estimate of each piece is below the tolerance, relative to the largest value on the piece if it is more than 1.
+    A piece is computed exactly if it does not reach the tolerance before the sample budget is spent (e.g. around a pole or where the sub-expression is not defined),
+    and so are the points outside the interval. The pieces are only built the first time the surrogate is computed."""
+
+    def __init__(self, program: RpnProgram, lower: float, upper: float, tolerance: float, max_samples: int) -> None:
+        self.program = program
+        self.lower = lower
+        self.upper = upper
+        self.tolerance = tolerance
+        self.max_samples = max_samples
+        # Start of each piece and coefficients of its interpolant, None if it is computed exactly
+        self._starts: Optional[np.ndarray] = None
+        self._ends: Optional[np.ndarray] = None
+        self._coefficients: list[Optional[np.ndarray]] = []
+        self.sample_count = 0
+
+    def _compute_exactly(self, inputs: np.ndarray) -> np.ndarray:
+        return compute_rpn_array(self.program, inputs)
+
+    def _fit_piece(self, start: float, end: float) -> Optional[np.ndarray]:
+        """Return the coefficients of the interpolant on the piece, or None if its error estimate is above the tolerance."""
+        nodes = chebyshev.chebpts1(SURROGATE_DEGREE + 1)
+        # Midpoints between nodes spread on the whole piece
+        check_nodes = (nodes[:-1] + nodes[1:])[::SURROGATE_DEGREE // CHECK_POINTS] / 2
+        all_values = self._compute_exactly((start + end) / 2 + (end - start) / 2 * np.concatenate((nodes, check_nodes)))
+        self.sample_count += all_values.size
+        if not np.all(np.isfinite(all_values)):
+            return None
+
+        values, check_values = all_values[:nodes.size], all_values[nodes.size:]
+        coefficients = chebyshev.chebfit(nodes, values, SURROGATE_DEGREE)
+        error = max(np.sum(np.abs(coefficients[-TAIL_COEFFICIENTS:])), np.max(np.abs(chebyshev.chebval(check_nodes, coefficients) - check_values)))
+        if error > self.tolerance * max(1.0, float(np.max(np.abs(all_values)))):
+            return None
+
+        return coefficients
+
+    def _build(self) -> None:
+        pieces: list[tuple[float, float, Optional[np.ndarray]]] = []
+        # Pieces are popped from the end, so the first half of a split piece is the next one
+        remaining = [(self.lower, self.upper)]
+        while remaining:
+            start, end = remaining.pop()
+            coefficients = self._fit_piece(start, end)
+            middle = (start + end) / 2
+            # The pieces still to fit are counted in the budget
+            can_split = self.sample_count + (len(remaining) + 2) * (SURROGATE_DEGREE + 1 + CHECK_POINTS) <= self.max_samples and start < middle < end
+
+            if coefficients is None and can_split:
+                remaining.extend(((middle, end), (start, middle)))
+            else:
+                pieces.append((start, end, coefficients))
+
+        pieces.sort(key=lambda piece: piece[0])
+        self._starts = np.array([start for start, _, _ in pieces])
+        self._ends = np.array([end for _, end, _ in pieces])
+        self._coefficients = [coefficients for _, _, coefficients in pieces]
+
+    @property
+    def is_built(self) -> bool:
+        return self._starts is not None
+
+    @property
+    def pieces(self) -> Pieces:
+        if self._starts is None:
+            self._build()
+        return (self._starts, self._ends, self._coefficients)
+
+    @pieces.setter
+    def pieces(self, pieces: Pieces) -> None:
+        self._starts, self._ends, self._coefficients = pieces
+
+    @property
+    def exact_fraction(self) -> float:
+        """Fraction of the interval computed exactly, because the interpolants did not reach the tolerance there."""
+        if self._starts is None:
+            self._build()
+
+        exact_length = sum(end - start for start, end, coefficients in zip(self._starts, self._ends, self._coefficients) if coefficients is None)
+        return exact_length / (self.upper - self.lower)
+
+    def __call__(self, inputs: np.ndarray) -> np.ndarray:
+        if self._starts is None:
+            self._build()
+
+        inputs = np.asarray(inputs, dtype=float)
+        values = np.empty(inputs.size)
+        piece_indices = np.searchsorted(self._starts, inputs, side='right') - 1
+        exact = (inputs < self.lower) | (self.upper < inputs) | np.isnan(inputs)
+        piece_indices[exact] = -1
+
+        # The inputs are grouped by piece (they usually already are, as they are sorted), and the points outside the interval are first
+        order = np.argsort(piece_indices, kind='stable')
+        limits = np.searchsorted(piece_indices[order], np.arange(len(self._coefficients) + 1))
+        for index, coefficients in enumerate(self._coefficients):
+            selected = order[limits[index]:limits[index + 1]]
+            if coefficients is None:
+                exact[selected] = True
+            elif selected.size > 0:
+                start, end = self._starts[index], self._ends[index]
+                values[selected] = chebyshev.chebval((2 * inputs[selected] - start - end) / (end - start), coefficients)
+
+        if np.any(exact):
+            values[exact] = self._compute_exactly(inputs[exact])
+
+        return values
+
+
+def _is_expensive(instruction: Instruction, program: RpnProgram) -> bool:
+    return instruction.opcode == OpCode.CALL and instruction.vectorized is None and program.environment.get_kind(instruction.token) == FunctionKind.MPMATH
+
+
+def _depends_only_on_variable(node: Node, program: RpnProgram) -> bool:
+    """True if the sub-tree only depends on the variable, through library functions (the user functions may not be smooth)."""
+    instruction, children = node
+    if instruction.opcode == OpCode.PARAMETER:
+        return False
+    if instruction.opcode == OpCode.CALL and (program.environment.is_user_function(instruction.token) or instruction.conditional):
+        return False
+    return all(_depends_only_on_variable(child, program) for child in children)
+
+
+def _contains_variable(node: Node) -> bool:
+    instruction, children = node
+    return instruction.opcode == OpCode.VARIABLE or any(_contains_variable(child) for child in children)
+
+
+class _SurrogateBuilder:
+
+    def __init__(self, program: RpnProgram, lower: float, upper: float, tolerance: float, max_samples: int) -> None:
+        self.program = program
+        self.lower = lower
+        self.upper = upper
+        self.tolerance = tolerance
+        self.max_samples = max_samples
+        self.surrogates: dict[str, ChebyshevSurrogate] = {}
+
+    def replace(self, node: Node) -> Node:
+        """Return the tree where the outermost expensive sub-trees of the variable are replaced by their surrogates."""
+        instruction, children = node
+        if _is_expensive(instruction, self.program) and _contains_variable(node) and _depends_only_on_variable(node, self.program):
+            return self._get_surrogate_node(node)
+
+        return (instruction, tuple(self.replace(child) for child in children))
+
+    def _get_surrogate_node(self, node: Node) -> Node:
+        instructions: list[Instruction] = []
+        _flatten_tree(node, instructions)
+        rpn = ' '.join(instruction.token for instruction in instructions)
+        # The token identifies the sub-expression and the tolerance, as the common sub-trees of the programs are computed only once
+        token = f"{SURROGATE_TOKEN_PREFIX}[{rpn.replace(' ', '_')};{self.tolerance:g}]"
+
+        if token not in self.surrogates:
+            sub_program = dataclasses.replace(self.program, rpn=rpn, instructions=tuple(instructions))
+            self.surrogates[token] = ChebyshevSurrogate(sub_program, self.lower, self.upper, self.tolerance, self.max_samples)
+
+        surrogate = self.surrogates[token]
+        variable = Instruction(OpCode.VARIABLE, self.program.variable)
+        # The scalar engine, and the zeros computation, still compute the sub-expression exactly
+        return (Instruction(OpCode.CALL, token, arity=1, function=surrogate.program.function, vectorized=surrogate), ((variable, ()),))
+
+
+def use_surrogates(program: RpnProgram, inputs: np.ndarray, tolerance: float) -> tuple[RpnProgram, list[ChebyshevSurrogate]]:
+    """Return the program where the sub-expressions of the variable using mpmath functions are replaced by piecewise Chebyshev surrogates on the range of the inputs,
+    with the given tolerance, and the surrogates. The program is not modified if there are too few inputs, or if it does not contain such sub-expressions."""
+    inputs = np.asarray(inputs, dtype=float)
+    finite_inputs = inputs[np.isfinite(inputs)]
+    if program.variable is None or finite_inputs.size < MIN_SURROGATE_POINTS or finite_inputs.min() == finite_inputs.max():
+        return (program, [])
+
+    program, surrogates = _replace_by_surrogates(program, float(finite_inputs.min()), float(finite_inputs.max()), tolerance, int(MAX_SAMPLES_FRACTION * inputs.size))
+    return (program, list(surrogates.values()))
+
+
+def _replace_by_surrogates(program: RpnProgram, lower: float, upper: float, tolerance: float, max_samples: int) -> tuple[RpnProgram, dict[str, ChebyshevSurrogate]]:
+    builder = _SurrogateBuilder(program, lower, upper, tolerance, max_samples)
+    tree = builder.replace(_build_tree(list(program.instructions)))
+    if not builder.surrogates:
+        return (program, {})
+
+    instructions: list[Instruction] = []
+    _flatten_tree(tree, instructions)
+    # Replacing a sub-tree by a function of the variable never makes the stack deeper, so the maximum depth is still valid
+    return (dataclasses.replace(program, instructions=tuple(instructions)), builder.surrogates)
+
+
+def describe_surrogates(program: RpnProgram) -> Optional[SurrogatesDescription]:
+    """Return what is needed to use the same surrogates in another process with use_described_surrogates, or None if the program does not use any.
+    The surrogates are fitted if they were not yet."""
+    surrogates = {instruction.token: instruction.vectorized for instruction in program.instructions if isinstance(instruction.vectorized, ChebyshevSurrogate)}
+    if not surrogates:
+        return None
+
+    # All the surrogates of a program are built with the same settings
+    surrogate = next(iter(surrogates.values()))
+    return (surrogate.lower, surrogate.upper, surrogate.tolerance, surrogate.max_samples, {token: surrogate.pieces for token, surrogate in surrogates.items()})
+
+
+def use_described_surrogates(program: RpnProgram, description: SurrogatesDescription) -> RpnProgram:
+    """Return the program using the surrogates described by describe_surrogates, which must have been called on the same program in another process."""
+    lower, upper, tolerance, max_samples, all_pieces = description
+    program, surrogates = _replace_by_surrogates(program, lower, upper, tolerance, max_samples)
+    for token, surrogate in surrogates.items():
+        surrogate.pieces = all_pieces[token]
+
+    return program
+
+
+def uses_surrogates(program: Optional[RpnProgram]) -> bool:
+    """True if some sub-expressions of the program are computed with surrogates on arrays."""
+    return program is not None and any(isinstance(instruction.vectorized, ChebyshevSurrogate) for instruction in program.instructions)
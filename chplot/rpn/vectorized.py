@@ -0,0 +1,337 @@
+import math
+from typing import Callable, Hashable, Optional, Sequence, Union
+
+import numpy as np
+from tqdm import tqdm
+
+from chplot.rpn.program import CONDITIONAL_FUNCTIONS, get_instruction_key, Instruction, OpCode, RpnProgram
+
+
+# Functions which can give a finite result even if one of their arguments is nan (e.g. nan^0 = 1)
+NAN_ABSORBING_FUNCTIONS = {'^', 'copysign'}
+# Number of points given at once to a function without vectorized version, between two updates of the progress bar
+SCALAR_BATCH_SIZE = 4096
+# Functions cheaper than gathering the valid points of their parameters, always computed on all the points
+ELEMENTARY_OPERATORS = {'+', '-', '*', '/', '+u', '-u'}
+# Fraction of nan points from which the other vectorized functions are only computed on the valid points, then scattered back
+NAN_COMPACTION_THRESHOLD = 0.25
+# Number of points computed at once: 8192 float64 take 64 KiB, so the few intermediate arrays of a block stay in a typical L2 cache
+DEFAULT_BLOCK_SIZE = 8192
+
+Value = Union[float, np.ndarray]
+Nodes = dict[Hashable, tuple[Instruction, list[Hashable]]]
+
+
+def _get_safe_scalar_function(func: Callable[..., float]) -> Callable[..., float]:
+    def safe_func(*parameters: float) -> float:
+        # Same conversion as the scalar path: any exception or infinite result gives nan
+        try:
+            result = float(func(*parameters))
+        except Exception:
+            return math.nan
+        return result if not math.isinf(result) else math.nan
+
+    return safe_func
+
+
+class BufferPool:
+    """Scratch arrays of the size of a block, reused from one function to the next instead of allocating a new array for every intermediate result."""
+
+    def __init__(self, block_size: int) -> None:
+        self.block_size = block_size
+        self._free: list[np.ndarray] = []
+
+    def get(self, size: int) -> np.ndarray:
+        """Return a scratch array of the given size (at most the block size). Its content is undefined."""
+        buffer = self._free.pop() if self._free else np.empty(self.block_size)
+        return buffer[:size]
+
+    def release(self, array: np.ndarray) -> None:
+        """Give back an array returned by get, which must not be used anymore."""
+        self._free.append(array.base)
+
+
+def _get_valid_mask(parameters: list[Value], size: int) -> np.ndarray:
+    """Return the mask of the points where no parameter is nan."""
+    valid = np.ones(size, dtype=bool)
+    for parameter in parameters:
+        if isinstance(parameter, np.ndarray):
+            valid &= ~np.isnan(parameter)
+
+    return valid
+
+
+def _apply_scalar_function(func: Callable[..., float], parameters: list[Value], out: np.ndarray, pbar: Optional[tqdm]) -> np.ndarray:
+    """Apply a function without vectorized version point by point. The points where one of the parameters is nan are skipped."""
+    size = out.size
+    indices = np.flatnonzero(_get_valid_mask(parameters, size))
+    parameters = [parameter[indices] if isinstance(parameter, np.ndarray) else parameter for parameter in parameters]
+    vectorized_func = np.frompyfunc(_get_safe_scalar_function(func), len(parameters), 1)
+
+    out.fill(math.nan)
+    for start in range(0, indices.size, SCALAR_BATCH_SIZE):
+        batch = slice(start, start + SCALAR_BATCH_SIZE)
+        out[indices[batch]] = vectorized_func(*(
+            parameter[batch] if isinstance(parameter, np.ndarray) else parameter
+            for parameter in parameters
+        ))
+
+        if pbar is not None:
+            pbar.update(min(SCALAR_BATCH_SIZE, indices.size - start))
+
+    if pbar is not None:
+        pbar.update(size - indices.size)
+
+    return out
+
+
+def _apply_function(instruction: Instruction, parameters: list[Value], out: np.ndarray, pbar: Optional[tqdm]) -> Value:
+    """Compute the function of the instruction. The result is written in the given array, except if it is a single value (only constant parameters)."""
+    # Only constants: compute a single value, the same way as the scalar path
+    if not any(isinstance(parameter, np.ndarray) for parameter in parameters):
+        return _get_safe_scalar_function(instruction.function)(*parameters)
+
+    if instruction.vectorized is None:
+        return _apply_scalar_function(instruction.function, parameters, out, pbar)
+
+    if instruction.token in ELEMENTARY_OPERATORS:
+        return _apply_vectorized_function(instruction, parameters, out)
+
+    # Nan is sticky, so the points where a parameter is nan do not need to be computed
+    # When there are many of them (e.g. outside the domain of sqrt or ln), the valid points are gathered and only them are computed
+    valid = _get_valid_mask(parameters, out.size)
+    valid_count = np.count_nonzero(valid)
+    if out.size - valid_count < NAN_COMPACTION_THRESHOLD * out.size:
+        return _apply_vectorized_function(instruction, parameters, out)
+
+    indices = np.flatnonzero(valid)
+    out.fill(math.nan)
+    if valid_count > 0:
+        valid_parameters = [parameter[indices] if isinstance(parameter, np.ndarray) else parameter for parameter in parameters]
+        out[indices] = _apply_vectorized_function(instruction, valid_parameters, np.empty(valid_count))
+
+    return out
+
+
+def _apply_vectorized_function(instruction: Instruction, parameters: list[Value], out: np.ndarray) -> np.ndarray:
+    """Compute the vectorized version of the function of the instruction in the given array."""
+    # Numpy ufuncs can write directly in the output array, other functions return a new array
+    if isinstance(instruction.vectorized, np.ufunc):
+        result = instruction.vectorized(*parameters, out=out)
+    else:
+        np.copyto(out, instruction.vectorized(*parameters))
+        result = out
+
+    # The math module raises an exception where numpy returns inf or nan, so both are failures
+    invalid = ~np.isfinite(result)
+    if instruction.token in NAN_ABSORBING_FUNCTIONS:
+        for parameter in parameters:
+            if isinstance(parameter, np.ndarray):
+                invalid |= np.isnan(parameter)
+    result[invalid] = math.nan
+
+    return result
+
+
+def _select_points(parameters: Sequence[Value], points: Union[slice, np.ndarray]) -> list[Value]:
+    """Return the values of the parameters on some points: the parameters are floats, or arrays with one value per point (e.g. the index of a reduction)."""
+    return [parameter[points] if isinstance(parameter, np.ndarray) else float(parameter) for parameter in parameters]
+
+
+def _get_eager_children(instruction: Instruction, children: list[Hashable]) -> list[Hashable]:
+    """Return the children computed before the instruction on all the points: every one except the branches of a conditional function."""
+    return children[:-2] if instruction.conditional else children
+
+
+class _Evaluation:
+    """Computation of sub-trees on some of the points of a block, for the branches of the conditional functions.
+    The values already computed on the parent points are reused instead of being computed again."""
+
+    def __init__(self, nodes: Nodes, inputs: np.ndarray, parameters: Sequence[Value], pbar: Optional[tqdm],
+                 values: Optional[dict[Hashable, Value]] = None, parent: Optional['_Evaluation'] = None, indices: Optional[np.ndarray] = None) -> None:
+        self.nodes = nodes
+        self.inputs = inputs
+        self.parameters = parameters
+        self.pbar = pbar
+        self.values = values if values is not None else {}
+        self.parent = parent
+        # Indices of the points of this evaluation among the ones of the parent
+        self.indices = indices
+
+    def subset(self, indices: np.ndarray) -> '_Evaluation':
+        return _Evaluation(self.nodes, self.inputs[indices], _select_points(self.parameters, indices), self.pbar, parent=self, indices=indices)
+
+    def _find(self, key: Hashable) -> Optional[Value]:
+        if key in self.values:
+            return self.values[key]
+        if self.parent is None or (value := self.parent._find(key)) is None:
+            return None
+
+        self.values[key] = value[self.indices] if isinstance(value, np.ndarray) else value
+        return self.values[key]
+
+    def compute(self, key: Hashable) -> Value:
+        if (value := self._find(key)) is not None:
+            return value
+
+        instruction, children = self.nodes[key]
+        if instruction.opcode == OpCode.LITERAL:
+            value = float(instruction.value)
+        elif instruction.opcode == OpCode.VARIABLE:
+            value = self.inputs
+        elif instruction.opcode == OpCode.PARAMETER:
+            value = self.parameters[instruction.value]
+        elif instruction.conditional:
+            selectors = [self.compute(child) for child in children[:-2]]
+            value = _apply_conditional(instruction, selectors, children[-2:], self, np.empty(self.inputs.size))
+        else:
+            value = _apply_function(instruction, [self.compute(child) for child in children], np.empty(self.inputs.size), self.pbar)
+
+        self.values[key] = value
+        return value
+
+
+def _apply_conditional(instruction: Instruction, selectors: list[Value], branches: list[Hashable], evaluation: _Evaluation, out: np.ndarray) -> np.ndarray:
+    """Compute the conditional function of the instruction: each branch is only computed on the points where it is chosen.
+    As with the other functions, the result is nan where one of the parameters choosing the branch is nan."""
+    size = out.size
+    valid = np.ones(size, dtype=bool)
+    for selector in selectors:
+        valid &= ~np.isnan(selector)
+
+    chosen = np.broadcast_to(CONDITIONAL_FUNCTIONS[instruction.token](*selectors), (size,))
+
+    out.fill(math.nan)
+    for branch, mask in zip(branches, (valid & chosen, valid & ~chosen)):
+        indices = np.flatnonzero(mask)
+        if indices.size > 0:
+            out[indices] = evaluation.subset(indices).compute(branch)
+
+    # The branches may be infinite constants
+    out[np.isinf(out)] = math.nan
+    return out
+
+
+def compute_rpn_arrays(programs: Sequence[RpnProgram], inputs: np.ndarray, parameters: Sequence[Value] = (), progress_bar: bool = False,
+                       block_size: int = DEFAULT_BLOCK_SIZE) -> tuple[list[np.ndarray], int]:
+    """Compute the values of every program for all the inputs, with the given values of their parameters (floats, or arrays with one value per input).
+    The sub-trees common to several programs (or repeated in one program) are computed only once.
+    The branches of the conditional functions are only computed on the points where they are chosen.
+    The inputs are computed by blocks of block_size points, so the memory used by intermediate results does not depend on the number of inputs.
+    Return the values of each program, and the number of function evaluations saved compared to computing each program separately."""
+    inputs = np.asarray(inputs, dtype=float)
+    size = inputs.size
+
+    # Build the DAG of all the programs: every unique sub-tree is a node, and the nodes are created in a valid evaluation order
+    nodes: Nodes = {}
+    uses: dict[Hashable, int] = {}
+    roots: list[Hashable] = []
+    function_count = 0
+    # The keys are numbered, so they do not contain the keys of the whole sub-tree, which would take long to hash in deep trees
+    key_numbers: dict[Hashable, int] = {}
+
+    for program in programs:
+        stack: list[Hashable] = []
+        for instruction in program.instructions:
+            children: list[Hashable] = []
+            if instruction.opcode == OpCode.CALL:
+                function_count += 1
+                children = stack[-instruction.arity:]
+                del stack[-instruction.arity:]
+
+            key = key_numbers.setdefault(get_instruction_key(instruction, children), len(key_numbers))
+            if key not in nodes:
+                nodes[key] = (instruction, children)
+                uses[key] = 0
+                for child in _get_eager_children(instruction, children):
+                    uses[child] += 1
+            stack.append(key)
+
+        roots.append(stack[0])
+
+    # Nodes computed on all the points, the others are only in branches of conditional functions
+    eager_nodes: set[Hashable] = set()
+    keys_to_visit = list(roots)
+    while keys_to_visit:
+        if (key := keys_to_visit.pop()) not in eager_nodes:
+            eager_nodes.add(key)
+            keys_to_visit.extend(_get_eager_children(*nodes[key]))
+
+    unique_functions = [instruction for instruction, _ in nodes.values() if instruction.opcode == OpCode.CALL]
+
+    pbar: Optional[tqdm] = None
+    scalar_function_count = sum(1 for instruction in unique_functions if instruction.vectorized is None and not instruction.conditional)
+    if progress_bar and scalar_function_count > 0:
+        pbar = tqdm(total=size * scalar_function_count, leave=False)
+
+    # Every program is written directly in its output array, the first one having a root computing it
+    outputs = [np.empty(size) for _ in programs]
+    root_outputs: dict[Hashable, np.ndarray] = {}
+    for root, output in zip(roots, outputs):
+        root_outputs.setdefault(root, output)
+
+    pool = BufferPool(block_size)
+
+    # Errors are handled with nan masking instead of exceptions
+    with np.errstate(all='ignore'):
+        for start in range(0, size, block_size):
+            block = slice(start, min(start + block_size, size))
+            block_inputs = inputs[block]
+            remaining_uses = uses.copy()
+            values: dict[Hashable, Value] = {}
+            pooled: set[Hashable] = set()
+            written_roots: set[Hashable] = set()
+            block_parameters = _select_points(parameters, block)
+            evaluation = _Evaluation(nodes, block_inputs, block_parameters, pbar, values=values)
+
+            for key, (instruction, children) in nodes.items():
+                if key not in eager_nodes:
+                    continue
+
+                if instruction.opcode == OpCode.LITERAL:
+                    values[key] = float(instruction.value)
+                elif instruction.opcode == OpCode.VARIABLE:
+                    values[key] = block_inputs
+                elif instruction.opcode == OpCode.PARAMETER:
+                    values[key] = block_parameters[instruction.value]
+                else:
+                    out = root_outputs[key][block] if key in root_outputs else pool.get(block_inputs.size)
+                    eager_children = _get_eager_children(instruction, children)
+                    if instruction.conditional:
+                        values[key] = _apply_conditional(instruction, [values[child] for child in eager_children], children[-2:], evaluation, out)
+                    else:
+                        values[key] = _apply_function(instruction, [values[child] for child in children], out, pbar)
+
+                    if values[key] is out:
+                        (written_roots if key in root_outputs else pooled).add(key)
+                    elif key not in root_outputs:
+                        pool.release(out)
+
+                    # The intermediate arrays go back to the pool as soon as they are not needed anymore
+                    for child in eager_children:
+                        remaining_uses[child] -= 1
+                        if remaining_uses[child] == 0 and child in pooled:
+                            pool.release(values.pop(child))
+                            pooled.discard(child)
+
+            for root, output in zip(roots, outputs):
+                if root in written_roots and root_outputs[root] is output:
+                    continue
+                value = values[root]
+                output[block] = value if not (isinstance(value, float) and math.isinf(value)) else math.nan
+
+            for key in pooled:
+                pool.release(values[key])
+
+    if pbar is not None:
+        pbar.close()
+
+    return outputs, function_count - len(unique_functions)
+
+
+def compute_rpn_array(program: RpnProgram, inputs: np.ndarray, parameters: Sequence[Value] = (), progress_bar: bool = False,
+                      block_size: int = DEFAULT_BLOCK_SIZE) -> np.ndarray:
+    """Compute the value of the program for all the inputs at once, with the given values of its parameters.
+    Functions with a vectorized version are applied on whole blocks of inputs, the others are applied point by point.
+    As with compute_rpn_unsafe, the result is nan where a function fails or where it is infinite. Once a point is nan, it stays nan."""
+    return compute_rpn_arrays([program], inputs, parameters=parameters, progress_bar=progress_bar, block_size=block_size)[0][0]
@@ -0,0 +1,97 @@
+import logging
+logging.disable(logging.CRITICAL)
+import os
+import pathlib
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from chplot.functions import DEFAULT_ENVIRONMENT
+from chplot.plot.cache import clear_cache, evict_cache, get_cache_key, load_cached_values, store_values
+from chplot.plot.plot import _generate_graphs, _generate_inputs, _load_functions
+from chplot.plot.plot_parameters import set_default_values
+from chplot.rpn import build_program
+from mock_parameters import MockParameters
+
+
+class TestCacheKey(unittest.TestCase):
+
+    def test_same_key(self):
+        inputs = np.linspace(0, 1, 11)
+        self.assertEqual(get_cache_key(build_program('x 2 *'), inputs), get_cache_key(build_program('x 2 *'), inputs.copy()))
+
+    def test_different_rpn(self):
+        inputs = np.linspace(0, 1, 11)
+        self.assertNotEqual(get_cache_key(build_program('x 2 *'), inputs), get_cache_key(build_program('x 3 *'), inputs))
+
+    def test_different_inputs(self):
+        program = build_program('x 2 *')
+        self.assertNotEqual(get_cache_key(program, np.linspace(0, 1, 11)), get_cache_key(program, np.linspace(0, 1, 12)))
+
+    def test_different_constant_value(self):
+        inputs = np.linspace(0, 1, 11)
+        key = get_cache_key(build_program('x _test_a *', environment=DEFAULT_ENVIRONMENT.with_functions({'_test_a': (0, 1.0)})), inputs)
+        other_key = get_cache_key(build_program('x _test_a *', environment=DEFAULT_ENVIRONMENT.with_functions({'_test_a': (0, 2.0)})), inputs)
+        self.assertNotEqual(key, other_key)
+
+    def test_different_sources(self):
+        # The version of chplot does not change in a checkout which is not installed, but its sources do
+        inputs = np.linspace(0, 1, 11)
+        program = build_program('x 2 *')
+        with patch('chplot.rpn.parse_store._get_sources_hash', return_value='0' * 16):
+            key = get_cache_key(program, inputs)
+        with patch('chplot.rpn.parse_store._get_sources_hash', return_value='1' * 16):
+            other_key = get_cache_key(program, inputs)
+        self.assertNotEqual(key, other_key)
+
+
+class TestCacheFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_dir = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_store_and_load(self):
+        values = np.array([1.0, np.nan, 3.0])
+        store_values(self.cache_dir, 'key', values)
+        np.testing.assert_array_equal(load_cached_values(self.cache_dir, 'key', 3), values)
+
+    def test_missing(self):
+        self.assertIsNone(load_cached_values(self.cache_dir, 'key', 3))
+
+    def test_wrong_size(self):
+        store_values(self.cache_dir, 'key', np.zeros(3))
+        self.assertIsNone(load_cached_values(self.cache_dir, 'key', 4))
+
+    def test_eviction_least_recently_used(self):
+        store_values(self.cache_dir, 'old', np.zeros(1000))
+        store_values(self.cache_dir, 'new', np.zeros(1000))
+        old_path = pathlib.Path(self.cache_dir) / 'old.npy'
+        os.utime(old_path, (0, 0))
+
+        # Enough space for only one of the files
+        evict_cache(self.cache_dir, 10000 / (1024 * 1024))
+        self.assertFalse(old_path.exists())
+        self.assertIsNotNone(load_cached_values(self.cache_dir, 'new', 1000))
+
+    def test_clear(self):
+        store_values(self.cache_dir, 'key', np.zeros(3))
+        clear_cache(self.cache_dir)
+        self.assertListEqual(list(pathlib.Path(self.cache_dir).iterdir()), [])
+
+    def test_generate_graphs(self):
+        parameters = MockParameters(expressions=['x^2', 'sin(x)'], use_cache=True, cache_dir=self.cache_dir)
+        set_default_values(parameters)
+        _load_functions(parameters)
+        inputs = _generate_inputs(parameters)
+        graphs = _generate_graphs(parameters, inputs)
+        self.assertEqual(len(list(pathlib.Path(self.cache_dir).glob('*.npy'))), 2)
+
+        cached_graphs = _generate_graphs(parameters, inputs)
+        for graph, cached_graph in zip(graphs, cached_graphs):
+            np.testing.assert_array_equal(graph.values, cached_graph.values)
@@ -130,7 +130,7 @@ class TestConvertParametersConstants(unittest.TestCase):
 
         convert_parameters_expression(parameters)
 
-        self.assertFunctionDictContains(FUNCTIONS, {'a': (0, 1.0), 'b': (0, 2.0)})
+        self.assertFunctionDictContains(parameters.environment, {'a': (0, 1.0), 'b': (0, 2.0)})
 
     def test_one_simple_constant_with_spaces(self):
         parameters = MockParameters(constants=['a   = 1  ', '  b  = 2 '])
@@ -138,7 +138,7 @@ class TestConvertParametersConstants(unittest.TestCase):
 
         convert_parameters_expression(parameters)
 
-        self.assertFunctionDictContains(FUNCTIONS, {'a': (0, 1.0), 'b': (0, 2.0)})
+        self.assertFunctionDictContains(parameters.environment, {'a': (0, 1.0), 'b': (0, 2.0)})
 
     def test_three_complex_constants(self):
         parameters = MockParameters(constants=['a=sqrt(2)+1', 'b=pi/2-4', 'c=1/(1+4/7)'])
@@ -147,7 +147,7 @@ class TestConvertParametersConstants(unittest.TestCase):
 
         convert_parameters_expression(parameters)
 
-        self.assertFunctionDictContains(FUNCTIONS, {'a': (0, math.sqrt(2) + 1), 'b': (0, math.pi / 2 - 4), 'c': (0, 1 / (1 + 4 / 7))})
+        self.assertFunctionDictContains(parameters.environment, {'a': (0, math.sqrt(2) + 1), 'b': (0, math.pi / 2 - 4), 'c': (0, 1 / (1 + 4 / 7))})
 
     def test_constants_with_parse_error(self):
         parameters = MockParameters(constants=['_new_constant_a', '_new_constant_b:1', '_new_constant_c=34=6'])
@@ -155,7 +155,7 @@ class TestConvertParametersConstants(unittest.TestCase):
 
         convert_parameters_expression(parameters)
 
-        self.assertDictNotContains(FUNCTIONS, ['_new_constant_a', '_new_constant_b', '_new_constant_c'])
+        self.assertDictNotContains(parameters.environment, ['_new_constant_a', '_new_constant_b', '_new_constant_c'])
 
     def test_constants_with_compute_error(self):
         parameters = MockParameters(constants=['_new_constant_a=1+', '_new_constant_b=sin()'])
@@ -163,7 +163,7 @@ class TestConvertParametersConstants(unittest.TestCase):
 
         convert_parameters_expression(parameters)
 
-        self.assertDictNotContains(FUNCTIONS, ['_new_constant_a', '_new_constant_b', '_new_constant_c'])
+        self.assertDictNotContains(parameters.environment, ['_new_constant_a', '_new_constant_b', '_new_constant_c'])
 
     def test_constant_equals_nan(self):
         parameters = MockParameters(constants=['a=1/0', 'b=zeta(1)'])
@@ -172,7 +172,7 @@ class TestConvertParametersConstants(unittest.TestCase):
 
         convert_parameters_expression(parameters)
 
-        self.assertFunctionDictContains(FUNCTIONS, {'a': (0, math.nan), 'b': (0, math.nan)})
+        self.assertFunctionDictContains(parameters.environment, {'a': (0, math.nan), 'b': (0, math.nan)})
 
     def test_constant_successive_use(self):
         parameters = MockParameters(constants=['a=1', 'b=a*2', 'c=b+1'])
@@ -180,7 +180,16 @@ class TestConvertParametersConstants(unittest.TestCase):
 
         convert_parameters_expression(parameters)
 
-        self.assertFunctionDictContains(FUNCTIONS, {'a': (0, 1), 'b': (0, 2), 'c': (0, 3)})
+        self.assertFunctionDictContains(parameters.environment, {'a': (0, 1), 'b': (0, 2), 'c': (0, 3)})
+
+    def test_global_functions_not_modified(self):
+        parameters = MockParameters(constants=['_new_constant_d=1'])
+        set_default_values(parameters)
+
+        convert_parameters_expression(parameters)
+
+        self.assertDictNotContains(FUNCTIONS, ['_new_constant_d'])
+        self.assertTrue(parameters.environment.is_user_function('_new_constant_d'))
 
 
 class TestReplaceImplicitVariableMultiplication(unittest.TestCase):
@@ -106,7 +106,7 @@ class TestReadFile(unittest.TestCase):
         self.assertEqual(graph.type, GraphType.FILE)
         self.assertTrue(np.array_equal(graph.inputs, inputs))
         self.assertEqual(graph.expression, expression)
-        self.assertListEqual(graph.values, values)
+        self.assertListEqual(graph.values.tolist(), values)
 
 
     def test_empty_file(self):
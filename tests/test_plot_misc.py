@@ -1,8 +1,19 @@
 import logging
 logging.disable(logging.CRITICAL)
+import re
 import unittest
+from unittest.mock import patch
 
-from chplot.plot.plot import _get_unrecognized_characters
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+
+from chplot.functions import FUNCTIONS, load_necessary_functions, MEMOIZED_FUNCTIONS
+from chplot.plot.plot import plot, _get_unrecognized_characters, _use_integer_sequences, _use_surrogates
+from chplot.plot.utils import DECORATOR_GETTER_REGEX, plottable
+from chplot.rpn import build_program, uses_surrogates
+from chplot.rpn.surrogate import MIN_SURROGATE_POINTS
+from mock_parameters import MockParameters
 
 
 class TestUnrecognizedCharacters(unittest.TestCase):
@@ -19,3 +30,91 @@ class TestUnrecognizedCharacters(unittest.TestCase):
 
     def test_multiple_unrecognized_characters(self):
         self.assertSetEqual(_get_unrecognized_characters('x?4$5%', 'x 4 5'), {'?', '$', '%'})
+
+
+class TestPlottable(unittest.TestCase):
+
+    def test_no_cache(self):
+        @plottable(1)
+        def func(x: float) -> float:
+            return x + 1
+
+        self.assertEqual(func(1), 2)
+        self.assertFalse(hasattr(func, 'cache_info'))
+
+    def test_cache(self):
+        calls = []
+
+        @plottable(1, cache=True)
+        def func(x: float) -> float:
+            calls.append(x)
+            return x + 1
+
+        self.assertListEqual([func(1), func(2), func(1)], [2, 3, 2])
+        self.assertListEqual(calls, [1, 2])
+        self.assertEqual(func.cache_info().hits, 1)
+        self.assertEqual(func.cache_info().misses, 2)
+
+    def test_cache_size(self):
+        @plottable(arg_count=1, cache=2)
+        def func(x: float) -> float:
+            return x + 1
+
+        for x in range(5):
+            func(x)
+        self.assertEqual(func.cache_info().currsize, 2)
+
+    def test_decorator_regex(self):
+        self.assertListEqual(re.findall(DECORATOR_GETTER_REGEX, '@plottable(2)'), ['2'])
+        self.assertListEqual(re.findall(DECORATOR_GETTER_REGEX, '@plottable(arg_count=3, cache=True)'), ['3'])
+        self.assertListEqual(re.findall(DECORATOR_GETTER_REGEX, '@plottable(0, cache=100)'), ['0'])
+        self.assertListEqual(re.findall(DECORATOR_GETTER_REGEX, '@plottable(cache=True)'), [''])
+
+
+class TestMemoizedFunctions(unittest.TestCase):
+
+    def test_expensive_function_memoized(self):
+        load_necessary_functions(['x primepi'])
+        self.assertIs(FUNCTIONS['primepi'][1], MEMOIZED_FUNCTIONS['primepi'])
+        self.assertEqual(FUNCTIONS['primepi'][1](10), 4)
+
+    def test_loaded_again(self):
+        load_necessary_functions(['x primepi'])
+        memoized_function = MEMOIZED_FUNCTIONS['primepi']
+        load_necessary_functions(['x primepi'])
+        self.assertIs(FUNCTIONS['primepi'][1], memoized_function)
+
+    def test_cheap_function_not_memoized(self):
+        load_necessary_functions(['x sin'])
+        self.assertNotIn('sin', MEMOIZED_FUNCTIONS)
+
+    def _get_logged_statistics(self, expression: str) -> list[tuple]:
+        with patch('chplot.plot.plot.LOGGER') as logger:
+            plot(MockParameters(expressions=[expression], no_plot=True, use_cache=False))
+        return [call.args[1:3] for call in logger.info.call_args_list if call.args[0].startswith('function')]
+
+    def test_statistics_of_each_run(self):
+        first_statistics = self._get_logged_statistics('primepi(x)')
+        self.assertEqual(len(first_statistics), 1)
+        self.assertListEqual(self._get_logged_statistics('primepi(x)'), first_statistics)
+        self.assertListEqual(self._get_logged_statistics('sin(x)'), [])
+
+
+class TestTransformationsByEngine(unittest.TestCase):
+
+    def test_surrogates(self):
+        load_necessary_functions(['x altzeta'])
+        program = build_program('x altzeta')
+        inputs = np.linspace(-3, 5, MIN_SURROGATE_POINTS)
+        for engine, expected in [('auto', True), ('parallel', True), ('scalar', False)]:
+            parameters = MockParameters(engine=engine, surrogate_tolerance=1e-9)
+            self.assertEqual(uses_surrogates(_use_surrogates(parameters, ['altzeta(x)'], [program], inputs)[0]), expected)
+
+    def test_integer_sequences(self):
+        load_necessary_functions(['x primepi'])
+        program = build_program('x primepi')
+        inputs = np.arange(0.0, 1000.0)
+        for engine, expected in [('auto', True), ('parallel', True), ('scalar', False)]:
+            parameters = MockParameters(engine=engine, is_integer=True)
+            sequence_program = _use_integer_sequences(parameters, ['primepi(x)'], [program], inputs)[0]
+            self.assertEqual(sequence_program is not program, expected)
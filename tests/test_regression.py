@@ -19,7 +19,7 @@ class TestCheckRegressionExpression(unittest.TestCase):
     def test_correct_regression_expression(self):
         parameters = MockParameters(regression_expression='_ra * x')
         set_default_values(parameters)
-        self.assertEqual(_check_regression_expression(parameters), '_ra x *')
+        self.assertEqual(str(_check_regression_expression(parameters)), '_ra x *')
 
     def test_mismatched_brackets(self):
         parameters = MockParameters(regression_expression='(_ra * x')
@@ -1,8 +1,19 @@
 import math
+import os
+import pickle
+import tempfile
+import time
 import unittest
-from chplot.functions import load_necessary_functions
+from unittest.mock import patch
 
-from chplot.rpn import compute_rpn_list, compute_rpn_unsafe, get_rpn_errors, pre_compute_rpn
+import numpy as np
+from shunting_yard import MismatchedBracketsError, shunting_yard
+
+from chplot.convert_args import get_default_regression_expression
+from chplot.functions import DEFAULT_ENVIRONMENT, FUNCTIONS, load_necessary_functions, VECTORIZED_FUNCTIONS
+from chplot.functions.environment import Environment, FunctionKind
+from chplot.rpn.surrogate import MIN_SURROGATE_POINTS
+from chplot.rpn import BufferPool, Engine, plan_engine, build_program, clear_parse_cache, compile_expression, compile_rpn, compute_rpn_array, compute_rpn_array_scalar, compute_rpn_arrays, compute_rpn_arrays_parallel, compute_rpn_list, compute_rpn_unsafe, get_rpn_errors, OpCode, parse_expression, parse_program, ParseStore, pre_compute_rpn, set_parse_store, use_integer_sequences, use_surrogates, uses_surrogates
 
 
 class TestRpnValidity(unittest.TestCase):
@@ -16,6 +27,15 @@ class TestRpnValidity(unittest.TestCase):
         error_message = "unknown function: 'unknown_func'"
         self.assertEqual(get_rpn_errors(rpn), error_message)
 
+    def test_exponent_literals(self):
+        # As written by the regressions for their fitted parameters
+        self.assertIsNone(get_rpn_errors('1e-05 x * 3e+20 +'))
+        self.assertEqual(build_program('1e-05 x * 3e+20 +').function(2.0), 2e-05 + 3e+20)
+        self.assertEqual(compute_rpn_unsafe('1e-05 x *'.split(' '), 2.0), 2e-05)
+
+    def test_invalid_number(self):
+        self.assertEqual(get_rpn_errors('1.2.3 x +'), "invalid number: '1.2.3'")
+
     def test_not_enough_parameters(self):
         rpn = '1 +'
         error_message = "not enough parameters for function '+': 1 found, 2 expected."
@@ -26,6 +46,25 @@ class TestRpnValidity(unittest.TestCase):
         error_message = 'expression does not give only one result.'
         self.assertEqual(get_rpn_errors(rpn), error_message)
 
+    def test_functions_not_called(self):
+        calls = []
+        environment = DEFAULT_ENVIRONMENT.with_functions({'_test_func': (1, calls.append)})
+        self.assertIsNone(get_rpn_errors('x _test_func 1 _test_func +', environment=environment))
+        self.assertListEqual(calls, [])
+
+    def test_parse_program(self):
+        program, error = parse_program('x 1 +')
+        self.assertIsNone(error)
+        self.assertEqual(str(program), 'x 1 +')
+
+        program, error = parse_program('x +')
+        self.assertIsNone(program)
+        self.assertEqual(error, "not enough parameters for function '+': 1 found, 2 expected.")
+
+    def test_build_invalid_program(self):
+        with self.assertRaises(ValueError):
+            build_program('1 1')
+
 
 class TestRpnUnsafe(unittest.TestCase):
 
@@ -157,7 +196,7 @@ class TestRpnList(unittest.TestCase):
         rpn = '1 x / 10 *'
         inputs = [-2, -1, 0, 1, 2]
 
-        self.assertListEqual(list(compute_rpn_list(rpn, inputs)), [-5.0, -10.0, math.nan, 10.0, 5.0])
+        np.testing.assert_array_equal(compute_rpn_list(rpn, inputs), [-5.0, -10.0, math.nan, 10.0, 5.0])
 
     def test_rpn_inf_to_nan(self):
         rpn = 'x zeta'
@@ -165,4 +204,751 @@ class TestRpnList(unittest.TestCase):
         load_necessary_functions([rpn])
 
         # The values are zeta(2) and zeta(3)
-        self.assertListEqual(list(compute_rpn_list(rpn, inputs)), [math.nan, 1.6449340668482264, 1.2020569031595942])
+        np.testing.assert_array_equal(compute_rpn_list(rpn, inputs), [math.nan, 1.6449340668482264, 1.2020569031595942])
+
+    def test_rpn_not_vectorized(self):
+        rpn = '1 x / 10 *'
+        inputs = [-2, -1, 0, 1, 2]
+
+        np.testing.assert_array_equal(compute_rpn_list(rpn, inputs, vectorized=False), [-5.0, -10.0, math.nan, 10.0, 5.0])
+
+
+class TestBuildProgram(unittest.TestCase):
+
+    def test_opcodes(self):
+        program = build_program('x 2 ^ _ra *', parameters=('_ra',), optimize=False)
+        self.assertListEqual(
+            [instruction.opcode for instruction in program.instructions],
+            [OpCode.VARIABLE, OpCode.LITERAL, OpCode.CALL, OpCode.PARAMETER, OpCode.CALL]
+        )
+
+    def test_literals_are_parsed(self):
+        program = build_program('x 2 2.5 max3')
+        self.assertEqual(program.instructions[1].value, 2)
+        self.assertIsInstance(program.instructions[1].value, int)
+        self.assertEqual(program.instructions[2].value, 2.5)
+
+    def test_constant_parts_are_computed(self):
+        program = build_program('x 1 1 + * pi +')
+        self.assertListEqual([instruction.value for instruction in program.instructions], [None, 2.0, None, math.pi, None])
+
+    def test_functions_are_resolved(self):
+        program = build_program('x 1 min')
+        self.assertIs(program.instructions[-1].function, min)
+        self.assertEqual(program.instructions[-1].arity, 2)
+
+    def test_max_stack_depth(self):
+        self.assertEqual(build_program('x').max_stack_depth, 1)
+        self.assertEqual(build_program('x 1 +').max_stack_depth, 2)
+        self.assertEqual(build_program('x 1 x 2 x min3 + *').max_stack_depth, 5)
+
+    def test_rpn_is_kept(self):
+        self.assertEqual(str(build_program('x 1 +')), 'x 1 +')
+
+
+
+class TestSimplifyProgram(unittest.TestCase):
+
+    def assertSimplified(self, rpn: str, expected: str, parameters: tuple[str, ...] = (), environment=DEFAULT_ENVIRONMENT):
+        load_necessary_functions([rpn])
+        self.assertEqual(build_program(rpn, parameters=parameters, environment=environment).optimized_rpn, expected)
+
+    def test_identities(self):
+        self.assertSimplified('x 1 *', 'x')
+        self.assertSimplified('1 x *', 'x')
+        self.assertSimplified('x 0 +', 'x')
+        self.assertSimplified('x 0 -', 'x')
+        self.assertSimplified('0 x -', 'x -u')
+        self.assertSimplified('x 1 /', 'x')
+        self.assertSimplified('x 1 ^', 'x')
+        self.assertSimplified('x +u', 'x')
+        self.assertSimplified('x -u -u', 'x')
+
+    def test_nan_is_kept(self):
+        self.assertSimplified('x 0 *', 'x 0 *')
+        self.assertSimplified('x 0 ^', 'x 0 ^')
+
+    def test_reassociation(self):
+        self.assertSimplified('x 3 + 2 -', 'x 1.0 +')
+        self.assertSimplified('2 x * 3 *', 'x 6.0 *')
+        self.assertSimplified('x 1 + 1 -', 'x')
+
+    def test_powers(self):
+        self.assertSimplified('x 2 ^', 'x x *')
+        self.assertSimplified('x 3 ^', 'x x * x *')
+        self.assertSimplified('x 2 -u ^', '1.0 x x * /')
+        self.assertSimplified('x 0.5 ^', 'x sqrt')
+        self.assertSimplified('x 5 ^', 'x 5 ^')
+
+    def test_parameters(self):
+        self.assertSimplified('_ra x 2 ^ * sin _rb *', '_ra x x * * sin _rb *', parameters=('_ra', '_rb'))
+
+    def test_negation(self):
+        self.assertSimplified('x x sin -u +', 'x x sin -')
+        self.assertSimplified('x x sin -u -', 'x x sin +')
+
+    def test_horner_form(self):
+        self.assertSimplified('3 x 2 ^ * 2 x * + 1 +', '3 x * 2 + x * 1 +')
+        self.assertSimplified('x 3 ^ x -', 'x x * -1.0 + x *')
+        self.assertSimplified('_ra x 2 ^ * _rb x * + _rc +', '_ra x * _rb + x * _rc +', parameters=('_ra', '_rb', '_rc'))
+        self.assertSimplified('x 100 ^ 1 +', 'x 100 ^ 1 +')
+        self.assertSimplified('x 1 + 2 ^ x +', 'x 1 + x 1 + * x +')
+
+    def test_horner_form_of_polynomial_regression(self):
+        expression = get_default_regression_expression('p10')
+        parameters = tuple(f'_ra{degree}' for degree in range(11))
+        program = build_program(parse_expression(expression), parameters=parameters)
+        self.assertEqual(program.optimized_rpn, '_ra10 x * ' + ' x * '.join(f'_ra{degree} +' for degree in range(9, -1, -1)))
+
+        inputs = np.linspace(-2, 2, 41)
+        coefficients = np.linspace(-1, 1, 11)
+        expected = compute_rpn_array(build_program(program.rpn, parameters=parameters, optimize=False), inputs, parameters=coefficients)
+        np.testing.assert_allclose(compute_rpn_array(program, inputs, parameters=coefficients), expected, rtol=1e-9, atol=1e-12)
+        np.testing.assert_allclose(compute_rpn_array(program, inputs, parameters=coefficients), np.polyval(coefficients[::-1], inputs), rtol=1e-9, atol=1e-12)
+
+    def test_user_functions_are_kept(self):
+        environment = DEFAULT_ENVIRONMENT.with_functions({'f': (1, lambda x: x)})
+        self.assertSimplified('x f 1 *', 'x f', environment=environment)
+        self.assertSimplified('x f x f +', 'x f x f +', environment=environment)
+
+    def test_same_values(self):
+        inputs = np.linspace(-3, 3, 61)
+        for rpn in ('x 2 ^ sin 3 ^', 'x 0.5 ^ 1 *', 'x 2 -u ^ 1 + 2 -', '2 x * 3 * -u -u', 'x 4 ^ 1 x / +', 'x 3 ^ x 2 ^ 2 * - 5 +', 'x 2 ^ x sin -u +'):
+            load_necessary_functions([rpn])
+            expected = compute_rpn_array(build_program(rpn, optimize=False), inputs)
+            np.testing.assert_allclose(compute_rpn_array(build_program(rpn), inputs), expected, rtol=1e-12)
+            np.testing.assert_allclose([compile_rpn(rpn)(x) for x in inputs], expected, rtol=1e-12)
+
+class TestCompileRpn(unittest.TestCase):
+
+    def assertSameAsScalar(self, rpn: str, inputs: list[float], variable: str = 'x'):
+        load_necessary_functions([rpn])
+        rpn_tokens = rpn.split(' ')
+        function = compile_rpn(rpn, variable=variable)
+        for x in inputs:
+            expected = compute_rpn_unsafe(rpn_tokens, x, variable=variable)
+            if math.isnan(expected):
+                self.assertTrue(math.isnan(function(x)))
+            else:
+                self.assertEqual(function(x), expected)
+
+    def test_operations(self):
+        for rpn in ('x 1 +', 'x 2 -', 'x x *', '1 x /', 'x 2 ^', 'x -u', 'x +u', 'x 0.5 ^', '2 x ^', 'x 1 2 + * 3 -'):
+            self.assertSameAsScalar(rpn, [-2.0, -0.5, 0.0, 1.0, 3.5])
+
+    def test_functions(self):
+        for rpn in ('x sin', 'x sqrt x ln +', 'x zeta', 'x 1 2 min3', 'x sec', 'x pi * cos e ^'):
+            self.assertSameAsScalar(rpn, [-2.0, -0.5, 0.0, 1.0, 3.5])
+
+    def test_pre_computed_parts(self):
+        self.assertEqual(compile_rpn('x 1 2 + *')(2.0), 6.0)
+
+    def test_only_constant(self):
+        self.assertEqual(compile_rpn('pi')(0.0), math.pi)
+        self.assertTrue(math.isnan(compile_rpn('inf')(0.0)))
+
+    def test_parameters(self):
+        program = build_program('_ra x * _rb +', parameters=('_ra', '_rb'))
+        self.assertEqual(program.function(2.0, 3.0, -1.0), 5.0)
+
+    def test_other_variable(self):
+        self.assertSameAsScalar('t t * 1 +', [-1.0, 2.0], variable='t')
+
+
+class TestRpnArray(unittest.TestCase):
+
+    def assertSameAsScalar(self, rpn: str, inputs: np.ndarray):
+        load_necessary_functions([rpn])
+        rpn_tokens = rpn.split(' ')
+        expected = [compute_rpn_unsafe(rpn_tokens, float(x)) for x in inputs]
+        np.testing.assert_allclose(compute_rpn_array(build_program(rpn), inputs), expected, rtol=1e-12)
+
+    def test_base_operations(self):
+        inputs = np.linspace(-3, 3, 101)
+        for rpn in ('x 1 +', 'x 2 -', 'x x *', '1 x /', 'x 2 ^', 'x -u', 'x +u', 'x 0.5 ^', '2 x ^'):
+            self.assertSameAsScalar(rpn, inputs)
+
+    def test_builtins(self):
+        inputs = np.linspace(-3, 3, 101)
+        for rpn in ('x abs', 'x 1 min', 'x 1 max', 'x 1 2 min3', 'x 0 1 -u 1 max4'):
+            self.assertSameAsScalar(rpn, inputs)
+
+    def test_math_functions(self):
+        inputs = np.linspace(-3, 3, 101)
+        for rpn in ('x sin', 'x sqrt', 'x ln', 'x atanh', 'x acos', 'x exp 2 atan2', 'x gamma', 'x lgamma', 'x erf', 'x 1 0 2 dist', 'x 0 fmod'):
+            self.assertSameAsScalar(rpn, inputs)
+
+    def test_scalar_fallback(self):
+        inputs = np.linspace(-3, 3, 101)
+        for rpn in ('x zeta', 'x sec 2 ^', 'x 1 remainder', 'x 0 1 normpdf x *'):
+            self.assertSameAsScalar(rpn, inputs)
+
+    def test_overflow_is_nan(self):
+        rpn = 'x exp 1 +'
+        load_necessary_functions([rpn])
+        np.testing.assert_array_equal(compute_rpn_array(build_program(rpn), [0, 1000]), [2.0, math.nan])
+
+    def test_nan_is_kept(self):
+        rpn = 'x sqrt 0 ^'
+        load_necessary_functions([rpn])
+        np.testing.assert_array_equal(compute_rpn_array(build_program(rpn), [-1, 1]), [math.nan, 1.0])
+
+    def test_constant_expression(self):
+        rpn = '2 pi *'
+        np.testing.assert_array_equal(compute_rpn_array(build_program(rpn), [0, 1, 2]), [2 * math.pi] * 3)
+
+    def test_only_variable(self):
+        inputs = np.array([1.0, 2.0])
+        result = compute_rpn_array(build_program('x'), inputs)
+        np.testing.assert_array_equal(result, inputs)
+        self.assertIsNot(result, inputs)
+
+
+class TestRpnArrays(unittest.TestCase):
+
+    def assertSameAsSeparate(self, rpns: list[str], inputs: np.ndarray):
+        load_necessary_functions(rpns)
+        programs = [build_program(rpn) for rpn in rpns]
+        results, _ = compute_rpn_arrays(programs, inputs)
+        for program, result in zip(programs, results):
+            np.testing.assert_array_equal(result, compute_rpn_array(program, inputs))
+
+    def test_same_as_separate(self):
+        inputs = np.linspace(-3, 3, 101)
+        self.assertSameAsSeparate(['x 2 ^ -u exp', 'x 2 ^ -u exp x *', 'x 2 ^ -u exp x sin +', 'x', 'pi', 'x sqrt x sqrt /'], inputs)
+
+    def test_saved_evaluations(self):
+        rpns = ['x 2 ^ -u exp', 'x 2 ^ -u exp x *', 'x 2 ^ 1 +']
+        load_necessary_functions(rpns)
+        _, saved_evaluations = compute_rpn_arrays([build_program(rpn) for rpn in rpns], [0.0, 1.0])
+        # 'x 2 ^ -u exp' once, then 'x 2 ^' once
+        self.assertEqual(saved_evaluations, 3 + 1)
+
+    def test_repeated_in_one_expression(self):
+        rpn = 'x sin x sin *'
+        load_necessary_functions([rpn])
+        results, saved_evaluations = compute_rpn_arrays([build_program(rpn)], [0.0, 1.0])
+        self.assertEqual(saved_evaluations, 1)
+        np.testing.assert_allclose(results[0], [0.0, math.sin(1.0) ** 2])
+
+    def test_no_program(self):
+        self.assertEqual(compute_rpn_arrays([], [0.0, 1.0]), ([], 0))
+
+    def test_blocks(self):
+        rpns = ['x 2 ^ -u exp', 'x 2 ^ -u exp x sin +', 'x 6 remainder', 'x', 'pi']
+        load_necessary_functions(rpns)
+        programs = [build_program(rpn) for rpn in rpns]
+        inputs = np.arange(-10.0, 11.0)
+        expected, _ = compute_rpn_arrays(programs, inputs)
+        for block_size in (1, 4, 7, 1000):
+            results, _ = compute_rpn_arrays(programs, inputs, block_size=block_size)
+            for result, expected_result in zip(results, expected):
+                np.testing.assert_array_equal(result, expected_result)
+
+
+class TestBufferPool(unittest.TestCase):
+
+    def test_reuse(self):
+        pool = BufferPool(16)
+        buffer = pool.get(16)
+        pool.release(buffer)
+        self.assertIs(pool.get(5).base, buffer.base)
+
+    def test_size(self):
+        pool = BufferPool(16)
+        self.assertEqual(pool.get(5).size, 5)
+        self.assertEqual(pool.get(16).size, 16)
+
+
+class TestRpnArraysParallel(unittest.TestCase):
+
+    def test_same_as_single_process(self):
+        rpns = ['x 2 polylog', 'x zeta x sin +']
+        load_necessary_functions(rpns)
+        programs = [build_program(rpn) for rpn in rpns]
+        inputs = np.linspace(-2, 0.9, 50)
+        results = compute_rpn_arrays_parallel(programs, inputs, 2)
+        for program, result in zip(programs, results):
+            np.testing.assert_array_equal(result, compute_rpn_array(program, inputs))
+
+    def test_user_functions(self):
+        environment = DEFAULT_ENVIRONMENT.with_functions({'_test_constant': (0, 3.0)})
+        rpn = 'x _test_constant * fac'
+        load_necessary_functions([rpn])
+        self.assertListEqual(compute_rpn_list(rpn, [1.0, 2.0], progress_bar=False, jobs=2, environment=environment), [6.0, 720.0])
+
+    def test_no_program(self):
+        self.assertListEqual(compute_rpn_arrays_parallel([], [1.0, 2.0], 2), [])
+
+    def test_surrogates(self):
+        program, surrogates = use_surrogates(build_program('x altzeta x sin *'), np.linspace(-3, 5, MIN_SURROGATE_POINTS), 1e-9)
+        inputs = np.linspace(-3, 5, 2 * MIN_SURROGATE_POINTS)
+        self.assertEqual(len(surrogates), 1)
+        np.testing.assert_array_equal(compute_rpn_arrays_parallel([program], inputs, 2)[0], compute_rpn_array(program, inputs))
+
+    def test_integer_sequences(self):
+        rpns = ['x fac', 'x primepi']
+        load_necessary_functions(rpns)
+        programs = [use_integer_sequences(build_program(rpn))[0] for rpn in rpns]
+        inputs = np.arange(0.0, 171.0)
+        results = compute_rpn_arrays_parallel(programs, inputs, 2)
+        for program, result in zip(programs, results):
+            np.testing.assert_array_equal(result, compute_rpn_array(program, inputs))
+
+
+class TestParseExpression(unittest.TestCase):
+
+    def setUp(self):
+        clear_parse_cache()
+
+    def test_parse(self):
+        self.assertEqual(parse_expression('2*x + 1'), '2 x * 1 +')
+        self.assertEqual(parse_expression('2*t', variable='t'), '2 t *')
+
+    def test_parsed_once(self):
+        with patch('chplot.rpn.parsing.shunting_yard', wraps=shunting_yard) as mocked_shunting_yard:
+            parse_expression('sin(x)')
+            parse_expression('sin(x)')
+            parse_expression('sin(x)', variable=None)
+            parse_expression('sin(x)', convert_scientific_notation=False)
+        self.assertEqual(mocked_shunting_yard.call_count, 3)
+
+    def test_error_raised_each_time(self):
+        for _ in range(2):
+            with self.assertRaises(MismatchedBracketsError):
+                parse_expression('(x')
+
+    def test_new_error_each_time(self):
+        exceptions = []
+        for _ in range(2):
+            with self.assertRaises(MismatchedBracketsError) as context:
+                parse_expression('(x')
+            exceptions.append(context.exception)
+        self.assertIsNot(exceptions[0], exceptions[1])
+        self.assertEqual(str(exceptions[0]), str(exceptions[1]))
+
+    def test_cache_size(self):
+        with patch('chplot.rpn.parsing.MAX_PARSE_CACHE_SIZE', 2), patch('chplot.rpn.parsing.shunting_yard', wraps=shunting_yard) as mocked_shunting_yard:
+            for expression in ['x + 1', 'x + 2', 'x + 1', 'x + 3', 'x + 1', 'x + 2']:
+                parse_expression(expression)
+        # 'x + 2' is removed when 'x + 3' is added, as 'x + 1' was used more recently
+        self.assertEqual(mocked_shunting_yard.call_count, 4)
+
+
+class TestParseStore(unittest.TestCase):
+
+    def setUp(self):
+        clear_parse_cache()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'expressions.sqlite')
+
+    def tearDown(self):
+        set_parse_store(None)
+        clear_parse_cache()
+        self.directory.cleanup()
+
+    def test_store_and_get(self):
+        store = ParseStore(self.path)
+        store.add(('2*x', 'x', True), '2 x *')
+        store.save()
+        store.close()
+
+        store = ParseStore(self.path)
+        self.assertEqual(store.get(('2*x', 'x', True)), '2 x *')
+        self.assertIsNone(store.get(('2*x', None, True)))
+        self.assertIsNone(store.get(('2*x', 'x', False)))
+        store.close()
+
+    def test_errors(self):
+        store = ParseStore(self.path)
+        store.add(('(x', 'x', True), MismatchedBracketsError('error'))
+        store.add(('x)', 'x', True), ValueError('error'))
+        store.save()
+        self.assertIsInstance(store.get(('(x', 'x', True)), MismatchedBracketsError)
+        self.assertIsInstance(store.get(('x)', 'x', True)), ValueError)
+        store.close()
+
+    def test_parse_expression_uses_store(self):
+        store = ParseStore(self.path)
+        set_parse_store(store)
+        parse_expression('sin(x)')
+        with self.assertRaises(MismatchedBracketsError):
+            parse_expression('(x')
+        store.save()
+        clear_parse_cache()
+
+        with patch('chplot.rpn.parsing.shunting_yard', wraps=shunting_yard) as mocked_shunting_yard:
+            self.assertEqual(parse_expression('sin(x)'), 'x sin')
+            with self.assertRaises(MismatchedBracketsError):
+                parse_expression('(x')
+        self.assertEqual(mocked_shunting_yard.call_count, 0)
+        store.close()
+
+    def test_sources_changed(self):
+        with patch('chplot.rpn.parse_store._get_sources_hash', return_value='0' * 16):
+            store = ParseStore(self.path)
+        store.add(('2*x', 'x', True), '2 x *')
+        store.save()
+        store.close()
+
+        with patch('chplot.rpn.parse_store._get_sources_hash', return_value='1' * 16):
+            store = ParseStore(self.path)
+        self.assertIsNone(store.get(('2*x', 'x', True)))
+        store.close()
+
+    def test_max_entries(self):
+        store = ParseStore(self.path, max_entries=2)
+        for index in range(3):
+            store.add((f'x+{index}', 'x', True), f'x {index} +')
+            store.save()
+            time.sleep(0.01)
+        self.assertIsNone(store.get(('x+0', 'x', True)))
+        self.assertEqual(store.get(('x+2', 'x', True)), 'x 2 +')
+        store.close()
+
+    def test_max_age(self):
+        store = ParseStore(self.path, max_age=-1)
+        store.add(('x+1', 'x', True), 'x 1 +')
+        store.save()
+        self.assertIsNone(store.get(('x+1', 'x', True)))
+        store.close()
+
+
+class TestEnvironment(unittest.TestCase):
+
+    def test_layers(self):
+        environment = DEFAULT_ENVIRONMENT.with_functions({'a': (0, 1.0)})
+        other_environment = environment.with_functions({'a': (0, 2.0), '_test_b': (0, 3.0)})
+        self.assertEqual(environment['a'], (0, 1.0))
+        self.assertNotIn('_test_b', environment)
+        self.assertEqual(other_environment['a'], (0, 2.0))
+        self.assertEqual(other_environment['+'], FUNCTIONS['+'])
+        self.assertNotIn('a', DEFAULT_ENVIRONMENT)
+        self.assertNotIn('a', FUNCTIONS)
+
+    def test_user_function_hides_library_function(self):
+        environment = DEFAULT_ENVIRONMENT.with_functions({'abs': (1, lambda x: 2 * x)})
+        self.assertTrue(environment.is_user_function('abs'))
+        self.assertIsNone(environment.get_vectorized('abs'))
+        self.assertIs(DEFAULT_ENVIRONMENT.get_vectorized('abs'), VECTORIZED_FUNCTIONS['abs'][1])
+        self.assertListEqual(compute_rpn_list('x abs', [-1.0], progress_bar=False, environment=environment), [-2.0])
+        self.assertListEqual(compute_rpn_list('x abs', [-1.0], progress_bar=False), [1.0])
+
+    def test_program_environment(self):
+        environment = DEFAULT_ENVIRONMENT.with_functions({'a': (0, 2.0)})
+        program = build_program('x a *', environment=environment)
+        self.assertIs(program.environment, environment)
+        self.assertEqual(program.function(3.0), 6.0)
+        with self.assertRaises(ValueError):
+            build_program('x a *')
+
+
+class TestPlanEngine(unittest.TestCase):
+
+    def test_few_points(self):
+        self.assertEqual(plan_engine(build_program('x sin'), 10)[0], Engine.SCALAR)
+
+    def test_vectorizable(self):
+        load_necessary_functions(['x sin'])
+        self.assertEqual(plan_engine(build_program('x sin'), 10000, jobs=4)[0], Engine.VECTORIZED)
+
+    def test_point_by_point(self):
+        load_necessary_functions(['x altzeta'])
+        program = build_program('x altzeta')
+        engine, reason = plan_engine(program, 100000, jobs=4)
+        self.assertEqual(engine, Engine.PARALLEL)
+        self.assertIn("'altzeta' (mpmath)", reason)
+        self.assertEqual(plan_engine(program, 100000, jobs=1)[0], Engine.VECTORIZED)
+        self.assertEqual(plan_engine(program, 1000, jobs=4)[0], Engine.VECTORIZED)
+
+    def test_user_function(self):
+        program = build_program('x f', environment=DEFAULT_ENVIRONMENT.with_functions({'f': (1, abs)}))
+        self.assertIn("'f' (user)", plan_engine(program, 100000, jobs=4)[1])
+
+    def test_forced_engine(self):
+        self.assertEqual(plan_engine(build_program('x'), 10, engine=Engine.PARALLEL), (Engine.PARALLEL, 'chosen by the user'))
+
+    def test_scalar_engine_values(self):
+        load_necessary_functions(['x sqrt'])
+        program = build_program('x sqrt 1 x / +')
+        inputs = np.linspace(-1, 1, 21)
+        np.testing.assert_array_equal(compute_rpn_array_scalar(program, inputs), compute_rpn_array(program, inputs))
+
+
+class TestConditionalFunctions(unittest.TestCase):
+
+    def assertSameEngines(self, rpn, inputs):
+        load_necessary_functions([rpn])
+        program = build_program(rpn)
+        np.testing.assert_array_equal(compute_rpn_array_scalar(program, inputs), compute_rpn_array(program, inputs))
+
+    def test_chosen_branch_only(self):
+        calls = []
+        def count(x):
+            calls.append(x)
+            return x
+        program = build_program('x 0 x _test_count if', environment=DEFAULT_ENVIRONMENT.with_functions({'_test_count': (1, count)}))
+        inputs = np.array([-2.0, -1.0, 1.0, 2.0])
+        np.testing.assert_array_equal(compute_rpn_array(program, inputs), [-2.0, -1.0, 0.0, 0.0])
+        self.assertListEqual(calls, [-2.0, -1.0])
+        calls.clear()
+        self.assertListEqual([program.function(x) for x in inputs], [-2.0, -1.0, 0.0, 0.0])
+        self.assertListEqual(calls, [-2.0, -1.0])
+
+    def test_unselected_branch_errors(self):
+        load_necessary_functions(['x sqrt'])
+        program = build_program('x x sqrt 0 if')
+        inputs = np.array([-1.0, 0.0, 4.0, np.nan])
+        np.testing.assert_array_equal(compute_rpn_array(program, inputs), [0.0, 0.0, 2.0, np.nan])
+        self.assertSameEngines('x x sqrt 0 if', inputs)
+
+    def test_same_as_scalar(self):
+        inputs = np.linspace(-3, 3, 61)
+        for rpn in ['x 1 -u 1 x 2 ^ x ln out', 'x 0 1 x x sin in', 'x x x ln x sqrt if 1 ifn', 'x x sin x sin 2 * if x sin +']:
+            self.assertSameEngines(rpn, inputs)
+
+
+class TestNanCompaction(unittest.TestCase):
+
+    def test_only_valid_points(self):
+        sizes = []
+        def vectorized_sqrt(x):
+            sizes.append(x.size)
+            return np.sqrt(x)
+        environment = Environment({'_test_sqrt': (1, math.sqrt), 'ln': FUNCTIONS['ln']}, {'_test_sqrt': (1, vectorized_sqrt)}, {})
+        program = build_program('x ln _test_sqrt', environment=environment)
+        inputs = np.linspace(-3, 1, 5)
+        np.testing.assert_array_equal(compute_rpn_array(program, inputs), [math.nan, math.nan, math.nan, math.nan, 0.0])
+        self.assertListEqual(sizes, [1])
+
+    def test_same_as_without_compaction(self):
+        rpns = ['1 x 2 ^ - sqrt x 3 * sin *', 'x ln x exp * x sqrt +', 'x x 0.5 - sqrt 1 x - sqrt if']
+        load_necessary_functions(rpns)
+        programs = [build_program(rpn) for rpn in rpns]
+        inputs = np.linspace(-5, 5, 1001)
+        with patch('chplot.rpn.vectorized.NAN_COMPACTION_THRESHOLD', 2.0):
+            expected, _ = compute_rpn_arrays(programs, inputs)
+        with patch('chplot.rpn.vectorized.NAN_COMPACTION_THRESHOLD', 0.0):
+            results, _ = compute_rpn_arrays(programs, inputs)
+        for result, expected_result in zip(results, expected):
+            np.testing.assert_array_equal(result, expected_result)
+
+
+class TestCompileExpression(unittest.TestCase):
+
+    def test_float_and_array(self):
+        f = compile_expression('sqrt(1-x^2)*sin(x)')
+        self.assertAlmostEqual(f(0.5), math.sqrt(0.75) * math.sin(0.5))
+        inputs = np.linspace(-2, 2, 9).reshape(3, 3)
+        values = f(inputs)
+        self.assertEqual(values.shape, (3, 3))
+        with np.errstate(invalid='ignore'):
+            np.testing.assert_allclose(values, np.sqrt(1 - inputs ** 2) * np.sin(inputs))
+
+    def test_constants_and_plugins(self):
+        f = compile_expression('a*g(t)', variable='t', constants={'b': 2, 'a': 'b+1'}, plugins={'g': (1, abs), 'h': (1, print)})
+        self.assertEqual(f(-2.0), 6.0)
+        self.assertDictEqual(f.user_functions, {'a': (0, 3.0), 'g': (1, abs)})
+        self.assertEqual(f.functions, ('g', '*'))
+        self.assertFalse(f.is_vectorizable)
+
+    def test_picklable(self):
+        f = compile_expression('x^2+c', constants={'c': 1})
+        f(1.0)
+        g = pickle.loads(pickle.dumps(f))
+        self.assertEqual(g.rpn, f.rpn)
+        np.testing.assert_array_equal(g(np.arange(5.0)), [1.0, 2.0, 5.0, 10.0, 17.0])
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            compile_expression('2*(x')
+        with self.assertRaises(ValueError):
+            compile_expression('unknown_func(x)')
+
+
+class TestSurrogates(unittest.TestCase):
+
+    def setUp(self):
+        load_necessary_functions(['x altzeta'])
+
+    def test_accuracy(self):
+        program = build_program('x altzeta x sin *')
+        inputs = np.linspace(-3, 5, MIN_SURROGATE_POINTS)
+        surrogate_program, surrogates = use_surrogates(program, inputs, 1e-9)
+        self.assertEqual(len(surrogates), 1)
+        self.assertEqual(surrogates[0].program.rpn, 'x altzeta')
+        self.assertTrue(uses_surrogates(surrogate_program))
+
+        values = compute_rpn_array(surrogate_program, inputs)
+        for index in range(0, inputs.size, 97):
+            self.assertAlmostEqual(values[index], program.function(inputs[index]), delta=1e-8)
+        self.assertLess(surrogates[0].sample_count, inputs.size // 4)
+        # The compiled function still computes the expression exactly
+        self.assertEqual(surrogate_program.function(0.5), program.function(0.5))
+
+    def test_exact_where_not_defined(self):
+        program = build_program('x sqrt altzeta')
+        inputs = np.linspace(-3, 5, MIN_SURROGATE_POINTS)
+        surrogate_program, surrogates = use_surrogates(program, inputs, 1e-9)
+        values = compute_rpn_array(surrogate_program, inputs)
+        np.testing.assert_array_equal(np.isnan(values), inputs < 0)
+        self.assertGreater(surrogates[0].exact_fraction, 0.0)
+
+    def test_not_used(self):
+        inputs = np.linspace(-3, 5, MIN_SURROGATE_POINTS)
+        for rpn in ['x sin', '2 altzeta x *']:
+            load_necessary_functions([rpn])
+            program = build_program(rpn)
+            self.assertIs(use_surrogates(program, inputs, 1e-9)[0], program)
+        program = build_program('x altzeta')
+        self.assertIs(use_surrogates(program, inputs[:100], 1e-9)[0], program)
+        self.assertFalse(uses_surrogates(program))
+
+
+class TestReductions(unittest.TestCase):
+
+    def test_sum_and_prod(self):
+        inputs = np.linspace(-2, 2, 101)
+        for expression, expected in [('sum(k, 1, 10, x^k/k)', sum(inputs ** k / k for k in range(1, 11))),
+                                     ('prod(k, 1, 5, x+k)', np.prod([inputs + k for k in range(1, 6)], axis=0)),
+                                     ('sum(n, 1, 4, sum(k, 1, n, k*x))', sum(k * inputs for n in range(1, 5) for k in range(1, n + 1)))]:
+            program = build_program(parse_expression(expression))
+            np.testing.assert_allclose(compute_rpn_array(program, inputs), expected)
+            np.testing.assert_allclose(compute_rpn_array_scalar(program, inputs), expected)
+            self.assertTrue(program.is_vectorizable)
+
+    def test_bounds(self):
+        program = build_program(parse_expression('sum(k, 1, x, k)'))
+        inputs = np.array([-1.0, 0.5, 3.0, 4.9, np.nan])
+        np.testing.assert_array_equal(compute_rpn_array(program, inputs), [0.0, 0.0, 6.0, 10.0, np.nan])
+        self.assertTrue(math.isnan(program.function(math.nan)))
+        self.assertTrue(math.isnan(program.function(1e7)))
+
+    def test_constant_folded(self):
+        program = build_program(parse_expression('sum(k, 1, 100, 1/k^2) + prod(k, 1, 5, k)'))
+        self.assertEqual(len(program.instructions), 1)
+        self.assertAlmostEqual(program.instructions[0].value, sum(1 / k ** 2 for k in range(1, 101)) + 120)
+
+    def test_errors(self):
+        self.assertEqual(get_rpn_errors('1 1 10 x sum'), "the first parameter of 'sum' must be the name of its index.")
+        self.assertEqual(get_rpn_errors('k 1 10 y sum'), "in the sum over 'k': unknown function: 'y'")
+
+    def test_long_expression(self):
+        # Hundreds of terms written one after the other give a very deep tree
+        expression = '+'.join(f'sin({2 * k - 1}*x)/{2 * k - 1}' for k in range(1, 2001))
+        load_necessary_functions(['x sin'])
+        program = build_program(parse_expression(expression))
+        inputs = np.linspace(0.1, 3, 11)
+        np.testing.assert_allclose(compute_rpn_array(program, inputs), compute_rpn_array_scalar(program, inputs))
+        np.testing.assert_allclose(compute_rpn_array(program, inputs), np.full(inputs.size, math.pi / 4), atol=0.01)
+
+
+class TestIntegerSequences(unittest.TestCase):
+
+    def test_same_values(self):
+        inputs = np.arange(-10, 400, dtype=float)
+        for expression in ['primepi(x)', 'primepi(x/3)', 'factorial(x)', 'fac2(x)', 'harmonic(x)', 'fib(x)', 'fib(x/2)']:
+            rpn = parse_expression(expression)
+            load_necessary_functions([rpn])
+            program = build_program(rpn)
+            sequence_program, tokens = use_integer_sequences(program)
+            self.assertEqual(len(tokens), 1)
+            self.assertTrue(sequence_program.is_vectorizable)
+            np.testing.assert_allclose(compute_rpn_array(sequence_program, inputs), compute_rpn_array(program, inputs), rtol=1e-12)
+
+    def test_primepi(self):
+        load_necessary_functions(['x primepi'])
+        program, _ = use_integer_sequences(build_program('x primepi'))
+        np.testing.assert_array_equal(compute_rpn_array(program, np.array([-1.0, 2.0, 10.0, 10.5, 1e6, np.nan])), [0.0, 1.0, 4.0, 4.0, 78498.0, np.nan])
+
+    def test_user_function_kept(self):
+        environment = DEFAULT_ENVIRONMENT.with_functions({'fib': (1, lambda x: 2 * x)})
+        program = build_program('x fib', environment=environment)
+        self.assertIs(use_integer_sequences(program)[0], program)
+
+
+class TestVectorizedMpmath(unittest.TestCase):
+
+    def test_same_values_as_mpmath(self):
+        inputs = np.concatenate((np.linspace(-5, 5, 41), [0.0, 1.0, -1.0]))
+        for expression in ['sec(x)', 'acot(x)', 'coth(x)', 'asech(x)', 'sinc(x)', 'Ei(x)', 'harmonic(x)', 'fib(3x)',
+                           'legendre(5, x/5)', 'chebyu(2.5, x/5)', 'hermite(3, x)', 'laguerre(4, 0.5, x)', 'jacobi(3, 1, 2, x/5)', 'gegenbauer(4, 1.5, x/5)']:
+            rpn = parse_expression(expression)
+            load_necessary_functions([rpn])
+            program = build_program(rpn)
+            self.assertTrue(program.is_vectorizable, expression)
+            exact_values = compute_rpn_array_scalar(program, inputs)
+            values = compute_rpn_array(program, inputs)
+            np.testing.assert_array_equal(np.isnan(values), np.isnan(exact_values), expression)
+            valid = ~np.isnan(values)
+            np.testing.assert_array_less(np.abs(values - exact_values)[valid], 1e-12 * np.maximum(1, np.abs(exact_values[valid])), expression)
+
+    def test_exact_mpmath(self):
+        load_necessary_functions(['x legendre'])
+        environment = DEFAULT_ENVIRONMENT.with_exact_mpmath()
+        self.assertEqual(environment.get_kind('legendre'), FunctionKind.MPMATH)
+        self.assertTrue(environment.with_functions({'a': (0, 1.0)}).exact_mpmath)
+        self.assertFalse(build_program('2 x legendre', environment=environment).is_vectorizable)
+        self.assertFalse(compile_expression('legendre(2, x)', exact_mpmath=True).is_vectorizable)
+        self.assertTrue(compile_expression('legendre(2, x)').is_vectorizable)
+
+
+class TestFastMpmath(unittest.TestCase):
+
+    def test_same_values_as_mpmath(self):
+        inputs = np.linspace(-5, 5, 41)
+        for expression in ['siegelz(5x)', 'primezeta(x/2 + 3.5)', 'clsin(2, x)', 'polylog(3, x)', 'riemannr(10x + 60)', 'barnesg(x)', 'Li(x + 7)',
+                           'eta(x)', 'harmonic(x)', 'coulombc(x, 2)']:
+            rpn = parse_expression(expression)
+            load_necessary_functions([rpn])
+            exact_values = compute_rpn_array_scalar(build_program(rpn, environment=DEFAULT_ENVIRONMENT.with_exact_mpmath()), inputs)
+            values = compute_rpn_array_scalar(build_program(rpn), inputs)
+            np.testing.assert_array_equal(np.isnan(values), np.isnan(exact_values), expression)
+            valid = ~np.isnan(values)
+            np.testing.assert_array_less(np.abs(values - exact_values)[valid], 1e-12 * np.maximum(1, np.abs(exact_values[valid])), expression)
+
+    def test_fallback_to_mpmath(self):
+        # The machine floats fail or overflow on these points, where mpmath is finite
+        for rpn, x in [('x Li', 0.0), ('x superfac', -28.75), ('x barnesg', -26.5), ('x superfac', 20.0)]:
+            load_necessary_functions([rpn])
+            exact_value = build_program(rpn, environment=DEFAULT_ENVIRONMENT.with_exact_mpmath()).function(x)
+            self.assertTrue(math.isfinite(exact_value), rpn)
+            self.assertAlmostEqual(build_program(rpn).function(x) / exact_value, 1, delta=1e-12, msg=rpn)
+
+    def test_environment(self):
+        load_necessary_functions(['x siegelz x primezeta'])
+        self.assertIsNot(DEFAULT_ENVIRONMENT['siegelz'], FUNCTIONS['siegelz'])
+        self.assertIs(DEFAULT_ENVIRONMENT.with_exact_mpmath()['siegelz'], FUNCTIONS['siegelz'])
+        self.assertEqual(DEFAULT_ENVIRONMENT.get_kind('siegelz'), FunctionKind.MPMATH)
+        self.assertEqual(DEFAULT_ENVIRONMENT.with_functions({'siegelz': (1, math.sin)})['siegelz'], (1, math.sin))
+        # Both versions of the memoized functions keep their own results
+        self.assertIs(DEFAULT_ENVIRONMENT.memoized_functions['primezeta'], DEFAULT_ENVIRONMENT['primezeta'][1])
+        self.assertIs(DEFAULT_ENVIRONMENT.with_exact_mpmath().memoized_functions['primezeta'], FUNCTIONS['primezeta'][1])
+
+
+class TestVectorizedOtherFunctions(unittest.TestCase):
+
+    def test_same_values_as_scalar(self):
+        inputs = np.concatenate((np.linspace(-3, 3, 61), [0.5, -0.5, 0.25, 0.75]))
+        for expression in ['relu(x)', 'lrelu(x, 0.1)', 'sigmoid(x)', 'sign(x)', 'lerp(x, 0, 1, 2, 5)', 'heaviside(x)', 'rect(x)', 'tri(x)',
+                           'sawtooth(x)', 'sqwave(x)', 'triwave(x)', 'normpdf(x, 1, 2)', 'unormcdf(x)', 'tripdf(x, -1, 2, 0.5)', 'tricdf(x, -1, 2, 0.5)',
+                           'uniformpdf(x, -1, 1)', 'uniformcdf(x, -1, 1)', 'exppdf(x, 2)', 'expcdf(x, 2)', 'cauchycdf(x, 0, 2)', 'studentcdf(x, 3)',
+                           'betapdf(x, 2, 3)', 'chi2cdf(x, 2)', 'gammapdf(x, 2, 1.5)']:
+            rpn = parse_expression(expression)
+            load_necessary_functions([rpn])
+            program = build_program(rpn)
+            self.assertTrue(program.is_vectorizable, expression)
+            np.testing.assert_allclose(compute_rpn_array(program, inputs), compute_rpn_array_scalar(program, inputs), rtol=1e-13, atol=1e-15, err_msg=expression)
+
+    def test_sigmoid_overflow(self):
+        load_necessary_functions(['x sigmoid'])
+        program = build_program('x sigmoid')
+        inputs = np.array([-800.0, -1.0, 0.0, 800.0, -math.inf, math.inf])
+        np.testing.assert_array_equal(compute_rpn_array(program, inputs), compute_rpn_array_scalar(program, inputs))
+        self.assertTrue(np.isnan(compute_rpn_array(program, np.full(200, -800.0))).all())
+
+    def test_kinds(self):
+        load_necessary_functions(['x relu x normpdf'])
+        self.assertEqual(DEFAULT_ENVIRONMENT.get_kind('relu'), FunctionKind.VECTORIZED)
+        self.assertEqual(DEFAULT_ENVIRONMENT.get_kind('normpdf'), FunctionKind.VECTORIZED)
+        self.assertIsNone(DEFAULT_ENVIRONMENT.get_vectorized('if'))